@@ -0,0 +1,330 @@
+"""
+Cross-run analytics over the reports in a report directory.
+
+Every solution grade of every report becomes one row of a columnar store: NumPy arrays of integer codes
+for the run, model, problem set, grader, problem and prompt of the grade, and its score. Leaderboards,
+per-tag breakdowns, run-to-run deltas and bootstrap confidence intervals are computed from those arrays
+with grouped reductions instead of walking the nested reports. The store is cached in
+<report path>/analytics/, and only reports that are new or changed since the last call are parsed again.
+
+	python analytics.py --report-path reports --grader correctness --bootstrap 2000
+"""
+from base_types import *
+import argparse
+import datetime
+import os
+from typing import Tuple
+import serialization
+import sharding
+try:
+	import numpy as np
+except ImportError:
+	np = None
+
+# Categorical columns of the store, in the order of their code arrays
+DIMENSIONS = ('run', 'model', 'problem_set', 'grader', 'problem', 'prompt')
+
+RUN_TIMESTAMP_FORMAT = "%m-%d-%Y--%H-%M-%S"
+
+# Upper bound on resampled values held in memory at once while bootstrapping
+BOOTSTRAP_CHUNK_SIZE = 4_000_000
+
+def report_files(report_path: str) -> List[str]:
+	return sorted(file for file in os.listdir(report_path) if file.startswith('report-') and file.endswith('.json'))
+
+def run_time(run_id: str) -> datetime.datetime:
+	# Run ids start with the run's timestamp; shard runs append a suffix
+	try:
+		return datetime.datetime.strptime(run_id[:len('01-01-2000--00-00-00')], RUN_TIMESTAMP_FORMAT)
+	except ValueError:
+		return datetime.datetime.min
+
+def report_rows(report: Dict[str, Any], file_name: str) -> List[Tuple[str, str, str, str, str, str, float]]:
+	"""
+	Flattens a report into (run, model, problem set, grader, problem, prompt, score) rows.
+	"""
+	rows = []
+	for base_path, graders in report.get("Problem Sets", {}).items():
+		problem_set = sharding.problem_set_name(base_path)
+		for grader_identifier, solution_grades in graders.items():
+			for solution_grade in solution_grades:
+				model_identifier = solution_grade.get("model_identifier", "")
+				# Reports are named report-<model>-<run id>.json
+				prefix = "report-" + model_identifier + "-"
+				run_id = file_name[len(prefix):-len('.json')] if file_name.startswith(prefix) else file_name[:-len('.json')]
+				score = solution_grade.get("score")
+				rows.append((run_id, model_identifier, problem_set, grader_identifier, solution_grade.get("problem_identifier", ""),
+							 solution_grade.get("prompt_identifier", ""), float(score) if isinstance(score, (int, float)) else float('nan')))
+	return rows
+
+class ReportStore:
+	"""
+	Grades of many reports as parallel arrays. `codes[dimension][i]` indexes `labels[dimension]` for row i,
+	`scores[i]` is its score and `sources[i]` indexes `files`, the report file it was read from.
+	"""
+	def __init__(self):
+		self.labels = {dimension: [] for dimension in DIMENSIONS}
+		self.label_codes = {dimension: {} for dimension in DIMENSIONS}
+		self.codes = {dimension: np.zeros(0, dtype=np.int32) for dimension in DIMENSIONS}
+		self.scores = np.zeros(0, dtype=np.float64)
+		self.sources = np.zeros(0, dtype=np.int32)
+		# Report file name -> [modification time, size], to notice changed reports
+		self.files = {}
+
+	def __len__(self):
+		return len(self.scores)
+
+	def code(self, dimension: str, label: str) -> int:
+		codes = self.label_codes[dimension]
+		if label not in codes:
+			codes[label] = len(self.labels[dimension])
+			self.labels[dimension].append(label)
+		return codes[label]
+
+	def file_index(self, file_name: str) -> int:
+		return list(self.files).index(file_name)
+
+	def remove_report(self, file_name: str):
+		index = self.file_index(file_name)
+		keep = self.sources != index
+		for dimension in DIMENSIONS:
+			self.codes[dimension] = self.codes[dimension][keep]
+		self.scores = self.scores[keep]
+		# Later reports move down one place
+		self.sources = self.sources[keep]
+		self.sources[self.sources > index] -= 1
+		del self.files[file_name]
+
+	def add_report(self, file_name: str, signature: List[int], rows: List[tuple]):
+		self.files[file_name] = signature
+		index = len(self.files) - 1
+		if not rows:
+			return
+		columns = list(zip(*rows))
+		for position, dimension in enumerate(DIMENSIONS):
+			new_codes = np.fromiter((self.code(dimension, label) for label in columns[position]), dtype=np.int32, count=len(rows))
+			self.codes[dimension] = np.concatenate([self.codes[dimension], new_codes])
+		self.scores = np.concatenate([self.scores, np.asarray(columns[-1], dtype=np.float64)])
+		self.sources = np.concatenate([self.sources, np.full(len(rows), index, dtype=np.int32)])
+
+	def update(self, report_path: str) -> int:
+		"""
+		Parses the reports in `report_path` that are new or changed since the store last saw them and drops
+		the rows of reports that no longer exist. Returns the number of reports parsed.
+		"""
+		present = {}
+		for file_name in report_files(report_path):
+			stat = os.stat(os.path.join(report_path, file_name))
+			present[file_name] = [stat.st_mtime_ns, stat.st_size]
+		for file_name in [f for f in self.files if present.get(f) != self.files[f]]:
+			self.remove_report(file_name)
+		parsed = 0
+		for file_name, signature in present.items():
+			if file_name in self.files:
+				continue
+			self.add_report(file_name, signature, report_rows(serialization.get_report(os.path.join(report_path, file_name)), file_name))
+			parsed += 1
+		return parsed
+
+	@classmethod
+	def cache_paths(cls, report_path: str) -> Tuple[str, str]:
+		directory = os.path.join(report_path, "analytics")
+		return os.path.join(directory, "store.npz"), os.path.join(directory, "store.json")
+
+	@classmethod
+	def load(cls, report_path: str) -> 'ReportStore':
+		store = cls()
+		arrays_path, index_path = cls.cache_paths(report_path)
+		if not (os.path.exists(arrays_path) and os.path.exists(index_path)):
+			return store
+		with open(index_path) as f:
+			index = json.load(f)
+		if list(index.get("dimensions", [])) != list(DIMENSIONS):
+			return store
+		with np.load(arrays_path) as arrays:
+			store.codes = {dimension: arrays[dimension] for dimension in DIMENSIONS}
+			store.scores = arrays["scores"]
+			store.sources = arrays["sources"]
+		store.labels = index["labels"]
+		store.label_codes = {dimension: {label: code for code, label in enumerate(labels)} for dimension, labels in store.labels.items()}
+		store.files = index["files"]
+		return store
+
+	def save(self, report_path: str):
+		arrays_path, index_path = self.cache_paths(report_path)
+		os.makedirs(os.path.dirname(arrays_path), exist_ok=True)
+		temporary_path = os.path.join(os.path.dirname(arrays_path), '.store.tmp.npz')
+		np.savez(temporary_path, scores=self.scores, sources=self.sources, **self.codes)
+		os.replace(temporary_path, arrays_path)
+		serialization.write_json_atomically(index_path, {"dimensions": list(DIMENSIONS), "labels": self.labels, "files": self.files}, indent=None)
+
+	def mask(self, **selection) -> 'np.ndarray':
+		"""
+		Rows whose labels match, e.g. mask(grader='correctness'). Unknown labels match nothing.
+		"""
+		mask = ~np.isnan(self.scores)
+		for dimension, label in selection.items():
+			if label is None:
+				continue
+			code = self.label_codes[dimension].get(label, -1)
+			mask &= self.codes[dimension] == code
+		return mask
+
+	def latest_runs(self) -> 'np.ndarray':
+		"""
+		Rows of each model's most recent run.
+		"""
+		# Runs are ranked by timestamp, so runs without one rank first and ties are still broken
+		run_ranks = np.empty(len(self.labels['run']), dtype=np.int64)
+		run_ranks[sorted(range(len(self.labels['run'])), key=lambda run: (run_time(self.labels['run'][run]), self.labels['run'][run]))] = np.arange(len(self.labels['run']))
+		models = self.codes['model']
+		row_ranks = run_ranks[self.codes['run']]
+		latest = np.full(len(self.labels['model']), -1, dtype=np.int64)
+		np.maximum.at(latest, models, row_ranks)
+		return row_ranks == latest[models]
+
+def group_means(keys: 'np.ndarray', values: 'np.ndarray', group_count: int) -> Tuple['np.ndarray', 'np.ndarray']:
+	counts = np.bincount(keys, minlength=group_count)
+	sums = np.bincount(keys, weights=values, minlength=group_count)
+	with np.errstate(invalid='ignore', divide='ignore'):
+		return sums / counts, counts
+
+def bootstrap_intervals(keys: 'np.ndarray', values: 'np.ndarray', group_count: int, resamples: int = 1000,
+						confidence: float = 0.95, seed: int = 0) -> Tuple['np.ndarray', 'np.ndarray']:
+	"""
+	Percentile bootstrap intervals of each group's mean. Every group is resampled with replacement from its own
+	rows, all groups at once: rows are sorted by group, and each resample draws offsets within a group's range.
+	"""
+	low = np.full(group_count, np.nan)
+	high = np.full(group_count, np.nan)
+	if resamples <= 0 or len(values) == 0:
+		return low, high
+	order = np.argsort(keys, kind='stable')
+	sorted_keys, sorted_values = keys[order], values[order]
+	counts = np.bincount(sorted_keys, minlength=group_count)
+	starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+	present = np.flatnonzero(counts)
+	rng = np.random.default_rng(seed)
+	means = np.empty((resamples, len(present)))
+	chunk = max(1, BOOTSTRAP_CHUNK_SIZE // len(values))
+	for first in range(0, resamples, chunk):
+		size = min(chunk, resamples - first)
+		# One draw per row and resample: a uniform offset into the row's own group
+		offsets = np.floor(rng.random((size, len(values))) * counts[sorted_keys]).astype(np.int64)
+		samples = sorted_values[starts[sorted_keys] + offsets]
+		means[first:first + size] = np.add.reduceat(samples, starts[present], axis=1) / counts[present]
+	tail = (1 - confidence) / 2 * 100
+	low[present] = np.percentile(means, tail, axis=0)
+	high[present] = np.percentile(means, 100 - tail, axis=0)
+	return low, high
+
+def leaderboard(store: ReportStore, grader_identifier: Optional[str] = None, resamples: int = 1000) -> List[Dict[str, Any]]:
+	"""
+	Mean score of each model's latest run per grader, with bootstrap confidence intervals, best first.
+	"""
+	mask = store.mask(grader=grader_identifier) & store.latest_runs()
+	grader_count = len(store.labels['grader'])
+	group_count = len(store.labels['model']) * grader_count
+	keys = store.codes['model'][mask].astype(np.int64) * grader_count + store.codes['grader'][mask]
+	means, counts = group_means(keys, store.scores[mask], group_count)
+	low, high = bootstrap_intervals(keys, store.scores[mask], group_count, resamples)
+	rows = []
+	for key in np.flatnonzero(counts):
+		model, grader = divmod(int(key), grader_count)
+		rows.append({'model': store.labels['model'][model], 'grader': store.labels['grader'][grader], 'solutions': int(counts[key]),
+					 'mean': float(means[key]), 'ci_low': float(low[key]), 'ci_high': float(high[key])})
+	return sorted(rows, key=lambda row: (row['grader'], -row['mean']))
+
+def problem_tags(base_paths: List[str]) -> Dict[Tuple[str, str], List[str]]:
+	tags = {}
+	for base_path in base_paths:
+		for problem in serialization.get_problems(base_path):
+			tags[(sharding.problem_set_name(base_path), problem.identifier)] = problem.tags or []
+	return tags
+
+def tag_breakdown(store: ReportStore, tags: Dict[Tuple[str, str], List[str]], grader_identifier: Optional[str] = None) -> List[Dict[str, Any]]:
+	"""
+	Mean score of each model's latest run per problem tag. A grade counts towards every tag of its problem.
+	"""
+	mask = store.mask(grader=grader_identifier) & store.latest_runs()
+	tag_labels = sorted({tag for problem_tags in tags.values() for tag in problem_tags})
+	tag_codes = {tag: code for code, tag in enumerate(tag_labels)}
+	# Tag membership of every (problem set, problem) pair, as a boolean matrix indexed by their codes
+	membership = np.zeros((len(store.labels['problem_set']), len(store.labels['problem']), len(tag_labels)), dtype=bool)
+	for (problem_set, problem), problem_tags in tags.items():
+		if problem_set in store.label_codes['problem_set'] and problem in store.label_codes['problem']:
+			for tag in problem_tags:
+				membership[store.label_codes['problem_set'][problem_set], store.label_codes['problem'][problem], tag_codes[tag]] = True
+	rows_membership = membership[store.codes['problem_set'][mask], store.codes['problem'][mask]]
+	row_indices, tag_indices = np.nonzero(rows_membership)
+	keys = store.codes['model'][mask][row_indices].astype(np.int64) * max(1, len(tag_labels)) + tag_indices
+	means, counts = group_means(keys, store.scores[mask][row_indices], len(store.labels['model']) * max(1, len(tag_labels)))
+	rows = []
+	for key in np.flatnonzero(counts):
+		model, tag = divmod(int(key), max(1, len(tag_labels)))
+		rows.append({'model': store.labels['model'][model], 'tag': tag_labels[tag], 'solutions': int(counts[key]), 'mean': float(means[key])})
+	return sorted(rows, key=lambda row: (row['tag'], -row['mean']))
+
+def run_deltas(store: ReportStore, grader_identifier: Optional[str] = None) -> List[Dict[str, Any]]:
+	"""
+	Change of each model's mean score per grader from one run to the next.
+	"""
+	mask = store.mask(grader=grader_identifier)
+	run_count, grader_count = len(store.labels['run']), len(store.labels['grader'])
+	keys = (store.codes['model'][mask].astype(np.int64) * grader_count + store.codes['grader'][mask]) * run_count + store.codes['run'][mask]
+	means, counts = group_means(keys, store.scores[mask], len(store.labels['model']) * grader_count * run_count)
+	means, counts = means.reshape(-1, run_count), counts.reshape(-1, run_count)
+	run_order = sorted(range(run_count), key=lambda run: (run_time(store.labels['run'][run]), store.labels['run'][run]))
+	rows = []
+	for series in np.flatnonzero(counts.sum(axis=1)):
+		model, grader = divmod(int(series), grader_count)
+		runs = [run for run in run_order if counts[series, run]]
+		for previous, current in zip(runs, runs[1:]):
+			rows.append({'model': store.labels['model'][model], 'grader': store.labels['grader'][grader],
+						 'from_run': store.labels['run'][previous], 'to_run': store.labels['run'][current],
+						 'mean': float(means[series, current]), 'delta': float(means[series, current] - means[series, previous])})
+	return rows
+
+def print_table(title: str, rows: List[Dict[str, Any]]):
+	print(f"\n{title}")
+	if not rows:
+		print("\t(no grades)")
+		return
+	columns = list(rows[0])
+	cells = [[f"{row[c]:.3f}" if isinstance(row[c], float) else str(row[c]) for c in columns] for row in rows]
+	widths = [max(len(c), *(len(cell[i]) for cell in cells)) for i, c in enumerate(columns)]
+	print("\t" + "  ".join(c.ljust(w) for c, w in zip(columns, widths)))
+	for cell in cells:
+		print("\t" + "  ".join(value.ljust(w) for value, w in zip(cell, widths)))
+
+def main():
+	parser = argparse.ArgumentParser(description="Leaderboards, per-tag breakdowns and run-to-run deltas over all benchmark reports.")
+	parser.add_argument('--report-path', default='reports', help="Directory holding the reports. Default: ./reports")
+	parser.add_argument('--base_path', nargs='*', default=None, help="Problem sets to read tags from. Default: all problem sets in ./problem_sets")
+	parser.add_argument('--grader', default=None, help="Only analyze the grades of this grader.")
+	parser.add_argument('--bootstrap', type=int, default=1000, help="Number of bootstrap resamples for the confidence intervals; 0 disables them.")
+	parser.add_argument('--json', default=None, metavar='PATH', help="Also write the results to this JSON file.")
+	args = parser.parse_args()
+	if np is None:
+		parser.error("analytics needs NumPy; install it with `pip install numpy`.")
+	if args.base_path is None:
+		args.base_path = [os.path.join('problem_sets', d) for d in sorted(os.listdir('problem_sets')) if os.path.isdir(os.path.join('problem_sets', d))]
+
+	store = ReportStore.load(args.report_path)
+	parsed = store.update(args.report_path)
+	store.save(args.report_path)
+	print(f"{len(store)} grades from {len(store.files)} reports ({parsed} parsed, the rest cached)")
+
+	results = {
+		'leaderboard': leaderboard(store, args.grader, args.bootstrap),
+		'tags': tag_breakdown(store, problem_tags(args.base_path), args.grader),
+		'deltas': run_deltas(store, args.grader)
+	}
+	print_table("Leaderboard (latest run of each model)", results['leaderboard'])
+	print_table("Scores per tag (latest run of each model)", results['tags'])
+	print_table("Run-to-run deltas", results['deltas'])
+	if args.json:
+		serialization.write_json_atomically(args.json, results)
+
+if __name__ == "__main__":
+	main()
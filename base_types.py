@@ -1,6 +1,9 @@
 from typing import Dict, List, Union, Optional, Any
+import array
 import ast
+import hashlib
 import json
+import os
 import re
 
 # Define necessary types
@@ -64,29 +67,110 @@ class LLMSolution:
 			f")"
 		)
 
+# Issue text longer than this is stored once in a report's "Issue Text" table and referred to by its digest
+ISSUE_INLINE_LENGTH = 80
+# Longest issue text stored; longer text, such as a deep traceback, keeps its beginning and its end
+ISSUE_TEXT_LIMIT = 4000
+
+def cap_issue_text(text: str) -> str:
+	if len(text) <= ISSUE_TEXT_LIMIT:
+		return text
+	kept = ISSUE_TEXT_LIMIT // 2
+	return f"{text[:kept]}\n[... {len(text) - 2 * kept} characters omitted ...]\n{text[-kept:]}"
+
+def issue_text_digest(text: str) -> str:
+	return hashlib.sha256(text.encode('utf-8')).hexdigest()[:16]
+
 class Issue:
-		def __init__(self,
-					 issue_category: str,
-					 issue_description: str):
-			self.issue_category = issue_category
-			self.issue_description = issue_description
-		
-		@classmethod
-		def from_json(cls, data: Dict[str, Any]) -> 'Issue':
-			"""Create an Issue instance from JSON data."""
-			issue_category = data.get('issue_category', '')
-			issue_description = data.get('issue_description', '')
-			return cls(issue_category, issue_description)
-		
-		def to_json(self) -> Dict[str, Any]:
-			"""Convert the Issue instance to a JSON-serializable dictionary."""
-			return {
-				'issue_category': self.issue_category,
-				'issue_description': self.issue_description
-			}
-		
-		def __str__(self) -> str:
-			return f"Issue({self.issue_category}, {self.issue_description})"
+	"""
+	A problem found while grading a solution. `details` holds diagnostic text by name, such as the
+	traceback or the expected and actual results, so the description stays short.
+	"""
+	def __init__(self,
+				 issue_category: str,
+				 issue_description: str,
+				 test_index: Optional[int] = None,
+				 error_type: Optional[str] = None,
+				 details: Optional[Dict[str, str]] = None):
+		self.issue_category = issue_category
+		self.issue_description = issue_description
+		self.test_index = test_index
+		self.error_type = error_type
+		self.details = details or {}
+
+	@classmethod
+	def from_json(cls, data: Union[Dict[str, Any], str], texts: Optional[Dict[str, str]] = None) -> 'Issue':
+		"""
+		Create an Issue instance from JSON data, resolving interned details from the `texts` table.
+		"""
+		if isinstance(data, str):
+			# Grades written before issues were structured store only the text
+			return cls('other', data)
+		details = dict(data.get('details', {}))
+		for name, digest in data.get('refs', {}).items():
+			details[name] = (texts or {}).get(digest, f"<missing issue text {digest}>")
+		return cls(data.get('issue_category', ''), data.get('issue_description', ''), data.get('test_index'), data.get('error_type'), details)
+
+	def to_json(self, texts: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+		"""
+		Convert the Issue instance to a JSON-serializable dictionary. With a `texts` table, long details are
+		added to it and referred to by digest, so text shared by many issues is stored once.
+		"""
+		json_data = {
+			'issue_category': self.issue_category,
+			'issue_description': self.issue_description
+		}
+		if self.test_index is not None:
+			json_data['test_index'] = self.test_index
+		if self.error_type is not None:
+			json_data['error_type'] = self.error_type
+		details = {}
+		refs = {}
+		for name, text in self.details.items():
+			text = cap_issue_text(str(text))
+			if texts is not None and len(text) > ISSUE_INLINE_LENGTH:
+				refs[name] = issue_text_digest(text)
+				texts[refs[name]] = text
+			else:
+				details[name] = text
+		if details:
+			json_data['details'] = details
+		if refs:
+			json_data['refs'] = refs
+		return json_data
+
+	def __str__(self) -> str:
+		description = self.issue_description if self.test_index is None else f"{self.issue_description} (test case {self.test_index})"
+		return '\n\t'.join([description] + [f"{name}: {text}" for name, text in self.details.items()])
+
+def issues_to_json(issues: List[Issue], texts: Optional[Dict[str, str]] = None) -> List[Dict[str, Any]]:
+	"""
+	The JSON form of a list of issues. Issues that differ only in their test case, such as the same
+	exception raised on every case, are stored once with the indices of all their test cases in `test_indices`.
+	"""
+	records = []
+	groups = {}
+	for issue in issues:
+		record = issue.to_json(texts)
+		test_index = record.pop('test_index', None)
+		if test_index is None:
+			records.append(record)
+			continue
+		key = json.dumps(record, sort_keys=True)
+		if key not in groups:
+			groups[key] = dict(record, test_indices=[])
+			records.append(groups[key])
+		groups[key]['test_indices'].append(test_index)
+	return records
+
+def issues_from_json(records: List[Union[Dict[str, Any], str]], texts: Optional[Dict[str, str]] = None) -> List[Issue]:
+	issues = []
+	for record in records:
+		if isinstance(record, dict) and 'test_indices' in record:
+			issues += [Issue.from_json(dict(record, test_index=test_index), texts) for test_index in record['test_indices']]
+		else:
+			issues.append(Issue.from_json(record, texts))
+	return issues
 
 class SolutionGrade:
 	"""
@@ -98,35 +182,44 @@ class SolutionGrade:
 				 model_identifier: str,
 				 score: float,
 				 sub_criteria_scores: Optional[dict] = None,
-				 issues: Optional[List[str]] = None):
+				 issues: Optional[List[Union['Issue', str]]] = None,
+				 profile: Optional[dict] = None):
 		self.problem_identifier = problem_identifier
 		self.prompt_identifier = prompt_identifier
 		self.score = score
 		self.model_identifier = model_identifier
 		self.sub_criteria_scores = sub_criteria_scores
-		self.issues = issues
+		# Graders may still report plain strings, which become uncategorized issues
+		self.issues = [issue if isinstance(issue, Issue) else Issue('other', issue) for issue in issues] if issues is not None else None
+		self.profile = profile
 
 	@classmethod
-	def from_json(cls, data: Dict[str, Any]) -> 'SolutionGrade':
-		"""Create a SolutionGrade instance from JSON data."""
+	def from_json(cls, data: Dict[str, Any], texts: Optional[Dict[str, str]] = None) -> 'SolutionGrade':
+		"""Create a SolutionGrade instance from JSON data, with interned issue details resolved from `texts`."""
 		problem_identifier = data.get('problem_identifier', '')
 		prompt_identifier = data.get('prompt_identifier', '')
 		model_identifier = data.get('model_identifier', '')
 		score = data.get('score', 0)
 		sub_criteria_scores = data.get('sub_criteria_scores', None)
 		issues = data.get('issues', [])
-		return cls(problem_identifier, prompt_identifier, model_identifier, score, sub_criteria_scores, issues)
+		issues = issues_from_json(issues, texts) if issues is not None else None
+		profile = data.get('profile', None)
+		return cls(problem_identifier, prompt_identifier, model_identifier, score, sub_criteria_scores, issues, profile)
 	
-	def to_json(self) -> Dict[str, Any]:
-		"""Convert the SolutionGrade instance to a JSON-serializable dictionary."""
-		return {
+	def to_json(self, texts: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+		"""Convert the SolutionGrade instance to a JSON-serializable dictionary, interning long issue details into `texts` if given."""
+		json_data = {
 			'problem_identifier': self.problem_identifier,
 			'prompt_identifier': self.prompt_identifier,
 			'model_identifier': self.model_identifier,
 			'score': self.score,
 			'sub_criteria_scores': self.sub_criteria_scores,
-			'issues': self.issues
+			'issues': issues_to_json(self.issues, texts) if self.issues is not None else None
 		}
+		# Profiles are opt-in, so grades without one keep their original format
+		if self.profile is not None:
+			json_data['profile'] = self.profile
+		return json_data
 	
 	def __str__(self) -> str:
 		sub_criteria_scores_str = (
@@ -212,6 +305,44 @@ class GradingOutput:
 			f"  Solutions Count: {len(self.solution_grades)}"
 		)
 			
+# Number of test cases read from a test suite file and dispatched to executors at a time
+TEST_SUITE_CHUNK_SIZE = 64
+
+def read_test_suite_file(path: str):
+	"""
+	Yields the TestCase JSON objects of a JSONL test suite file one line at a time.
+	"""
+	with open(path) as f:
+		for line in f:
+			if line.strip():
+				yield json.loads(line)
+
+def scan_test_suite_file(path: str):
+	"""
+	Reads a JSONL test suite file once and returns the SHA-256 of its contents and the byte offsets of its test cases.
+	"""
+	digest = hashlib.sha256()
+	offsets = array.array('q')
+	offset = 0
+	with open(path, 'rb') as f:
+		for line in f:
+			digest.update(line)
+			if line.strip():
+				offsets.append(offset)
+			offset += len(line)
+	return digest.hexdigest(), offsets
+
+def is_sidecar(value) -> bool:
+	# An expected output stored in a .npy file of the data directory, e.g. {"npy": "problem/case-0-output-0.npy"}
+	return isinstance(value, dict) and set(value) == {'npy'}
+
+def file_digest(path: str) -> str:
+	digest = hashlib.sha256()
+	with open(path, 'rb') as f:
+		for block in iter(lambda: f.read(1 << 20), b''):
+			digest.update(block)
+	return digest.hexdigest()
+
 class TestCase:
 	def __init__(self, data: Dict[str, Any]):
 		self.parameters = data.get('input', {})
@@ -407,13 +538,28 @@ class ProblemDefinition:
 				 function_prototype: 'FunctionPrototype' = None,
 				 correctness_test_suite: Optional[List['TestCase']] = None,
 				 optimal_solution: Optional[str] = None,
-				 tags: Optional[List[str]] = None):
+				 tags: Optional[List[str]] = None,
+				 test_tiers: Optional[Dict[str, Dict[str, Any]]] = None,
+				 comparison: Optional[Dict[str, Any]] = None,
+				 test_suite_file: Optional[str] = None):
 		self.identifier = identifier
 		self.prompts = prompts
 		self.function_prototype = function_prototype
 		self.correctness_test_suite = correctness_test_suite
 		self.optimal_solution = optimal_solution
 		self.tags = tags
+		# Named subsets of the correctness test suite, e.g. {'smoke': {'cases': [0, 4], 'suite_hash': ...}}
+		self.test_tiers = test_tiers or {}
+		# How results are compared with expected outputs, e.g. {'comparator': 'allclose', 'rtol': 1e-6}; see comparators.py
+		self.comparison = comparison
+		# JSONL file of the correctness test suite, relative to the data directory, for suites too large to load at once
+		self.test_suite_file = test_suite_file
+		# Directory of the problem set's .npy sidecar files and test suite files, set when the problem is loaded from a problem set
+		self.data_directory = None
+		# Digest and test case offsets of the test suite file, from one pass over it
+		self._test_suite_digest = None
+		self._test_case_offsets = None
+		self._sidecar_digest = None
 		self.additional_fields = {}  # New attribute to store additional fields
 	
 	@classmethod
@@ -425,7 +571,7 @@ class ProblemDefinition:
 		# Known fields from the JSON
 		known_fields = [
 			'identifier', 'prompts', 'function_prototype',
-			'correctness_test_suite', 'optimal_solution', 'tags'
+			'correctness_test_suite', 'optimal_solution', 'tags', 'test_tiers', 'comparison', 'correctness_test_suite_file'
 		]
 		
 		# Populate additional fields
@@ -437,7 +583,10 @@ class ProblemDefinition:
 			function_prototype=function_prototype,
 			correctness_test_suite=correctness_test_suite,
 			optimal_solution=data.get('optimal_solution', None),
-			tags=data.get('tags', None)
+			tags=data.get('tags', None),
+			test_tiers=data.get('test_tiers', None),
+			comparison=data.get('comparison', None),
+			test_suite_file=data.get('correctness_test_suite_file', None)
 		)
 		instance.additional_fields = additional_fields  # Assign additional fields to the instance
 		return instance
@@ -451,9 +600,109 @@ class ProblemDefinition:
 			'optimal_solution': self.optimal_solution,
 			'tags': self.tags
 		}
+		if self.test_tiers:
+			json_data['test_tiers'] = self.test_tiers
+		if self.comparison:
+			json_data['comparison'] = self.comparison
+		if self.test_suite_file:
+			json_data['correctness_test_suite_file'] = self.test_suite_file
 		# Merge with additional fields
 		json_data.update(self.additional_fields)
 		return json_data
+
+	def test_suite_path(self) -> Optional[str]:
+		if not self.test_suite_file:
+			return None
+		if self.data_directory is None:
+			raise RuntimeError(f"Problem {self.identifier} reads its test suite from {self.test_suite_file}, but wasn't loaded from a problem set.")
+		return os.path.join(self.data_directory, self.test_suite_file)
+
+	def iter_test_cases(self):
+		"""
+		Yields the (index, TestCase) pairs of the correctness test suite. Suites in a file are read as they are consumed.
+		"""
+		path = self.test_suite_path()
+		if path is None:
+			yield from enumerate(self.correctness_test_suite or [])
+		else:
+			yield from enumerate(TestCase.from_json(test_case) for test_case in read_test_suite_file(path))
+
+	def iter_selected_test_cases(self, indices):
+		# Cases of a suite file are read directly at their offsets instead of streaming the file up to them
+		if not self.test_suite_file:
+			yield from ((index, self.correctness_test_suite[index]) for index in sorted(indices) if 0 <= index < len(self.correctness_test_suite))
+			return
+		offsets = self.test_case_offsets()
+		with open(self.test_suite_path(), 'rb') as f:
+			for index in sorted(indices):
+				if 0 <= index < len(offsets):
+					f.seek(offsets[index])
+					yield index, TestCase.from_json(json.loads(f.readline()))
+
+	def iter_test_case_chunks(self, chunk_size: int = TEST_SUITE_CHUNK_SIZE, indices: Optional[set] = None):
+		"""
+		Yields the (index, TestCase) pairs of the correctness test suite in lists of at most `chunk_size`,
+		only those whose index is in `indices` if given. At most one chunk of a suite file is in memory at a time.
+		"""
+		chunk = []
+		for index, test_case in self.iter_test_cases() if indices is None else self.iter_selected_test_cases(indices):
+			chunk.append((index, test_case))
+			if len(chunk) == chunk_size:
+				yield chunk
+				chunk = []
+		if chunk:
+			yield chunk
+
+	def test_case_count(self) -> int:
+		if not self.test_suite_file:
+			return len(self.correctness_test_suite or [])
+		return len(self.test_case_offsets())
+
+	def test_case(self, index: int) -> TestCase:
+		if not self.test_suite_file:
+			return self.correctness_test_suite[index]
+		for _, test_case in self.iter_selected_test_cases([index]):
+			return test_case
+		raise IndexError(f"Problem {self.identifier} has no test case {index}")
+
+	def scan_test_suite(self):
+		if self._test_case_offsets is None:
+			self._test_suite_digest, self._test_case_offsets = scan_test_suite_file(self.test_suite_path())
+
+	def test_case_offsets(self) -> 'array.array':
+		"""
+		Byte offsets of the test cases in the test suite file, read together with its digest.
+		"""
+		self.scan_test_suite()
+		return self._test_case_offsets
+
+	def test_suite_digest(self) -> Optional[str]:
+		"""
+		SHA-256 of the test suite file's contents, or None if the suite is stored inline.
+		"""
+		if not self.test_suite_file:
+			return None
+		self.scan_test_suite()
+		return self._test_suite_digest
+
+	def sidecar_digest(self) -> Optional[str]:
+		"""
+		SHA-256 over the paths and contents of the .npy sidecar files that expected outputs reference, or None if there are none.
+		"""
+		if self._sidecar_digest is None:
+			digest = hashlib.sha256()
+			referenced = False
+			for _, test_case in self.iter_test_cases():
+				for expected in test_case.expected_output:
+					if not is_sidecar(expected):
+						continue
+					referenced = True
+					path = os.path.join(self.data_directory, expected['npy']) if self.data_directory is not None else None
+					# A missing file is hashed as such; validation reports it
+					contents = file_digest(path) if path is not None and os.path.isfile(path) else 'missing'
+					digest.update(json.dumps([expected['npy'], contents]).encode('utf-8'))
+			self._sidecar_digest = digest.hexdigest() if referenced else ''
+		return self._sidecar_digest or None
 	
 	def __str__(self) -> str:
 		prompts_str = '\n    '.join(str(prompt) for prompt in self.prompts)
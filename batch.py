@@ -0,0 +1,109 @@
+"""
+Offline generation through batch files: every generation request of a run is written to one JSONL file in
+the OpenAI batch API format, and the file of responses is imported as solutions once the batch job is done.
+
+	python benchmark.py --generate --model gpt-4 --export-batch requests.jsonl
+	python benchmark.py --import-batch results.jsonl --grade --model gpt-4 --grader correctness
+
+Each request's custom ID is '<problem set>/<model>/<problem>/<prompt>', which is stable across exports and
+names the solution its response becomes. Problem sets are named by their directory, as in merged reports.
+"""
+from base_types import *
+import os
+from typing import Tuple
+import querier
+import serialization
+import sharding
+
+def custom_id(base_path: str, model_identifier: str, problem_identifier: str, prompt_identifier: str) -> str:
+	return '/'.join([sharding.problem_set_name(base_path), model_identifier, problem_identifier, prompt_identifier])
+
+def parse_custom_id(text: str) -> Tuple[str, str, str, str]:
+	# None of the parts can contain '/', since each also names a directory or file
+	parts = text.split('/')
+	if len(parts) != 4:
+		raise ValueError(f"Invalid custom ID '{text}': expected <problem set>/<model>/<problem>/<prompt>.")
+	return tuple(parts)
+
+def export_batch(path: str, problem_sets: Dict[str, List[ProblemDefinition]], model_identifiers: List[str], shard=None, selection=None) -> int:
+	"""
+	Writes one request per (model, problem, prompt) of the problem sets to the JSONL file at `path` and
+	returns the number of requests.
+	"""
+	requests = 0
+	temporary_path = os.path.join(os.path.dirname(path), '.' + os.path.basename(path) + '.tmp')
+	with open(temporary_path, 'w') as f:
+		for base_path, problem_definitions in problem_sets.items():
+			for model_identifier in model_identifiers:
+				model = querier.OpenAIModelQuerier(model_identifier)
+				for problem_definition in problem_definitions:
+					for problem_input in problem_definition.get_llm_problem_inputs():
+						if shard is not None and not shard.contains(base_path, problem_input.problem_id, model_identifier, problem_input.prompt_id):
+							continue
+						if selection is not None and not selection.selects_prompt(problem_input.prompt_id):
+							continue
+						url, body = model.request_body(model.render_prompt(problem_input))
+						f.write(json.dumps({
+							'custom_id': custom_id(base_path, model_identifier, problem_input.problem_id, problem_input.prompt_id),
+							'method': 'POST',
+							'url': url,
+							'body': body
+						}) + '\n')
+						requests += 1
+	os.replace(temporary_path, path)
+	return requests
+
+def response_text(body: Dict[str, Any]) -> str:
+	choice = body['choices'][0]
+	if 'message' in choice:
+		return choice['message'].get('content') or ''
+	return choice.get('text') or ''
+
+def import_batch(path: str, problem_sets: Dict[str, List[ProblemDefinition]]) -> List[LLMSolution]:
+	"""
+	Reads the JSONL batch results at `path` line by line and saves each successful response as a solution
+	in its problem set. Responses for problem sets, problems or prompts that aren't loaded are skipped.
+	"""
+	inputs = {}
+	for base_path, problem_definitions in problem_sets.items():
+		for problem_definition in problem_definitions:
+			for problem_input in problem_definition.get_llm_problem_inputs():
+				inputs[(sharding.problem_set_name(base_path), problem_input.problem_id, problem_input.prompt_id)] = (base_path, problem_input)
+
+	solutions = []
+	models = {}
+	skipped = 0
+	with open(path) as f:
+		for line_number, line in enumerate(f, start=1):
+			if not line.strip():
+				continue
+			try:
+				result = json.loads(line)
+				problem_set, model_identifier, problem_identifier, prompt_identifier = parse_custom_id(result.get('custom_id', ''))
+			except ValueError as e:
+				print(f"Skipping line {line_number} of {path}: {e}")
+				skipped += 1
+				continue
+			response = result.get('response') or {}
+			if result.get('error') or response.get('status_code') != 200:
+				print(f"Skipping {result['custom_id']}: the request failed: {result.get('error') or response.get('body')}")
+				skipped += 1
+				continue
+			if (problem_set, problem_identifier, prompt_identifier) not in inputs:
+				print(f"Skipping {result['custom_id']}: no such problem and prompt in the loaded problem sets")
+				skipped += 1
+				continue
+			base_path, problem_input = inputs[(problem_set, problem_identifier, prompt_identifier)]
+			if model_identifier not in models:
+				models[model_identifier] = querier.OpenAIModelQuerier(model_identifier)
+			model = models[model_identifier]
+			body = response.get('body') or {}
+			text = response_text(body)
+			usage = body.get('usage')
+			usage = {'prompt_tokens': usage['prompt_tokens'], 'completion_tokens': usage['completion_tokens']} if usage else None
+			feedback = model.generation_feedback(model.render_prompt(problem_input), text, None, usage=usage)
+			solution = LLMSolution(problem_identifier, model_identifier, prompt_identifier, model.extract_code(text), feedback)
+			serialization.save_solution(base_path, solution)
+			solutions.append(solution)
+	print(f"Imported {len(solutions)} solution(s) from {path}" + (f"; skipped {skipped} line(s)" if skipped else ""))
+	return solutions
@@ -1,4 +1,5 @@
 import argparse
+import atexit
 from base_types import *
 import json
 import grader
@@ -8,29 +9,67 @@ import sys
 import os
 import validation
 import datetime
+import time
+from grading_manifest import GradingManifest, entry_key
+import case_history
+import execution
+import remote_execution
+import service
+import watch
+import batch
+import planner
+import telemetry
+from sharding import Shard
+from problem_index import ProblemSelection
+from run_manifest import RunManifest
 
-def load_problems(base_path):
-	return serialization.get_problems(base_path)
+def load_problems(base_path, selection=None):
+	return serialization.get_problems(base_path, selection)
 
-def validate_problems(base_path):
+def validate_problems(base_path, selection=None):
 	validation_results = {}
 	
-	problemsJSON = serialization.get_problems_json(base_path)
+	file_names = None if selection is None else serialization.get_problem_index(base_path).select(selection)
+	problemsJSON = serialization.get_problems_json(base_path, file_names)
 	
 	for fileName, json in problemsJSON.items():
-		validation_results[fileName] = validation.validate_problem_json(json)
+		with telemetry.span('validate', problem_set=base_path, problem=fileName):
+			validation_results[fileName] = validation.validate_problem_json(json, serialization.get_data_directory(base_path))
 		print(f'{fileName}: {validation_results[fileName]}')
 	return validation_results
 
-def generate_solutions(base_path, problem_definitions, models):
+def generate_solutions(base_path, problem_definitions, models, shard=None, run_manifest=None, report_path=None, selection=None):
 	solutions = []	
+	timings = serialization.get_work_timings(base_path)
 	for model in models:
 		for problem_definition in problem_definitions:
 			inputs = problem_definition.get_llm_problem_inputs()
 			for problem_input in inputs:
-				solution = model.generate_solution(problem_input)
+				if shard is not None and not shard.contains(base_path, problem_input.problem_id, model.model_identifier, problem_input.prompt_id):
+					continue
+				if selection is not None and not selection.selects_prompt(problem_input.prompt_id):
+					continue
+				if run_manifest is not None and run_manifest.is_generated(base_path, model.model_identifier, problem_input.problem_id, problem_input.prompt_id):
+					continue
+				start_time = time.perf_counter()
+				with telemetry.span('generate', problem=problem_input.problem_id, prompt=problem_input.prompt_id, model=model.model_identifier):
+					solution = model.generate_solution(problem_input)
+				elapsed_time = time.perf_counter() - start_time
+				telemetry.observe('querier_seconds', elapsed_time, model=model.model_identifier)
 				solutions.append(solution)
 				serialization.save_solution(base_path, solution)
+				metrics = (solution.feedback or {}).get('generation') or {}
+				prompt_tokens = metrics.get('prompt_tokens', planner.estimate_tokens(querier.AIModelQuerier.construct_textual_prompt(problem_input)))
+				completion_tokens = metrics.get('completion_tokens', planner.estimate_tokens(solution.solution_code))
+				timings.record_generation(model.model_identifier, problem_input.problem_id, problem_input.prompt_id, elapsed_time, prompt_tokens, completion_tokens)
+				telemetry.count('prompt_tokens', prompt_tokens, model=model.model_identifier)
+				telemetry.count('completion_tokens', completion_tokens, model=model.model_identifier)
+				if metrics.get('retries'):
+					telemetry.count('querier_retries', metrics['retries'], model=model.model_identifier)
+				serialization.save_work_timings(base_path, timings)
+				if run_manifest is not None:
+					run_manifest.mark_generated(base_path, solution)
+					serialization.save_run_manifest(report_path, run_manifest)
 	return solutions
 	
 def load_solutions(base_path, models):
@@ -39,21 +78,162 @@ def load_solutions(base_path, models):
 		solutions += serialization.load_solutions(base_path, model.model_identifier)
 	return solutions
 
-def grade_solutions(base_path, problem_definitions, models, graders, current_report_paths):
+def split_unchanged_solutions(base_path, problem_definitions, model, grader, solutions, manifest):
+	# Returns the solutions that need grading and the stored grades that can be carried over
+	problems_by_identifier = {p.identifier: p for p in problem_definitions}
+	version = grader.version_fingerprint()
+	stale_solutions = []
+	carried_grades = []
+	for solution in solutions:
+		problem = problems_by_identifier.get(solution.problem_identifier)
+		if problem is None:
+			continue
+		stored_grade = None
+		if manifest.is_current(problem, solution, version, grader.test_tier()):
+			stored_grade = serialization.get_grade(base_path, model.model_identifier, grader.identifier, solution.problem_identifier, solution.prompt_identifier)
+		if stored_grade is None:
+			stale_solutions.append(solution)
+		else:
+			carried_grades.append(stored_grade)
+	return stale_solutions, carried_grades
+
+def solutions_by_problem(solutions):
+	groups = {}
+	for solution in solutions:
+		groups.setdefault(solution.problem_identifier, []).append(solution)
+	return list(groups.values())
+
+def grade_solutions(base_path, problem_definitions, models, graders, current_report_paths, incremental=False, shard=None, run_manifest=None, report_path=None, selection=None):
 	gradingOutputs = []
+	problems_by_identifier = {p.identifier: p for p in problem_definitions}
+	history = serialization.get_case_history(base_path)
+	timings = serialization.get_work_timings(base_path)
 	for grader in graders:
 		if not grader.can_grade(problem_definitions):
 			continue
+		grader.case_history = history
 		for model in models:
 			print(f'Grading solutions for {base_path} from model {model.model_identifier} with grader {grader.identifier}')
-			solutions = serialization.get_solutions(base_path, model.model_identifier)
-			grades = grader.grade(problem_definitions, solutions)
+			def included(problem_identifier, prompt_identifier):
+				if shard is not None and not shard.contains(base_path, problem_identifier, model.model_identifier, prompt_identifier):
+					return False
+				return selection is None or (problem_identifier in problems_by_identifier and selection.selects_prompt(prompt_identifier))
+			solutions = serialization.get_solutions(base_path, model.model_identifier, included)
 			current_report_path = current_report_paths[model]
-			serialization.save_grades(base_path, grades, current_report_path)
-			gradingOutputs.append(grades)
+			serialization.add_generation_to_report(base_path, solutions, current_report_path)
+			old_manifest = serialization.get_grading_manifest(base_path, model.model_identifier, grader.identifier)
+
+			# Solutions graded before a resumed run was interrupted already have their grades in the report
+			resumed_solutions = []
+			if run_manifest is not None:
+				resumed_solutions = [s for s in solutions if run_manifest.is_graded(base_path, grader.identifier, s)]
+				solutions = [s for s in solutions if not run_manifest.is_graded(base_path, grader.identifier, s)]
+				if resumed_solutions:
+					print(f'Skipping {len(resumed_solutions)} solution(s) graded before the run was interrupted')
+			resumed_grades = [serialization.get_grade(base_path, model.model_identifier, grader.identifier, s.problem_identifier, s.prompt_identifier) for s in resumed_solutions]
+			resumed_grades = [g for g in resumed_grades if g is not None]
+
+			carried_grades = []
+			if incremental:
+				solutions, carried_grades = split_unchanged_solutions(base_path, problem_definitions, model, grader, solutions, old_manifest)
+				print(f'Re-grading {len(solutions)} changed solution(s); carrying over {len(carried_grades)} unchanged grade(s)')
+
+			carried = GradingOutput(carried_grades, grader.identifier)
+			with telemetry.span('report', problem_set=base_path, model=model.model_identifier, grader=grader.identifier):
+				serialization.add_grades_to_report(base_path, carried, current_report_path)
+
+			# Only solutions that produced a grade are recorded, so ungraded ones are retried next time.
+			# Entries of other shards or outside the selection are left for the runs that own them.
+			manifest = GradingManifest()
+			kept_keys = {entry_key(g.problem_identifier, g.prompt_identifier) for g in carried_grades + resumed_grades}
+			def owned(key):
+				return included(*key.split('/', 1))
+			manifest.entries = {k: v for k, v in old_manifest.entries.items() if k in kept_keys or not owned(k)}
+
+			def grade_problem(problem_solutions):
+				start_time = time.perf_counter()
+				with telemetry.span('grade', problem=problem_solutions[0].problem_identifier, model=model.model_identifier, grader=grader.identifier):
+					grades = grader.grade(problem_definitions, problem_solutions)
+				return problem_solutions, grades, time.perf_counter() - start_time
+
+			def expected_seconds(problem_solutions):
+				per_solution = timings.grading_estimate(grader.identifier, problem_solutions[0].problem_identifier)
+				return (per_solution or 0.0) * len(problem_solutions)
+
+			# Grade whole problems and checkpoint after each, so an interrupted run loses at most the problems in progress.
+			# The longest problems go first, and with several executor workers, several problems are graded at once.
+			new_grades = []
+			for problem_solutions, grades, elapsed_time in planner.dispatch_longest_first(grade_problem, solutions_by_problem(solutions), expected_seconds, execution.dispatch_concurrency()):
+				problem_identifier = problem_solutions[0].problem_identifier
+				timings.record_grading(grader.identifier, problem_identifier, elapsed_time, len(problem_solutions))
+				with telemetry.span('report', problem=problem_identifier, model=model.model_identifier, grader=grader.identifier):
+					serialization.save_grades(base_path, grades, current_report_path)
+				graded_keys = {entry_key(g.problem_identifier, g.prompt_identifier) for g in grades.solution_grades}
+				for solution in problem_solutions:
+					if entry_key(solution.problem_identifier, solution.prompt_identifier) in graded_keys:
+						manifest.record(problems_by_identifier[solution.problem_identifier], solution, grader.version_fingerprint(), grader.test_tier())
+				serialization.save_grading_manifest(base_path, model.model_identifier, grader.identifier, manifest)
+				if run_manifest is not None:
+					for solution in problem_solutions:
+						run_manifest.mark_graded(base_path, grader.identifier, solution)
+					serialization.save_run_manifest(report_path, run_manifest)
+				new_grades += grades.solution_grades
+			serialization.save_grading_manifest(base_path, model.model_identifier, grader.identifier, manifest)
+			serialization.save_work_timings(base_path, timings)
+
+			gradingOutputs.append(GradingOutput(resumed_grades + new_grades + carried_grades, grader.identifier))
+		grader.case_history = None
+	serialization.save_case_history(base_path, history)
 	print(gradingOutputs)
 	return gradingOutputs
 	
+def plan_work(base_path, problem_definitions, models, graders, generate, grade, incremental=False, shard=None, selection=None):
+	# The work items a --generate/--grade run with these arguments would process, with their estimates
+	timings = serialization.get_work_timings(base_path)
+	history = serialization.get_case_history(base_path)
+	problems_by_identifier = {p.identifier: p for p in problem_definitions}
+	items = []
+	generated = {model: set() for model in models}
+	if generate:
+		solution_lengths = {}
+		solutions_directory = os.path.join(base_path, "solutions")
+		for model_identifier in sorted(os.listdir(solutions_directory)) if os.path.isdir(solutions_directory) else []:
+			for solution in serialization.get_solutions(base_path, model_identifier, lambda problem_identifier, prompt_identifier: problem_identifier in problems_by_identifier):
+				solution_lengths.setdefault(solution.problem_identifier, []).append(len(solution.solution_code or ''))
+		for model in models:
+			for problem_definition in problem_definitions:
+				for problem_input in problem_definition.get_llm_problem_inputs():
+					if shard is not None and not shard.contains(base_path, problem_input.problem_id, model.model_identifier, problem_input.prompt_id):
+						continue
+					if selection is not None and not selection.selects_prompt(problem_input.prompt_id):
+						continue
+					generated[model].add((problem_input.problem_id, problem_input.prompt_id))
+					items.append(planner.generation_item(base_path, model.model_identifier, problem_input,
+						querier.AIModelQuerier.construct_textual_prompt(problem_input), timings, solution_lengths))
+	if grade:
+		for model in models:
+			def included(problem_identifier, prompt_identifier):
+				if shard is not None and not shard.contains(base_path, problem_identifier, model.model_identifier, prompt_identifier):
+					return False
+				return problem_identifier in problems_by_identifier and (selection is None or selection.selects_prompt(prompt_identifier))
+			existing_solutions = serialization.get_solutions(base_path, model.model_identifier, included)
+			for grader in graders:
+				if not grader.can_grade(problem_definitions):
+					continue
+				solutions = existing_solutions
+				if incremental:
+					manifest = serialization.get_grading_manifest(base_path, model.model_identifier, grader.identifier)
+					solutions, _ = split_unchanged_solutions(base_path, problem_definitions, model, grader, solutions, manifest)
+				# Solutions generated earlier in the run replace existing ones, which need grading either way
+				keys = {(s.problem_identifier, s.prompt_identifier) for s in solutions} | generated[model]
+				counts = {}
+				for problem_identifier, _ in keys:
+					counts[problem_identifier] = counts.get(problem_identifier, 0) + 1
+				for problem_identifier, count in sorted(counts.items()):
+					items.append(planner.grading_item(base_path, model.model_identifier, grader.identifier, problems_by_identifier[problem_identifier],
+						count, timings, history.problems.get(problem_identifier)))
+	return items
+
 def load_grades(base_path, models, graders):
 	gradingOutputs = []
 	for grader in graders:
@@ -62,6 +242,38 @@ def load_grades(base_path, models, graders):
 
 	return gradingOutputs
 	
+def report_model_identifier(report):
+	for graders in report.get("Problem Sets", {}).values():
+		for solution_grades in graders.values():
+			for solution_grade in solution_grades:
+				return solution_grade.get("model_identifier")
+	return None
+
+def merge_shard_reports(report_paths, report_path, timestamp):
+	# Shard reports are per model like any other report; merge the ones of each model separately
+	reports_by_model = {}
+	for path in report_paths:
+		report = serialization.get_report(path)
+		model_identifier = report_model_identifier(report)
+		if model_identifier is None:
+			print(f'Skipping {path}: it contains no grades')
+			continue
+		reports_by_model.setdefault(model_identifier, []).append(report)
+
+	merged_report_paths = []
+	for model_identifier, reports in reports_by_model.items():
+		merged_report_path = os.path.join(report_path, "report-" + model_identifier + "-" + timestamp + ".json")
+		serialization.save_report(serialization.merge_reports(reports), merged_report_path)
+		print(f'Merged {len(reports)} report(s) for model {model_identifier} into {merged_report_path}')
+		merged_report_paths.append(merged_report_path)
+	return merged_report_paths
+
+def shard_argument(text):
+	try:
+		return Shard.parse(text)
+	except ValueError as e:
+		raise argparse.ArgumentTypeError(str(e))
+
 def print_header(text, symbol='#'):
 	# Convert text to uppercase
 	text = text.upper()
@@ -83,44 +295,138 @@ def main():
 	parser.add_argument('--validate', action='store_true', help="Validate the problem definition JSON.")
 	parser.add_argument('--generate', action='store_true', help="Generate solutions for problems.")
 	parser.add_argument('--grade', action='store_true', help="Grade the generated solutions.")
-	parser.add_argument('--model', required='--generate' in sys.argv or '--grade' in sys.argv, nargs='+', help=f"The model(s) to use for generating solutions The following model names can be queried through the OpenAI API: {querier.OpenAIModelQuerier.supported_model_names()}")
-	parser.add_argument('--grader', required='--grade' in sys.argv, nargs='+', help="The grader(s) to use for grading solutions.")
+	parser.add_argument('--model', required='--generate' in sys.argv or '--grade' in sys.argv or '--watch' in sys.argv, nargs='+', help=f"The model(s) to use for generating solutions The following model names can be queried through the OpenAI API: {querier.OpenAIModelQuerier.supported_model_names()}")
+	parser.add_argument('--grader', required='--grade' in sys.argv or '--watch' in sys.argv, nargs='+', help="The grader(s) to use for grading solutions.")
 	parser.add_argument('--force-human', action='store_true', help="Always use the interactive human model querier.")
+	parser.add_argument('--fail-fast', action='store_true', help="Stop grading a solution for correctness at its first failing or timed out test case.")
+	parser.add_argument('--case-order', default='suite', choices=case_history.CASE_ORDERS, help="Order in which correctness test cases run: as listed in the suite, historically most-failed first, or historically cheapest first.")
+	parser.add_argument('--tier', default=None, help="Grade correctness on only this tier of each problem's test suite, e.g. smoke as computed by minimize.py, and report how well the tier agreed with the whole suite historically.")
+	parser.add_argument('--profile', action='store_true', help="Profile each solution on its slowest test case when grading performance and attach the stats to the grade.")
+	parser.add_argument('--profile-lines', action='store_true', help="With --profile, also sample line-level hotspots.")
+	parser.add_argument('--memory-mode', nargs='+', default=['tracemalloc'], choices=execution.MEMORY_MODES, help="Memory back end(s) for the memory grader: tracemalloc peak, net allocations, or peak RSS growth (cheapest). The first mode determines the score.")
+	parser.add_argument('--preload', nargs='*', default=execution.DEFAULT_PRELOAD_MODULES, help="Modules executor workers import once, before running any solution, so that import time never counts against a solution. Modules that aren't installed are skipped.")
+	parser.add_argument('--workers', nargs='+', default=None, metavar='ADDRESS', help="Run executions on executor worker daemons (started with remote_execution.py) instead of local worker processes. Addresses are unix:PATH or HOST:PORT.")
+	parser.add_argument('--timeout-multiplier', type=float, default=None, help=f"Derive each execution's timeout as this multiple of the optimal solution's runtime for the same test case and iteration count, instead of a fixed {execution.DEFAULT_TIMEOUT} seconds.")
+	parser.add_argument('--timeout-floor', type=float, default=1.0, help="Seconds added to every adaptive timeout to cover worker startup, so also the shortest adaptive timeout.")
+	parser.add_argument('--timeout-ceiling', type=float, default=60.0, help="Maximum adaptive timeout in seconds, also used when a problem has no optimal solution.")
+	parser.add_argument('--solution-budget', type=float, default=None, help="Maximum total wall-clock seconds spent executing any one solution per grader.")
+	parser.add_argument('--incremental', action='store_true', help="Only re-grade solutions whose code, problem definition or grader changed since they were last graded; carry the other stored grades over into the report.")
+	parser.add_argument('--tags', nargs='+', default=None, help="Only generate and grade problems with any of these tags, e.g. Array. Tags are compared regardless of case.")
+	parser.add_argument('--problems', nargs='+', default=None, metavar='PATTERN', help="Only generate and grade problems whose identifier matches any of these glob patterns or regular expressions, e.g. 'problem_1*' or 'problem_(3|7)'.")
+	parser.add_argument('--prompts', nargs='+', default=None, metavar='PATTERN', help="Only generate and grade the prompts whose ID matches any of these glob patterns or regular expressions.")
+	parser.add_argument('--shard', type=shard_argument, default=None, help="Only generate and grade the work items of shard i of N, e.g. 2/4. Work items (problem set, problem, model, prompt) are partitioned by hash, so N machines given shards 1/N to N/N cover a run exactly once.")
+	parser.add_argument('--merge-reports', nargs='+', default=None, metavar='REPORT', help="Combine the reports of a sharded run into one report per model, written to the report path.")
+	parser.add_argument('--resume', default=None, metavar='RUN_ID', help="Resume an interrupted --generate/--grade run: skip the work items it completed and keep writing to its reports. Pass the run's other arguments again.")
+	parser.add_argument('--export-batch', default=None, metavar='PATH', help="With --generate, write every generation request to a JSONL file in the OpenAI batch API format instead of querying the models.")
+	parser.add_argument('--import-batch', default=None, metavar='PATH', help="Save the responses in a JSONL file of OpenAI batch results as solutions, before grading.")
+	parser.add_argument('--plan', action='store_true', help="Don't run anything: list the work items the given --generate/--grade run would process and estimate its wall time and API tokens from earlier runs.")
+	parser.add_argument('--watch', action='store_true', help="After any other phases, keep watching the solutions trees and grade new or modified solutions of the given models as they appear, adding them to the run's reports. Stop with Ctrl-C.")
+	parser.add_argument('--serve', default=None, metavar='ADDRESS', help="Keep the problem sets and graders loaded and serve grading requests over HTTP on unix:PATH or HOST:PORT until interrupted.")
+	parser.add_argument('--trace', default=None, metavar='DIRECTORY', help="Record spans of every phase, execution and cache counters and latency histograms, and write them to DIRECTORY as a Chrome trace (trace-<timestamp>.json) and a Prometheus text file (metrics-<timestamp>.prom) when the run ends.")
 	parser.add_argument('--report-path', default=None, help="Location in which to store reports generated during each run. Default= ./reports")
 	args = parser.parse_args()
 
+	if args.trace:
+		telemetry.enable()
+		trace_id = datetime.datetime.now().strftime("%m-%d-%Y--%H-%M-%S")
+		# Also written when the run fails or is interrupted, which is when a trace is most useful
+		atexit.register(lambda: print(f"Telemetry written to {', '.join(telemetry.write(args.trace, trace_id))}"))
+
 	problem_definitions = []
+	execution.configure_workers(args.preload)
+	if args.workers:
+		pool = remote_execution.WorkerPool(args.workers)
+		if not pool.check_health():
+			parser.error(f"None of the executor workers {', '.join(args.workers)} is reachable")
+		execution.configure_remote_executor(pool)
 	
 	if args.model:
 		models = querier.AIModelQuerier.resolve_queriers(args.model, args.force_human)
+	timeout_policy = None
+	if args.timeout_multiplier is not None or args.solution_budget is not None:
+		timeout_policy = execution.TimeoutPolicy(args.timeout_multiplier, args.timeout_floor, args.timeout_ceiling, args.solution_budget)
+	grader_options = {'timeout_policy': timeout_policy, 'fail_fast': args.fail_fast, 'case_order': args.case_order, 'tier': args.tier, 'profile': args.profile or args.profile_lines, 'profile_lines': args.profile_lines, 'memory_modes': args.memory_mode}
 	if args.grader:
-		graders = grader.Grader.resolve_graders(args.grader)
+		graders = grader.Grader.resolve_graders(args.grader, grader_options)
 	
+	selection = None
+	if args.tags is not None or args.problems is not None or args.prompts is not None:
+		selection = ProblemSelection(args.tags, args.problems, args.prompts)
+
 	if args.base_path is None:
 		args.base_path = [os.path.join('problem_sets', d) for d in os.listdir('problem_sets') if os.path.isdir(os.path.join('problem_sets', d))]
 
 	if args.report_path is None:
 		args.report_path = 'reports'
+
+	if args.serve:
+		print_header('Grading service')
+		service.serve(service.GradingService(args.base_path, grader_options), args.serve)
+		return
 		
 	if args.validate:
 		print_header('Validation')
 		print("Validating problems…")
-		all_validation_results = {x: validate_problems(x) for x in args.base_path}
+		all_validation_results = {x: validate_problems(x, selection) for x in args.base_path}
 		print("Validation results:")
 		for base_path, validation_results in all_validation_results.items():
 			print(f"{base_path}:")
 			for fileName, validation_result in validation_results.items():
 				print(f"\t{fileName}: {validation_result}")
+
+	if args.merge_reports:
+		print_header('Merging reports')
+		merge_shard_reports(args.merge_reports, args.report_path, datetime.datetime.now().strftime("%m-%d-%Y--%H-%M-%S"))
 	
-	if args.generate or args.grade:
+	if args.plan:
+		print_header('Plan')
+		if not (args.generate or args.grade):
+			parser.error("--plan needs --generate and/or --grade to know which phases to plan")
+		items = []
+		for x in args.base_path:
+			items += plan_work(x, load_problems(x, selection), models, graders if args.grade else [], args.generate, args.grade,
+				args.incremental, args.shard, selection)
+		planner.print_plan(items, execution.dispatch_concurrency())
+		return
+
+	if args.export_batch and not args.generate:
+		parser.error("--export-batch needs --generate")
+
+	if args.import_batch:
+		print_header('Importing batch results')
+		batch.import_batch(args.import_batch, {x: load_problems(x, selection) for x in args.base_path})
+
+	if args.generate or args.grade or args.watch:
 		# generate timestamp to identify final report:
 		timestamp = datetime.datetime.now().strftime("%m-%d-%Y--%H-%M-%S")
-		current_report_paths = {m: os.path.join(args.report_path, "report-" + m.model_identifier + "-" + timestamp + ".json") for m in models}
+		report_suffix = "" if args.shard is None else "-" + args.shard.suffix()
+		if args.resume:
+			run_manifest = serialization.get_run_manifest(args.report_path, args.resume)
+			if run_manifest is None:
+				parser.error(f"No run {args.resume} to resume in {args.report_path}")
+			# A resumed run has to do the same work as the interrupted one, or its reports would mix two configurations
+			original_args, current_args = vars(parser.parse_args(run_manifest.arguments)), vars(parser.parse_args(sys.argv[1:]))
+			changed = sorted(name for name, value in current_args.items() if name != 'resume' and original_args.get(name) != value)
+			if changed:
+				parser.error(f"Run {args.resume} was started with different arguments ({', '.join('--' + name.replace('_', '-') for name in changed)}): {' '.join(run_manifest.arguments)}")
+		else:
+			run_manifest = RunManifest(timestamp + report_suffix, sys.argv[1:])
+			serialization.save_run_manifest(args.report_path, run_manifest)
+		print(f"Run {run_manifest.run_id}; if interrupted, continue it with --resume {run_manifest.run_id}")
+		current_report_paths = {m: os.path.join(args.report_path, "report-" + m.model_identifier + "-" + run_manifest.run_id + ".json") for m in models}
 
 		print_header('Problems')
 		print("Loading problems…")
-		problem_sets = {x: load_problems(x) for x in args.base_path}
+		problem_sets = {}
+		for x in args.base_path:
+			with telemetry.span('load', problem_set=x):
+				problem_sets[x] = load_problems(x, selection)
 	
+		if args.export_batch:
+			print_header('Generation')
+			requests = batch.export_batch(args.export_batch, problem_sets, [m.model_identifier for m in models], args.shard, selection)
+			print(f"Wrote {requests} generation request(s) to {args.export_batch}; import the results with --import-batch")
+
 		# Run benchmarks on all problem sets sequentially
 		for base_path, problem_definitions in problem_sets.items():
 			print(f"\n***\n*** Problem set {base_path}\n***\n")
@@ -128,16 +434,16 @@ def main():
 				print(problem_definition)
 				print()
 				
-			if args.generate:
+			if args.generate and not args.export_batch:
 				print_header('Generation')
 				print("Generating solutions…")
-				solutions = generate_solutions(base_path, problem_definitions, models)
+				solutions = generate_solutions(base_path, problem_definitions, models, args.shard, run_manifest, args.report_path, selection)
 				print(solutions)
 			
 			if args.grade:
 				print_header('Grading')
 				print("Grading solutions…")
-				grading_outputs = grade_solutions(base_path, problem_definitions, models, graders, current_report_paths)
+				grading_outputs = grade_solutions(base_path, problem_definitions, models, graders, current_report_paths, args.incremental, args.shard, run_manifest, args.report_path, selection)
 	
 				for output in grading_outputs:
 					print(output.str_including_solutions())
@@ -147,5 +453,10 @@ def main():
 				for output in grading_outputs:
 					print(output)
 
+		if args.watch:
+			print_header('Watching')
+			watch.watch_and_grade(problem_sets, [m.model_identifier for m in models], graders,
+				{m.model_identifier: path for m, path in current_report_paths.items()}, args.shard, selection)
+
 if __name__ == "__main__":
 	main()
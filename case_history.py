@@ -0,0 +1,157 @@
+from base_types import *
+from grading_manifest import hash_json
+
+CASE_ORDERS = ['suite', 'discriminating', 'cheapest']
+
+class TestCaseStats:
+	"""
+	Accumulated outcomes of one correctness test case across every solution graded against it.
+	"""
+	def __init__(self, runs: int = 0, failures: int = 0, total_time: float = 0.0):
+		self.runs = runs
+		self.failures = failures
+		self.total_time = total_time
+
+	@property
+	def failure_rate(self) -> Optional[float]:
+		return self.failures / self.runs if self.runs else None
+
+	@property
+	def mean_time(self) -> Optional[float]:
+		return self.total_time / self.runs if self.runs else None
+
+	@classmethod
+	def from_json(cls, data: Dict[str, Any]) -> 'TestCaseStats':
+		return cls(data.get('runs', 0), data.get('failures', 0), data.get('total_time', 0.0))
+
+	def to_json(self) -> Dict[str, Any]:
+		return {
+			'runs': self.runs,
+			'failures': self.failures,
+			'total_time': self.total_time
+		}
+
+class ProblemCaseHistory:
+	"""
+	Per-test-case statistics and per-solution pass/fail vectors for one problem's correctness test suite.
+	`outcomes` maps a solution hash to a list with one entry per test case: True, False, or None if the case was not run.
+	"""
+	def __init__(self, suite_hash: str, cases: Optional[Dict[int, TestCaseStats]] = None, outcomes: Optional[Dict[str, List[Optional[bool]]]] = None):
+		self.suite_hash = suite_hash
+		self.cases = cases or {}
+		self.outcomes = outcomes or {}
+
+	@classmethod
+	def from_json(cls, data: Dict[str, Any]) -> 'ProblemCaseHistory':
+		cases = {int(index): TestCaseStats.from_json(stats) for index, stats in data.get('cases', {}).items()}
+		return cls(data.get('suite_hash', ''), cases, data.get('outcomes', {}))
+
+	def to_json(self) -> Dict[str, Any]:
+		return {
+			'suite_hash': self.suite_hash,
+			'cases': {str(index): stats.to_json() for index, stats in sorted(self.cases.items())},
+			'outcomes': self.outcomes
+		}
+
+	def record_case(self, index: int, passed: bool, elapsed: float):
+		stats = self.cases.setdefault(index, TestCaseStats())
+		stats.runs += 1
+		stats.failures += 0 if passed else 1
+		stats.total_time += elapsed
+
+	def record_outcomes(self, solution_hash: str, outcomes: List[Optional[bool]]):
+		# Cases that weren't run this time, e.g. because they are outside a tier, keep their earlier outcome
+		previous = self.outcomes.get(solution_hash)
+		if previous is not None and len(previous) == len(outcomes):
+			outcomes = [old if new is None else new for new, old in zip(outcomes, previous)]
+		self.outcomes[solution_hash] = outcomes
+
+	def complete_outcomes(self) -> List[List[bool]]:
+		"""
+		The outcome vectors of the solutions that were run on every test case.
+		"""
+		return [outcomes for outcomes in self.outcomes.values() if outcomes and None not in outcomes]
+
+	def order(self, indices: List[int], mode: str) -> List[int]:
+		"""
+		Orders test case indices for execution.
+
+		'discriminating' runs the cases historical solutions failed most often first; cases without
+		history count as a coin flip. 'cheapest' runs the fastest cases first and unmeasured cases last.
+		Ties keep suite order.
+		"""
+		if mode == 'discriminating':
+			def failure_rate(index):
+				rate = self.cases[index].failure_rate if index in self.cases else None
+				return 0.5 if rate is None else rate
+			return sorted(indices, key=lambda index: -failure_rate(index))
+		if mode == 'cheapest':
+			def mean_time(index):
+				time = self.cases[index].mean_time if index in self.cases else None
+				return float('inf') if time is None else time
+			return sorted(indices, key=mean_time)
+		return list(indices)
+
+def suite_hash(problem: ProblemDefinition) -> str:
+	if problem.test_suite_file:
+		return problem.test_suite_digest()
+	return hash_json([test_case.to_json() for test_case in problem.correctness_test_suite or []])
+
+def tier_cases(problem: ProblemDefinition, tier: str) -> Optional[List[int]]:
+	"""
+	The test case indices of a tier of the problem, or None if the problem has no such tier or the tier
+	was computed for a different test suite. Tiers written by hand, without a suite hash, are always used.
+	"""
+	definition = problem.test_tiers.get(tier)
+	if not definition or not definition.get('cases'):
+		return None
+	if definition.get('suite_hash') and definition['suite_hash'] != suite_hash(problem):
+		return None
+	cases = definition['cases']
+	if not all(isinstance(index, int) and 0 <= index < problem.test_case_count() for index in cases):
+		return None
+	return sorted(set(cases))
+
+def tier_agreement(outcomes: List[List[bool]], cases: List[int]) -> Dict[str, Any]:
+	"""
+	How well scores on a subset of the test cases agree with full suite scores, over historical outcome vectors.
+
+	`pass_fail_agreement` is the fraction of solutions that pass the subset exactly when they pass the whole
+	suite. `rank_agreement` is the fraction of pairs of solutions with different full suite scores that the
+	subset's scores order the same way. Both are None without history.
+	"""
+	full_scores = [sum(vector) for vector in outcomes]
+	tier_scores = [sum(vector[index] for index in cases) for vector in outcomes]
+	same_status = sum((full == len(vector)) == (partial == len(cases)) for vector, full, partial in zip(outcomes, full_scores, tier_scores))
+	pairs = 0
+	concordant = 0
+	for a in range(len(outcomes)):
+		for b in range(a + 1, len(outcomes)):
+			if full_scores[a] == full_scores[b]:
+				continue
+			pairs += 1
+			if tier_scores[a] != tier_scores[b] and (full_scores[a] > full_scores[b]) == (tier_scores[a] > tier_scores[b]):
+				concordant += 1
+	return {
+		'solutions': len(outcomes),
+		'pass_fail_agreement': same_status / len(outcomes) if outcomes else None,
+		'rank_agreement': (concordant / pairs if pairs else 1.0) if outcomes else None
+	}
+
+class CaseHistory:
+	"""
+	Stored per-test-case outcomes for every problem of a problem set.
+	"""
+	def __init__(self, problems: Optional[Dict[str, ProblemCaseHistory]] = None):
+		self.problems = problems or {}
+
+	def for_problem(self, problem: ProblemDefinition) -> ProblemCaseHistory:
+		"""
+		Returns the history of the problem's current test suite, starting afresh if the suite changed.
+		"""
+		current_hash = suite_hash(problem)
+		history = self.problems.get(problem.identifier)
+		if history is None or history.suite_hash != current_hash:
+			history = ProblemCaseHistory(current_hash)
+			self.problems[problem.identifier] = history
+		return history
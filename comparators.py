@@ -0,0 +1,173 @@
+"""
+Comparison of expected and actual function results for correctness grading.
+
+A problem picks its comparator in its `comparison` field, with the comparator's options next to it:
+
+	"comparison": {"comparator": "allclose", "rtol": 1e-6, "atol": 1e-9}
+
+Without one, results are compared exactly. Comparators are type aware: arrays are compared elementwise in one
+vectorized pass instead of as nested lists. Expected outputs can live in `.npy` sidecar files under the
+problem set's `data` directory, referenced from a test case as {"npy": "<path relative to data>"}; they
+are memory-mapped when graded, so large outputs are neither parsed as JSON text nor copied into memory.
+Arrays need NumPy; everything else works without it.
+
+	python comparators.py --base_path problem_sets/vectorizing --min-elements 10000
+
+moves expected outputs of at least that many numbers from the problem files into sidecars.
+"""
+from base_types import *
+import argparse
+import collections
+import math
+import os
+from typing import Callable
+try:
+	import numpy as np
+except ImportError:
+	np = None
+
+# Comparator functions by name; each takes the expected and the actual result and the problem's options
+COMPARATORS: Dict[str, Callable[..., bool]] = {}
+
+# Name of the problem set directory that holds sidecar files
+DATA_DIRECTORY = "data"
+
+def comparator(name: str):
+	"""
+	Registers a comparator under `name`, so problems can select it in their `comparison` field.
+	"""
+	def register(function):
+		COMPARATORS[name] = function
+		return function
+	return register
+
+def is_array(value) -> bool:
+	return np is not None and isinstance(value, np.ndarray)
+
+def as_array(value):
+	"""
+	The value as a NumPy array of numbers or booleans, or None if it isn't one, e.g. a ragged or mixed list.
+	"""
+	if np is None:
+		return None
+	try:
+		array = np.asarray(value)
+	except ValueError:
+		return None
+	return array if array.dtype.kind in 'biuf' else None
+
+@comparator('exact')
+def exact(expected, actual) -> bool:
+	if is_array(expected) or is_array(actual):
+		expected_array, actual_array = as_array(expected), as_array(actual)
+		if expected_array is None or actual_array is None:
+			return False
+		return expected_array.shape == actual_array.shape and bool(np.array_equal(expected_array, actual_array))
+	return expected == actual
+
+def nested_close(expected, actual, rtol: float, atol: float, equal_nan: bool) -> bool:
+	if isinstance(expected, (list, tuple)) and isinstance(actual, (list, tuple)):
+		return len(expected) == len(actual) and all(nested_close(e, a, rtol, atol, equal_nan) for e, a in zip(expected, actual))
+	if isinstance(expected, (int, float)) and isinstance(actual, (int, float)) and not isinstance(expected, bool) and not isinstance(actual, bool):
+		if math.isnan(expected) or math.isnan(actual):
+			return equal_nan and math.isnan(expected) and math.isnan(actual)
+		# The same asymmetric test as numpy.allclose, so results don't depend on whether NumPy is installed
+		return abs(actual - expected) <= atol + rtol * abs(expected)
+	return expected == actual
+
+@comparator('allclose')
+def allclose(expected, actual, rtol: float = 1e-05, atol: float = 1e-08, equal_nan: bool = False) -> bool:
+	expected_array, actual_array = as_array(expected), as_array(actual)
+	if expected_array is not None and actual_array is not None:
+		return expected_array.shape == actual_array.shape and bool(np.allclose(actual_array, expected_array, rtol=rtol, atol=atol, equal_nan=equal_nan))
+	if is_array(expected) or is_array(actual):
+		return nested_close(expected.tolist() if is_array(expected) else expected, actual.tolist() if is_array(actual) else actual, rtol, atol, equal_nan)
+	return nested_close(expected, actual, rtol, atol, equal_nan)
+
+def freeze(value):
+	# A hashable equivalent of a JSON-like value, so collections of them can be counted
+	if isinstance(value, (list, tuple)):
+		return tuple(freeze(item) for item in value)
+	if isinstance(value, dict):
+		return tuple(sorted((key, freeze(item)) for key, item in value.items()))
+	if isinstance(value, set):
+		return frozenset(freeze(item) for item in value)
+	return value
+
+@comparator('unordered')
+def unordered(expected, actual) -> bool:
+	"""
+	Compares collections as multisets, for functions whose results may come in any order.
+	"""
+	expected = expected.tolist() if is_array(expected) else expected
+	actual = actual.tolist() if is_array(actual) else actual
+	if not isinstance(expected, (list, tuple, set)) or not isinstance(actual, (list, tuple, set)):
+		return exact(expected, actual)
+	try:
+		return collections.Counter(freeze(item) for item in expected) == collections.Counter(freeze(item) for item in actual)
+	except TypeError:
+		return sorted(map(repr, expected)) == sorted(map(repr, actual))
+
+def compare(comparison: Optional[Dict[str, Any]], expected, actual) -> bool:
+	"""
+	Compares results with the comparator and options of a problem's `comparison` field.
+	"""
+	comparison = comparison or {}
+	options = {key: value for key, value in comparison.items() if key != 'comparator'}
+	return COMPARATORS[comparison.get('comparator', 'exact')](expected, actual, **options)
+
+def load_sidecar(reference: Dict[str, str], data_directory: Optional[str]):
+	if np is None:
+		raise RuntimeError(f"Expected output {reference['npy']} is stored as a .npy file, which needs NumPy; install it with `pip install numpy`.")
+	if data_directory is None:
+		raise RuntimeError(f"Expected output {reference['npy']} is stored as a .npy file, but the problem wasn't loaded from a problem set.")
+	return np.load(os.path.join(data_directory, reference['npy']), mmap_mode='r', allow_pickle=False)
+
+def resolve_sidecars(expected, data_directory: Optional[str]):
+	"""
+	Replaces sidecar references in an expected result, as returned by `get_return_values`, with memory-mapped arrays.
+	"""
+	if is_sidecar(expected):
+		return load_sidecar(expected, data_directory)
+	if isinstance(expected, tuple) and any(is_sidecar(value) for value in expected):
+		return tuple(load_sidecar(value, data_directory) if is_sidecar(value) else value for value in expected)
+	return expected
+
+def externalize_outputs(base_path: str, min_elements: int) -> int:
+	"""
+	Moves every numeric expected output with at least `min_elements` elements into a sidecar file and
+	returns the number of outputs moved. Problem files are only rewritten if one of their outputs moved.
+	"""
+	import serialization
+	moved = 0
+	for file_name, problem_json in serialization.get_problems_json(base_path).items():
+		identifier = problem_json.get('identifier', os.path.splitext(file_name)[0])
+		changed = False
+		for case_index, test_case in enumerate(problem_json.get('correctness_test_suite', [])):
+			for output_index, expected in enumerate(test_case.get('expected_output', [])):
+				array = as_array(ast.literal_eval(expected) if isinstance(expected, str) and expected.startswith('[') else expected)
+				if array is None or array.ndim == 0 or array.size < min_elements:
+					continue
+				relative_path = os.path.join(identifier, f"case-{case_index}-output-{output_index}.npy")
+				path = os.path.join(base_path, DATA_DIRECTORY, relative_path)
+				os.makedirs(os.path.dirname(path), exist_ok=True)
+				np.save(path, array, allow_pickle=False)
+				test_case['expected_output'][output_index] = {'npy': relative_path}
+				moved += 1
+				changed = True
+		if changed:
+			serialization.write_json_atomically(os.path.join(base_path, "problems", file_name), problem_json)
+	return moved
+
+def main():
+	parser = argparse.ArgumentParser(description="Move large numeric expected outputs of correctness test suites into memory-mapped .npy sidecar files.")
+	parser.add_argument('--base_path', nargs='+', required=True, help="The problem set(s) whose outputs to move.")
+	parser.add_argument('--min-elements', type=int, default=10000, help="Smallest number of elements an output needs to be moved. Default: 10000")
+	args = parser.parse_args()
+	if np is None:
+		parser.error("sidecar files need NumPy; install it with `pip install numpy`.")
+	for base_path in args.base_path:
+		print(f"{base_path}: moved {externalize_outputs(base_path, args.min_elements)} expected output(s) into {os.path.join(base_path, DATA_DIRECTORY)}")
+
+if __name__ == "__main__":
+	main()
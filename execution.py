@@ -8,6 +8,21 @@ import multiprocessing
 import json
 import time
 import tracemalloc
+import cProfile
+import pstats
+import signal
+import telemetry
+import threading
+import functools
+import io
+try:
+	import numpy as np
+except ImportError:
+	np = None
+try:
+	from multiprocessing import context as multiprocessing_context, forkserver, popen_forkserver, reduction, spawn, util
+except ImportError:
+	popen_forkserver = None
 
 # The resource module isn't available on Windows
 try:
@@ -16,18 +31,324 @@ try:
 except ImportError:
 	USE_RESOURCE = False
 
+# Memory measurement back ends, cheapest last:
+#   tracemalloc  peak Python-heap allocation during a call
+#   allocations  bytes allocated at the call's peak and blocks the call leaves allocated, traced in one session for all iterations
+#   rss          growth of the process's peak resident set size, including native buffers
+MEMORY_MODES = ['tracemalloc', 'allocations', 'rss']
+
+# RSS grows in whole pages, so smaller differences in peak RSS can't be measured
+try:
+	RSS_RESOLUTION = os.sysconf('SC_PAGE_SIZE')
+except (AttributeError, ValueError, OSError):
+	RSS_RESOLUTION = 4096
+
+# Seconds an execution may take when no adaptive timeout applies
+DEFAULT_TIMEOUT = 5
+
+# Modules executor workers import before running any solution, so solutions never pay for importing them
+DEFAULT_PRELOAD_MODULES = ['numpy', 'math', 'collections', 'itertools', 'functools', 'heapq', 'bisect']
+
+# The multiprocessing context executor workers are started from; set up by configure_workers
+_worker_context = None
+
+# Remote executor that execute_function dispatches to instead of starting local workers; set by configure_remote_executor
+_remote_executor = None
+
+# Number of trusted reference functions kept compiled in the harness process
+TRUSTED_FUNCTION_CACHE_SIZE = 256
+
+# Trusted calls that outlived their timeout and still run in the harness process; while any does, trusted
+# code runs sandboxed, since the runaway call competes for the CPU and the GIL with in-process measurements
+_runaway_threads = []
+_runaway_lock = threading.Lock()
+
+# Number of functions and lines kept from a profile
+PROFILE_TOP_N = 10
+# Sampling interval and sampling duration for line-level hotspots, in seconds
+LINE_SAMPLE_INTERVAL = 0.001
+LINE_SAMPLE_DURATION = 0.2
+
 class FunctionExecutionResult:
-	def __init__(self, result=None, cpu_time=None, peak_memory=None, error=None, traceback=None, function_code=None, parameters=None):
+	def __init__(self, result=None, cpu_time=None, peak_memory=None, error=None, traceback=None, function_code=None, parameters=None, profile=None, memory=None, timed_out=False, error_type=None):
 		self.result = result
 		self.cpu_time = cpu_time
 		self.peak_memory = peak_memory
+		# All memory metrics reported by the selected memory mode, keyed by metric name
+		self.memory = memory or {}
+		# Timeouts are reported through `error` too, but are a distinct outcome from the function raising
+		self.timed_out = timed_out
 		self.error = error
+		# Class name of the exception the function raised, if any
+		self.error_type = error_type
 		self.traceback = traceback
 		self.function_code = function_code
 		self.parameters = parameters
+		self.profile = profile
 	
+	def to_json(self, arrays=False) -> Dict[str, Any]:
+		# The caller already has the code and parameters, so they aren't sent back from remote workers.
+		# With `arrays`, numeric NumPy results are kept for transports that send them as raw bytes.
+		result = self.result
+		keep_array = arrays and np is not None and isinstance(result, np.ndarray) and result.dtype.kind in 'biuf'
+		if not keep_array and np is not None and isinstance(result, (np.ndarray, np.generic)):
+			result = result.tolist()
+		return {
+			'result': result,
+			'cpu_time': self.cpu_time,
+			'peak_memory': self.peak_memory,
+			'memory': self.memory,
+			'timed_out': self.timed_out,
+			'error': self.error,
+			'error_type': self.error_type,
+			'traceback': self.traceback,
+			'profile': self.profile
+		}
+
+	@classmethod
+	def from_json(cls, data: Dict[str, Any], function_code=None, parameters=None) -> 'FunctionExecutionResult':
+		return cls(
+			result=data.get('result'),
+			cpu_time=data.get('cpu_time'),
+			peak_memory=data.get('peak_memory'),
+			error=data.get('error'),
+			traceback=data.get('traceback'),
+			function_code=function_code,
+			parameters=parameters,
+			profile=data.get('profile'),
+			memory=data.get('memory'),
+			timed_out=data.get('timed_out', False),
+			error_type=data.get('error_type')
+		)
+
 	def __repr__(self):
-		return f"<FunctionExecutionResult result={self.result} cpu_time={self.cpu_time} peak_memory={self.peak_memory} error={self.error}>"
+		return f"<FunctionExecutionResult result={self.result} cpu_time={self.cpu_time} peak_memory={self.peak_memory} error={self.error} timed_out={self.timed_out}>"
+
+class TimeoutPolicy:
+	"""
+	Derives per-execution timeouts from the reference solution's runtime.
+
+	A call running `iterations` iterations of a test case whose reference takes `reference_time` seconds per
+	iteration gets `floor + multiplier * reference_time * iterations` seconds, capped at `ceiling`. The floor
+	covers worker startup. Without a reference time the ceiling applies. `solution_budget`, if set, caps the
+	total wall-clock time spent executing any one solution. Without a multiplier, only the budget applies.
+	"""
+	def __init__(self, multiplier: Optional[float] = 10.0, floor: float = 1.0, ceiling: float = 60.0, solution_budget: Optional[float] = None):
+		self.multiplier = multiplier
+		self.floor = floor
+		self.ceiling = ceiling
+		self.solution_budget = solution_budget
+
+	@property
+	def adaptive(self) -> bool:
+		return self.multiplier is not None
+
+	def timeout_for(self, reference_time: Optional[float], iterations: int = 1) -> float:
+		if not self.adaptive:
+			return DEFAULT_TIMEOUT
+		if reference_time is None:
+			return self.ceiling
+		return min(self.ceiling, self.floor + self.multiplier * reference_time * iterations)
+
+	def __repr__(self):
+		return f"<TimeoutPolicy multiplier={self.multiplier} floor={self.floor} ceiling={self.ceiling} solution_budget={self.solution_budget}>"
+
+def preload_modules(module_names):
+	for module_name in module_names:
+		try:
+			__import__(module_name)
+		except ImportError:
+			pass
+
+def worker_popen_supported() -> bool:
+	"""
+	Whether WorkerPopen can start workers here. It re-implements the fork server's private launch code, so it is
+	only used on the Python versions it was checked against and if every private name it relies on exists;
+	elsewhere workers are started by multiprocessing's own fork server.
+	"""
+	if popen_forkserver is None or not (3, 8) <= sys.version_info[:2] <= (3, 13):
+		return False
+	required = [(popen_forkserver.Popen, '_launch'), (spawn, 'get_preparation_data'),
+				(reduction, 'dump'), (multiprocessing_context, 'set_spawning_popen'), (forkserver, 'connect_to_new_process'),
+				(forkserver, 'read_signed'), (util, 'Finalize'), (util, 'close_fds')]
+	return all(hasattr(owner, name) for owner, name in required)
+
+if worker_popen_supported():
+	class WorkerPopen(popen_forkserver.Popen):
+		"""
+		Starts a worker from the fork server without preparing the parent's main module in it.
+		Workers only run executor_script, which lives in this module, so importing the entry script
+		again in every worker (as multiprocessing does by default) would only re-run its top level.
+		"""
+		def _launch(self, process_obj):
+			prep_data = spawn.get_preparation_data(process_obj._name)
+			prep_data.pop('init_main_from_name', None)
+			prep_data.pop('init_main_from_path', None)
+			buf = io.BytesIO()
+			multiprocessing_context.set_spawning_popen(self)
+			try:
+				reduction.dump(prep_data, buf)
+				reduction.dump(process_obj, buf)
+			finally:
+				multiprocessing_context.set_spawning_popen(None)
+
+			self.sentinel, w = forkserver.connect_to_new_process(self._fds)
+			_parent_w = os.dup(w)
+			self.finalizer = util.Finalize(self, util.close_fds, (_parent_w, self.sentinel))
+			with open(w, 'wb', closefd=True) as f:
+				f.write(buf.getbuffer())
+			self.pid = forkserver.read_signed(self.sentinel)
+
+	class WorkerProcess(multiprocessing_context.ForkServerProcess):
+		@staticmethod
+		def _Popen(process_obj):
+			return WorkerPopen(process_obj)
+
+	class WorkerContext(multiprocessing_context.ForkServerContext):
+		Process = WorkerProcess
+
+def configure_workers(module_names=DEFAULT_PRELOAD_MODULES):
+	"""
+	Sets up how executor workers are started. Where the platform supports it, a fork server imports
+	this module and the preload modules once, and every worker is forked from that template, sharing
+	the imported modules copy-on-write. Elsewhere the modules are imported into this process so that
+	forked workers inherit them. Must be called before the first execution to take effect.
+
+	Neither the fork server nor its workers import the entry script: workers only need this module. On Python
+	versions WorkerPopen doesn't support, workers are started the standard way, which does import it.
+	"""
+	global _worker_context
+	if popen_forkserver is not None and 'forkserver' in multiprocessing.get_all_start_methods():
+		_worker_context = WorkerContext() if worker_popen_supported() else multiprocessing.get_context('forkserver')
+		_worker_context.set_forkserver_preload([__name__] + list(module_names))
+	else:
+		_worker_context = multiprocessing.get_context()
+		preload_modules(module_names)
+
+def configure_remote_executor(executor):
+	"""
+	Makes execute_function dispatch every execution to `executor`, an object with an
+	`execute(job) -> FunctionExecutionResult` method such as a remote_execution.WorkerPool,
+	where `job` holds execute_function's arguments by name. Pass None to execute locally again.
+	"""
+	global _remote_executor
+	_remote_executor = executor
+
+def dispatch_concurrency() -> int:
+	"""
+	How many executions are worth running at the same time: the remote executor's capacity, if it reports one.
+	Local executions run one at a time, so they never compete for the CPU they are measured on.
+	"""
+	if _remote_executor is None:
+		return 1
+	return max(1, getattr(_remote_executor, 'concurrency', 1))
+
+def get_worker_context():
+	if _worker_context is None:
+		configure_workers()
+	return _worker_context
+
+def read_process_status(field):
+	# Returns a size field of /proc/self/status in bytes, or None where procfs isn't available
+	try:
+		with open('/proc/self/status') as file:
+			for line in file:
+				if line.startswith(field + ':'):
+					return int(line.split()[1]) * 1024
+	except OSError:
+		pass
+	return None
+
+def read_peak_rss():
+	peak_rss = read_process_status('VmHWM')
+	if peak_rss is None and USE_RESOURCE:
+		peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+		# ru_maxrss is in kilobytes on Linux and in bytes on macOS
+		peak_rss *= 1 if sys.platform == 'darwin' else 1024
+	return peak_rss
+
+def reset_peak_rss():
+	# Linux lets a process reset its own RSS high-water mark; elsewhere the peak only ever grows
+	try:
+		with open('/proc/self/clear_refs', 'w') as file:
+			file.write('5')
+		return True
+	except OSError:
+		return False
+
+def profile_function(function, parameters):
+	"""
+	Runs the function once under cProfile and returns the top functions by own time as
+	[function description, call count, own time, cumulative time] rows.
+	"""
+	profiler = cProfile.Profile()
+	profiler.runcall(function, *parameters)
+	stats = pstats.Stats(profiler).stats
+	rows = []
+	for (filename, lineno, name), (_, call_count, own_time, cumulative_time, _) in stats.items():
+		if name == "<method 'disable' of '_lsprof.Profiler' objects>":
+			continue
+		if filename == '~':
+			description = name  # built-in functions and methods
+		elif filename == '<string>':
+			description = f"{name} (line {lineno - 2})"  # the solution, without the typing import prefix
+		else:
+			description = f"{os.path.basename(filename)}:{lineno}({name})"
+		rows.append([description, call_count, own_time, cumulative_time])
+	rows.sort(key=lambda row: row[2], reverse=True)
+	return rows[:PROFILE_TOP_N]
+
+def sample_lines(function, parameters, function_code):
+	"""
+	Calls the function repeatedly for about LINE_SAMPLE_DURATION seconds while a profiling timer samples
+	which line of the solution is executing. Returns [line number, samples, source] rows, busiest first.
+	"""
+	if not hasattr(signal, 'setitimer'):
+		return []
+	samples = {}
+	def record_sample(signum, frame):
+		while frame is not None and frame.f_code.co_filename != '<string>':
+			frame = frame.f_back
+		if frame is not None:
+			samples[frame.f_lineno] = samples.get(frame.f_lineno, 0) + 1
+	previous_handler = signal.signal(signal.SIGPROF, record_sample)
+	signal.setitimer(signal.ITIMER_PROF, LINE_SAMPLE_INTERVAL, LINE_SAMPLE_INTERVAL)
+	try:
+		deadline = time.time() + LINE_SAMPLE_DURATION
+		while time.time() < deadline:
+			function(*parameters)
+	finally:
+		signal.setitimer(signal.ITIMER_PROF, 0)
+		signal.signal(signal.SIGPROF, previous_handler)
+	source_lines = function_code.split('\n')
+	rows = [[lineno - 2, count, source_lines[lineno - 1].strip() if 0 < lineno <= len(source_lines) else ''] for lineno, count in samples.items()]
+	rows.sort(key=lambda row: row[1], reverse=True)
+	return rows[:PROFILE_TOP_N]
+
+def encode_result(result, result_file):
+	"""
+	The JSON form of a function's result. Numeric NumPy arrays are written to a .npy file next to the result
+	file instead, which is much faster than JSON text for large arrays and keeps their dtype and shape.
+	"""
+	# A function can only return NumPy values if it imported NumPy
+	numpy = sys.modules.get('numpy')
+	if numpy is None:
+		return {'result': result}
+	if isinstance(result, numpy.ndarray):
+		if result.dtype.kind in 'biuf':
+			numpy.save(result_file + '.npy', result, allow_pickle=False)
+			return {'result': None, 'result_npy': True}
+		return {'result': result.tolist()}
+	if isinstance(result, numpy.generic):
+		return {'result': result.item()}
+	return {'result': result}
+
+def resolve_function(exec_globals, function_name=None):
+	# Use the requested function if it exists, otherwise fall back to the last defined function
+	if function_name is not None and callable(exec_globals.get(function_name)):
+		return exec_globals[function_name]
+	last_function_name = [name for name in exec_globals if callable(exec_globals[name])][-1]
+	return exec_globals[last_function_name]
 
 def executor_script(function_code_file, parameters_file, config_file, result_file):
 	try:
@@ -47,6 +368,10 @@ def executor_script(function_code_file, parameters_file, config_file, result_fil
 		iterations = config.get('iterations', 1)
 		collect_cpu_time = config.get('collect_cpu_time', False)
 		collect_memory_usage = config.get('collect_memory_usage', False)
+		function_name = config.get('function_name', None)
+		profile = config.get('profile', False)
+		profile_lines = config.get('profile_lines', False)
+		memory_mode = config.get('memory_mode', 'tracemalloc')
 	
 		# Add necessary imports
 		function_code = f"from typing import *\n\n{function_code}"
@@ -55,18 +380,29 @@ def executor_script(function_code_file, parameters_file, config_file, result_fil
 		exec_globals = {}
 		exec(function_code, exec_globals)
 	
-		# Get the name of the last defined function
-		last_function_name = [name for name in exec_globals if callable(exec_globals[name])][-1]
-		function = exec_globals[last_function_name]
+		function = resolve_function(exec_globals, function_name)
 	
 		# Initialize metrics
 		total_time = 0
 		peak_memory = 0
+		peak_rss = 0
+		retained_blocks = 0
+		allocation_bytes = 0
+		if collect_memory_usage and memory_mode == 'allocations':
+			tracemalloc.start()
 	
 		# Execute function for specified iterations and collect metrics
 		for i in range(iterations):
 			if collect_memory_usage:
-				tracemalloc.start()
+				if memory_mode == 'tracemalloc':
+					tracemalloc.start()
+				elif memory_mode == 'rss':
+					baseline_rss = read_process_status('VmRSS') if reset_peak_rss() else None
+					baseline_rss = baseline_rss if baseline_rss is not None else read_peak_rss()
+				elif memory_mode == 'allocations':
+					blocks_before = sys.getallocatedblocks()
+					bytes_before, _ = tracemalloc.get_traced_memory()
+					tracemalloc.reset_peak()
 	
 			if collect_cpu_time:
 				if USE_RESOURCE:
@@ -83,28 +419,165 @@ def executor_script(function_code_file, parameters_file, config_file, result_fil
 				total_time += (end_time - start_time)
 	
 			if collect_memory_usage:
-				_, max_mem = tracemalloc.get_traced_memory()
-				peak_memory = max(peak_memory, max_mem)
-				tracemalloc.stop()
+				if memory_mode == 'tracemalloc':
+					_, max_mem = tracemalloc.get_traced_memory()
+					peak_memory = max(peak_memory, max_mem)
+					tracemalloc.stop()
+				elif memory_mode == 'rss':
+					peak_rss = max(peak_rss, read_peak_rss() - baseline_rss)
+				elif memory_mode == 'allocations':
+					_, bytes_peak = tracemalloc.get_traced_memory()
+					retained_blocks = max(retained_blocks, sys.getallocatedblocks() - blocks_before)
+					allocation_bytes = max(allocation_bytes, bytes_peak - bytes_before)
+		if collect_memory_usage and memory_mode == 'allocations':
+			tracemalloc.stop()
 	
 		metrics = {}
 		if collect_cpu_time:
 			metrics['cpu_time'] = total_time
 		if collect_memory_usage:
-			metrics['peak_memory'] = peak_memory
+			if memory_mode == 'tracemalloc':
+				metrics['peak_memory'] = peak_memory
+			elif memory_mode == 'rss':
+				metrics['peak_rss'] = peak_rss
+			elif memory_mode == 'allocations':
+				metrics['retained_blocks'] = retained_blocks
+				metrics['allocation_bytes'] = allocation_bytes
+	
+		# Profile after measuring so the profiler's overhead never shows up in the metrics
+		profile_data = None
+		if profile:
+			profile_data = {'functions': profile_function(function, parameters)}
+			if profile_lines:
+				profile_data['lines'] = sample_lines(function, parameters, function_code)
 	
 		# Write the result and metrics to the result file
-		output = {'result': result, 'metrics': metrics}
+		output = {**encode_result(result, result_file), 'metrics': metrics, 'profile': profile_data}
 		with open(result_file, 'w') as file:
 			json.dump(output, file)
 	
 	except Exception as e:
 		# Write any exception to the result file as a dictionary
 		with open(result_file, 'w') as file:
-			json.dump({'result': None, 'error': str(e), 'traceback': traceback.format_exc()}, file)
+			json.dump({'result': None, 'error': str(e), 'error_type': type(e).__name__, 'traceback': traceback.format_exc()}, file)
 	
 
-def execute_function(function_code, parameters, iterations, collect_cpu_time, collect_memory_usage):
+def remove_files(paths):
+	try:
+		for path in paths:
+			if os.path.exists(path):
+				os.unlink(path)
+	except Exception as e:
+		print(f"Failed to unlink temporary files: {str(e)}")
+
+def execute_function(function_code, parameters, iterations, collect_cpu_time, collect_memory_usage, function_name=None, profile=False, profile_lines=False, memory_mode='tracemalloc', timeout=DEFAULT_TIMEOUT):
+	start_time = time.perf_counter()
+	if _remote_executor is not None:
+		results = _remote_executor.execute({
+			"function_code": function_code,
+			"parameters": parameters,
+			"iterations": iterations,
+			"collect_cpu_time": collect_cpu_time,
+			"collect_memory_usage": collect_memory_usage,
+			"function_name": function_name,
+			"profile": profile,
+			"profile_lines": profile_lines,
+			"memory_mode": memory_mode,
+			"timeout": timeout
+		})
+	else:
+		results = execute_locally(function_code, parameters, iterations, collect_cpu_time, collect_memory_usage, function_name, profile, profile_lines, memory_mode, timeout)
+	executor = 'local' if _remote_executor is None else 'remote'
+	telemetry.count('executions', executor=executor)
+	if results.timed_out:
+		telemetry.count('timeouts', executor=executor)
+	telemetry.observe('execute_function_seconds', time.perf_counter() - start_time, executor=executor)
+	return results
+
+@functools.lru_cache(maxsize=TRUSTED_FUNCTION_CACHE_SIZE)
+def load_trusted_function(function_code, function_name=None):
+	# Each reference gets its own namespace, so references never see each other's globals
+	exec_globals = {}
+	exec(f"from typing import *\n\n{function_code}", exec_globals)
+	return resolve_function(exec_globals, function_name)
+
+def trusted_process_tainted():
+	with _runaway_lock:
+		_runaway_threads[:] = [thread for thread in _runaway_threads if thread.is_alive()]
+		return bool(_runaway_threads)
+
+def transported_result(result):
+	"""
+	The result as it would arrive from an executor worker, so trusted and sandboxed results compare alike.
+	"""
+	if np is not None:
+		if isinstance(result, np.ndarray) and result.dtype.kind in 'biuf':
+			return np.array(result)
+		if isinstance(result, (np.ndarray, np.generic)):
+			result = result.tolist()
+	return json.loads(json.dumps(result))
+
+def thread_cpu_time():
+	# The calling thread's CPU time, read the same way executor_script reads the worker's, so that the
+	# overhead of reading it, which short functions measured over many iterations add up, is the same too
+	if USE_RESOURCE and hasattr(resource, 'RUSAGE_THREAD'):
+		return resource.getrusage(resource.RUSAGE_THREAD).ru_utime + resource.getrusage(resource.RUSAGE_THREAD).ru_stime
+	return time.thread_time()
+
+def execute_trusted(function_code, parameters, iterations=1, collect_cpu_time=False, function_name=None, timeout=DEFAULT_TIMEOUT):
+	"""
+	Runs trusted reference code, such as a problem's optimal solution, in the harness process instead of a
+	sandboxed worker. No process is started and the code is compiled once per run. Parameters and results
+	are copied through JSON like a worker's, and CPU time is the calling thread's. Trusted code can't be
+	killed, so a call that outlives its timeout is left running in a daemon thread and re-run in a sandboxed
+	worker, which enforces the timeout; until the runaway call ends, trusted code runs sandboxed.
+	Never use this for generated solutions.
+	"""
+	if trusted_process_tainted():
+		telemetry.count('trusted_fallbacks')
+		return execute_function(function_code, parameters, iterations, collect_cpu_time, False, function_name, timeout=timeout)
+	start_time = time.perf_counter()
+	parameters_json = json.dumps(parameters)
+	outcome = {}
+
+	def run():
+		try:
+			function = load_trusted_function(function_code, function_name)
+			arguments = json.loads(parameters_json)
+			total_time = 0
+			for i in range(iterations):
+				call_start = thread_cpu_time()
+				result = function(*arguments)
+				total_time += thread_cpu_time() - call_start
+			outcome['result'] = transported_result(result)
+			if collect_cpu_time:
+				outcome['cpu_time'] = total_time
+		except Exception as e:
+			outcome.update(error=str(e), error_type=type(e).__name__, traceback=traceback.format_exc())
+
+	thread = threading.Thread(target=run, daemon=True)
+	thread.start()
+	thread.join(timeout)
+	telemetry.count('executions', executor='trusted')
+	telemetry.observe('execute_function_seconds', time.perf_counter() - start_time, executor='trusted')
+	if thread.is_alive():
+		telemetry.count('timeouts', executor='trusted')
+		with _runaway_lock:
+			_runaway_threads.append(thread)
+		telemetry.count('trusted_fallbacks')
+		return execute_function(function_code, parameters, iterations, collect_cpu_time, False, function_name, timeout=timeout)
+	return FunctionExecutionResult(
+		result=outcome.get('result'),
+		cpu_time=outcome.get('cpu_time'),
+		error=outcome.get('error'),
+		error_type=outcome.get('error_type'),
+		traceback=outcome.get('traceback'),
+		function_code=function_code,
+		parameters=parameters
+	)
+
+def execute_locally(function_code, parameters, iterations, collect_cpu_time, collect_memory_usage, function_name=None, profile=False, profile_lines=False, memory_mode='tracemalloc', timeout=DEFAULT_TIMEOUT):
+	# Runs the function in a fresh local worker process, even if a remote executor is configured
 	try:
 		# Create temporary files for function_code, parameters, config, and result
 		function_code_file = tempfile.NamedTemporaryFile(mode='w+', delete=False, suffix='.py')
@@ -123,37 +596,42 @@ def execute_function(function_code, parameters, iterations, collect_cpu_time, co
 		config_data = {
 			"iterations": iterations,
 			"collect_cpu_time": collect_cpu_time,
-			"collect_memory_usage": collect_memory_usage
+			"collect_memory_usage": collect_memory_usage,
+			"function_name": function_name,
+			"profile": profile,
+			"profile_lines": profile_lines,
+			"memory_mode": memory_mode
 		}
 		json.dump(config_data, config_file)
 		config_file.close()  # Close the file to ensure it's written to disk
 		
 		# Create a separate Python process to run the executor_script
-		process = multiprocessing.Process(target=executor_script, args=(function_code_file.name, parameters_file.name, config_file.name, result_file.name))
+		process = get_worker_context().Process(target=executor_script, args=(function_code_file.name, parameters_file.name, config_file.name, result_file.name))
 		process.start()
-		process.join(timeout=5)  # Add a timeout of 5 seconds
+		process.join(timeout=timeout)
+		temporary_files = [function_code_file.name, parameters_file.name, config_file.name, result_file.name, result_file.name + '.npy']
 		
 		# If the process is still alive after the timeout, terminate it
 		if process.is_alive():
 			process.terminate()
+			process.join()
+			remove_files(temporary_files)
 			return FunctionExecutionResult(
-				error="Function execution timed out after 5 seconds.",
+				error=f"Function execution timed out after {round(timeout, 2):g} seconds.",
 				function_code=function_code,
-				parameters=parameters
+				parameters=parameters,
+				timed_out=True
 			)
 		
 		# Load the result from the result file
 		with open(result_file.name, 'r') as file:
 			result_data = json.load(file)
+		if result_data.get('result_npy'):
+			# Read into memory rather than memory-mapped, so the file can be removed right away
+			result_data['result'] = np.load(result_file.name + '.npy', allow_pickle=False)
 		
-		try:
-			# Clean up temporary files
-			os.unlink(function_code_file.name)
-			os.unlink(parameters_file.name)
-			os.unlink(config_file.name)
-			os.unlink(result_file.name)
-		except Exception as e:
-			print(f"Failed to unlink temporary files: {str(e)}")
+		# Clean up temporary files
+		remove_files(temporary_files)
 		
 		# Construct the result object
 		metrics = result_data.get('metrics', {})
@@ -162,14 +640,18 @@ def execute_function(function_code, parameters, iterations, collect_cpu_time, co
 			cpu_time=metrics.get('cpu_time'),
 			peak_memory=metrics.get('peak_memory'),
 			error=result_data.get('error'),
+			error_type=result_data.get('error_type'),
 			traceback=result_data.get('traceback'),
 			function_code=function_code,
-			parameters=parameters
+			parameters=parameters,
+			profile=result_data.get('profile'),
+			memory={k: v for k, v in metrics.items() if k != 'cpu_time'}
 		)
 		
 	except Exception as e:
 		return FunctionExecutionResult(
 			error=str(e),
+			error_type=type(e).__name__,
 			function_code=function_code,
 			parameters=parameters
 		)
\ No newline at end of file
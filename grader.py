@@ -1,8 +1,42 @@
 from abc import ABC, abstractmethod
 from base_types import *
 import execution
+import prescreen
+import telemetry
+import grading_manifest
+import case_history
+import comparators
+import collections
+import concurrent.futures
+import threading
 import time
 import tokenize
+from typing import Callable, Iterable, Tuple
+
+
+class BoundedCache(collections.OrderedDict):
+    """
+	A dictionary that evicts its least recently used entries beyond `max_size`.
+	"""
+
+    def __init__(self, max_size: int):
+        super().__init__()
+        self.max_size = max_size
+        # Test cases may be measured from several threads at once
+        self.lock = threading.RLock()
+
+    def __getitem__(self, key):
+        with self.lock:
+            value = super().__getitem__(key)
+            self.move_to_end(key)
+            return value
+
+    def __setitem__(self, key, value):
+        with self.lock:
+            super().__setitem__(key, value)
+            self.move_to_end(key)
+            while len(self) > self.max_size:
+                self.popitem(last=False)
 
 
 class Grader(ABC):
@@ -19,24 +53,190 @@ class Grader(ABC):
 		"""
         pass
 
+    # Bump when a grader's scoring changes so incremental runs re-grade everything it graded before
+    version = "1"
+
+    # Options that change the grade a grader stores, as opposed to how fast it produces it
+    scoring_options = ()
+
+    # Scoring options shared by every grader that executes solutions: timeouts decide which executions fail
+    common_scoring_options = ('timeout_policy',)
+
+    # Maximum number of distinct solution grades kept in memory, so long-lived graders stay bounded
+    grade_cache_size = 4096
+
+    def __init__(self, options: Optional[Dict[str, Any]] = None):
+        self.options = options or {}
+        # Stored per-test-case outcomes for the problem set being graded, if the caller provides them
+        self.case_history = None
+        # Grades of distinct solutions already executed during this run, shared across models and prompts
+        self.grade_cache = BoundedCache(self.options.get('grade_cache_size') or self.grade_cache_size)
+        # Measurements of optimal solutions reused across solutions, if the caller provides a cache.
+        # Benchmark runs measure the optimal solution next to each solution instead, under the same conditions.
+        self.reference_cache = self.options.get('reference_cache')
+        # Adaptive timeouts for solution executions; None keeps the fixed default timeout
+        self.timeout_policy = self.options.get('timeout_policy')
+        # Per-iteration CPU time of optimal solutions, keyed by optimal solution and test case
+        self.reference_times = {}
+
+    def fingerprint_options(self) -> Tuple[str, ...]:
+        """
+		Names of the options the grades depend on, given the other options.
+		"""
+        return self.common_scoring_options + self.scoring_options
+
+    def test_tier(self) -> Optional[str]:
+        """
+		The test tier the grades are computed on, if the grader runs only a tier of each test suite.
+		"""
+        return None
+
+    def version_fingerprint(self) -> str:
+        """
+		Identifies the grading logic a stored grade was produced with.
+		"""
+        options = [f"{name}={self.options.get(name)}" for name in self.fingerprint_options() if self.options.get(name)]
+        return ";".join([self.version] + options)
+
     @classmethod
-    def resolve_graders(cls, grader_names: List[str]) -> List['Grader']:
+    def resolve_graders(cls, grader_names: List[str], options: Optional[Dict[str, Any]] = None) -> List['Grader']:
         subclass_mapping = {subclass.identifier: subclass for subclass in cls.__subclasses__()}
         instances = []
         for grader_name in grader_names:
             subclass = subclass_mapping.get(grader_name, CorrectnessGrader)
-            instances.append(subclass())
+            instances.append(subclass(options))
         return instances
 
     @classmethod
     def run_function(cls, code: str, function_prototype: FunctionPrototype, test_case: TestCase, iterations=1,
-                     collect_cpu_time=False, collect_memory_usage=False) -> execution.FunctionExecutionResult:
+                     collect_cpu_time=False, collect_memory_usage=False,
+                     function_name=None, profile=False, profile_lines=False,
+                     memory_mode='tracemalloc', timeout=execution.DEFAULT_TIMEOUT,
+                     trusted=False) -> execution.FunctionExecutionResult:
         """
-		Runs generated Python code against a given test case.
+		Runs generated Python code against a given test case. Trusted code, i.e. only optimal solutions, runs in the
+		harness process instead of a sandboxed worker, and can only be timed, not profiled or measured for memory.
 		"""
         parameters = function_prototype.get_ordered_parameter_values(test_case)
-        return execution.execute_function(code, parameters, iterations, collect_cpu_time, collect_memory_usage)
-        pass
+        if trusted:
+            return execution.execute_trusted(code, parameters, iterations, collect_cpu_time, function_name, timeout=timeout)
+        return execution.execute_function(code, parameters, iterations, collect_cpu_time, collect_memory_usage,
+                                          function_name, profile=profile, profile_lines=profile_lines,
+                                          memory_mode=memory_mode, timeout=timeout)
+
+    def reference_key(self, problem: ProblemDefinition, test_case: TestCase):
+        return grading_manifest.hash_text(problem.optimal_solution), grading_manifest.hash_json(test_case.to_json())
+
+    def record_reference_time(self, problem: ProblemDefinition, test_case: TestCase, cpu_time: float, iterations: int):
+        self.reference_times.setdefault(self.reference_key(problem, test_case), cpu_time / iterations)
+
+    def reference_time(self, problem: ProblemDefinition, test_case: TestCase) -> Optional[float]:
+        """
+		Per-iteration CPU time of the problem's optimal solution on a test case, measured at most once per run.
+		"""
+        if not problem.optimal_solution:
+            return None
+        key = self.reference_key(problem, test_case)
+        if key not in self.reference_times:
+            results = Grader.run_function(problem.optimal_solution, problem.function_prototype, test_case,
+                                          collect_cpu_time=True, function_name=self.reference_function_name(problem),
+                                          timeout=self.timeout_policy.ceiling, trusted=True)
+            self.reference_times[key] = None if results.error else results.cpu_time
+        return self.reference_times[key]
+
+    def run_reference(self, problem: ProblemDefinition, test_case: TestCase, iterations=1,
+                      **kwargs) -> execution.FunctionExecutionResult:
+        """
+		Runs the problem's optimal solution against a test case, reusing an earlier measurement if a reference cache is set.
+		"""
+        def run():
+            return Grader.run_function(problem.optimal_solution, problem.function_prototype, test_case,
+                                       iterations=iterations, function_name=self.reference_function_name(problem),
+                                       **kwargs)
+        if self.reference_cache is None:
+            return run()
+        key = (self.reference_key(problem, test_case), iterations, tuple(sorted(kwargs.items())))
+        try:
+            results = self.reference_cache[key]
+            telemetry.count('reference_cache_hits', grader=self.identifier)
+            return results
+        except KeyError:
+            pass
+        results = run()
+        if not results.error:
+            self.reference_cache[key] = results
+        return results
+
+    def map_concurrently(self, function: Callable, items: list) -> Iterable:
+        """
+		Applies `function` to every item and returns the results in order. When executions go to a remote
+		executor with room for several at once, the items are processed concurrently; otherwise they are
+		processed one at a time as the results are consumed.
+		"""
+        concurrency = min(execution.dispatch_concurrency(), len(items))
+        if concurrency <= 1:
+            return map(function, items)
+        with concurrent.futures.ThreadPoolExecutor(concurrency) as executor:
+            return list(executor.map(function, items))
+
+    def solution_deadline(self) -> Optional[float]:
+        """
+		The monotonic time by which executions of the solution about to be graded must finish, if budgeted.
+		"""
+        if self.timeout_policy is None or self.timeout_policy.solution_budget is None:
+            return None
+        return time.monotonic() + self.timeout_policy.solution_budget
+
+    def solution_timeout(self, problem: ProblemDefinition, test_case: TestCase, iterations=1) -> float:
+        """
+		The timeout of one solution execution, before the solution's wall-clock budget is applied.
+		"""
+        if self.timeout_policy is not None and self.timeout_policy.adaptive:
+            return self.timeout_policy.timeout_for(self.reference_time(problem, test_case), iterations)
+        return execution.DEFAULT_TIMEOUT
+
+    def run_solution(self, solution: LLMSolution, problem: ProblemDefinition, test_case: TestCase,
+                     screening: prescreen.PrescreenResult, deadline: Optional[float] = None, iterations=1,
+                     **kwargs) -> execution.FunctionExecutionResult:
+        """
+		Runs a pre-screened solution against a test case, with a timeout derived from the reference runtime
+		and the remaining wall-clock budget of the solution.
+		"""
+        timeout = self.solution_timeout(problem, test_case, iterations)
+        if deadline is not None:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return execution.FunctionExecutionResult(
+                    error="Function execution skipped: the solution used up its wall-clock budget.",
+                    function_code=solution.solution_code, timed_out=True)
+            timeout = min(timeout, remaining)
+        return Grader.run_function(solution.solution_code, problem.function_prototype, test_case,
+                                   iterations=iterations, function_name=screening.function_name, timeout=timeout,
+                                   **kwargs)
+
+    @classmethod
+    def prescreen_solution(cls, problem: ProblemDefinition, solution: LLMSolution) -> prescreen.PrescreenResult:
+        """
+		Compiles the solution in the parent process and resolves the function to execute.
+		"""
+        return prescreen.prescreen_solution(problem, solution)
+
+    @classmethod
+    def prescreen_failure_grade(cls, problem: ProblemDefinition, solution: LLMSolution,
+                                result: prescreen.PrescreenResult) -> SolutionGrade:
+        """
+		A zero grade for a solution that cannot run, produced without executing it.
+		"""
+        print(f"Skipping execution for problem {problem.identifier}: {result.issue}")
+        return SolutionGrade(problem.identifier, solution.prompt_identifier, solution.model_identifier, 0, None,
+                             [Issue('prescreen', result.issue)])
+
+    @classmethod
+    def reference_function_name(cls, problem: ProblemDefinition) -> Optional[str]:
+        """
+		The function to execute from the problem's optimal solution.
+		"""
+        return prescreen.prescreen_code(problem.optimal_solution, (problem.function_prototype.function_name,)).function_name
 
     @classmethod
     def can_grade(cls, problems: List[ProblemDefinition]) -> bool:
@@ -57,97 +257,305 @@ class Grader(ABC):
 		"""
         pass
 
+    def grade_unique_solutions(self, problems: List[ProblemDefinition], solutions: List[LLMSolution],
+                               grade_solution: Callable[[ProblemDefinition, LLMSolution, prescreen.PrescreenResult],
+                                                        Optional[SolutionGrade]]) -> GradingOutput:
+        """
+		Grades each distinct solution of a problem once and fans the grade out to every solution with the same code.
+		Graders that execute code implement `grade` with it, passing their `grade_solution`, which grades a single
+		pre-screened solution. Graders that grade the code text alone, such as HalsteadGrader, don't use it.
+
+		Solutions are distinct if their normalized code or the function they resolve to differ. Grades are
+		cached on the grader, so identical code from other models or prompts later in the run is not executed again.
+		"""
+        solutionGrades = []
+        fingerprint = self.version_fingerprint()
+        for problem in problems:
+            problem_hash = None
+            for solution in solutions:
+                if solution.problem_identifier != problem.identifier:
+                    continue
+                screening = self.prescreen_solution(problem, solution)
+                if not screening.passed:
+                    solutionGrades.append(self.prescreen_failure_grade(problem, solution, screening))
+                    continue
+                problem_hash = problem_hash or grading_manifest.problem_hash(problem, self.test_tier())
+                key = (problem_hash, grading_manifest.solution_hash(solution), screening.function_name, fingerprint)
+                if key not in self.grade_cache:
+                    self.grade_cache[key] = grade_solution(problem, solution, screening)
+                else:
+                    print(f"Reusing grade of an identical solution for problem {problem.identifier}")
+                    telemetry.count('grade_cache_hits', grader=self.identifier)
+                grade = self.grade_cache[key]
+                if grade is not None:
+                    solutionGrades.append(SolutionGrade(problem.identifier, solution.prompt_identifier,
+                                                        solution.model_identifier, grade.score,
+                                                        dict(grade.sub_criteria_scores) if grade.sub_criteria_scores else grade.sub_criteria_scores,
+                                                        list(grade.issues) if grade.issues is not None else None,
+                                                        grade.profile))
+        return GradingOutput(solutionGrades, self.identifier)
+
     def __str__(self) -> str:
         return f"{self.__class__.__name__}()"
 
 
 class CorrectnessGrader(Grader):
+    """
+	Scores the fraction of correctness test cases a solution passes.
+
+	Options:
+		fail_fast: stop at the first failing or timed out test case; unrun cases count as failed.
+		case_order: 'suite', 'discriminating' or 'cheapest'; the latter two use the stored case history.
+		tier: run only the named tier of each problem's test suite, e.g. 'smoke' as computed by minimize.py.
+			Problems without a current tier of that name run their whole suite.
+	"""
+    scoring_options = ('fail_fast', 'case_order')
+
     @classmethod
     @property
     def identifier(self):
         return "correctness"
 
+    def fingerprint_options(self) -> Tuple[str, ...]:
+        # Test case order only changes scores when grading stops early
+        options = super().fingerprint_options() if self.options.get('fail_fast') else self.common_scoring_options
+        return options + ('tier',)
+
+    def test_tier(self) -> Optional[str]:
+        return self.options.get('tier')
+
     def grade(self, problems: List[ProblemDefinition], solutions: List[LLMSolution]) -> GradingOutput:
-        solutionGrades = []
-        for problem in problems:
-            function_prototype = problem.function_prototype
-            for solution in solutions:
-                number_correct = 0
-                total_tests = 0
-                issues = []
-                if solution.problem_identifier == problem.identifier:
-                    print(f"Grading problem {problem.identifier}")
-                    for test_case in problem.correctness_test_suite:
-                        execution_results = Grader.run_function(solution.solution_code, function_prototype, test_case)
-                        expected_result = function_prototype.get_return_values(test_case)
-                        actual_result = execution_results.result
-
-                        total_tests += 1
-
-                        if execution_results.error:
-                            issues.append(
-                                f"Error encountered during execution for test case {test_case}: {execution_results.error}\n{execution_results.traceback}")
-                            print(issues[-1])
-                        elif expected_result == actual_result:
-                            number_correct += 1
-                        else:
-                            issues.append(
-                                f"Test failed:\n\t{test_case}\n\tFunction prototype: {function_prototype}\n\tExpected result: {expected_result} {type(expected_result)}\n\tActual result: {actual_result} {type(actual_result)}")
-                            print(issues[-1])
-
-                    score = 0
-                    if total_tests > 0:
-                        score = number_correct / total_tests
-                    grade = SolutionGrade(problem.identifier, solution.prompt_identifier, solution.model_identifier,
-                                          score, None, issues)
-                    solutionGrades.append(grade)
-        return GradingOutput(solutionGrades, self.identifier)
+        return self.grade_unique_solutions(problems, solutions, self.grade_solution)
+
+    def grade_solution(self, problem: ProblemDefinition, solution: LLMSolution,
+                       screening: prescreen.PrescreenResult) -> Optional[SolutionGrade]:
+        fail_fast = self.options.get('fail_fast', False)
+        case_order = self.options.get('case_order') or 'suite'
+        function_prototype = problem.function_prototype
+        history = self.case_history.for_problem(problem) if self.case_history is not None else None
+        test_count = problem.test_case_count()
+        tier = self.options.get('tier')
+        tier_indices = case_history.tier_cases(problem, tier) if tier else None
+
+        print(f"Grading problem {problem.identifier}")
+        number_correct = 0
+        issues = []
+        if tier and tier_indices is None:
+            issues.append(Issue('tier', f"Problem {problem.identifier} has no '{tier}' tier for its current test suite; ran the whole suite."))
+            print(issues[-1])
+        outcomes = [None] * test_count
+        deadline = self.solution_deadline()
+
+        def run_test_case(case):
+            start_time = time.perf_counter()
+            execution_results = self.run_solution(solution, problem, case[1], screening, deadline)
+            return execution_results, time.perf_counter() - start_time
+
+        stopped = False
+        for chunk in self.test_case_chunks(problem, tier_indices, history, case_order):
+            # Failing fast only saves time if the remaining test cases haven't been started yet
+            case_results = map(run_test_case, chunk) if fail_fast else self.map_concurrently(run_test_case, chunk)
+            for (index, test_case), (execution_results, elapsed_time) in zip(chunk, case_results):
+                expected_result = comparators.resolve_sidecars(function_prototype.get_return_values(test_case), problem.data_directory)
+                actual_result = execution_results.result
+
+                passed = False
+                if execution_results.timed_out:
+                    issues.append(Issue('timeout', f"Timed out: {execution_results.error}", index))
+                    print(f"{issues[-1]}\n\tTest case: {test_case}")
+                elif execution_results.error:
+                    issues.append(Issue('error', "Error encountered during execution", index, execution_results.error_type,
+                                        {'error': execution_results.error, 'traceback': execution_results.traceback}))
+                    print(f"{issues[-1]}\n\tTest case: {test_case}")
+                elif comparators.compare(problem.comparison, expected_result, actual_result):
+                    number_correct += 1
+                    passed = True
+                else:
+                    issues.append(Issue('wrong_result', "Test failed", index, details={
+                        'expected': f"{expected_result} {type(expected_result)}",
+                        'actual': f"{actual_result} {type(actual_result)}"}))
+                    print(f"{issues[-1]}\n\tTest case: {test_case}")
+
+                outcomes[index] = passed
+                if history is not None:
+                    history.record_case(index, passed, elapsed_time)
+                if fail_fast and not passed:
+                    stopped = True
+                    break
+            if stopped:
+                break
+
+        total_tests = len(tier_indices) if tier_indices is not None else test_count
+        tests_run = sum(outcome is not None for outcome in outcomes)
+        sub_criteria_scores = None
+        if tests_run < total_tests:
+            issues.append(Issue('incomplete', f"Stopped after the first failure; {total_tests - tests_run} of {total_tests} test cases were not run."))
+        if tier_indices is not None:
+            # How far the tier's scores can be trusted, judged by solutions previously run on the whole suite
+            description = f"Ran the '{tier}' tier: {len(tier_indices)} of {test_count} test cases."
+            if history is not None:
+                agreement = case_history.tier_agreement(history.complete_outcomes(), tier_indices)
+                if agreement['solutions']:
+                    description += f" Agreement with the whole suite measured over {agreement['solutions']} earlier solution(s)."
+                    sub_criteria_scores = {'tier_rank_agreement': agreement['rank_agreement'],
+                                           'tier_pass_fail_agreement': agreement['pass_fail_agreement']}
+            issues.append(Issue('tier', description))
+        if history is not None:
+            history.record_outcomes(grading_manifest.solution_hash(solution), outcomes)
+
+        score = 0
+        if total_tests > 0:
+            score = number_correct / total_tests
+        return SolutionGrade(problem.identifier, solution.prompt_identifier, solution.model_identifier,
+                             score, sub_criteria_scores, issues)
+
+    def test_case_chunks(self, problem: ProblemDefinition, indices: Optional[List[int]], history,
+                         case_order: str) -> Iterable[List[Tuple[int, TestCase]]]:
+        """
+		The (index, test case) pairs to run, all of them or those in `indices`, in chunks of at most
+		TEST_SUITE_CHUNK_SIZE. Inline suites are ordered by `case_order` as a whole; suites in a file are
+		streamed, so their cases are only reordered within each chunk.
+		"""
+        if not problem.test_suite_file:
+            order = indices if indices is not None else list(range(len(problem.correctness_test_suite)))
+            if history is not None:
+                order = history.order(order, case_order)
+            for start in range(0, len(order), TEST_SUITE_CHUNK_SIZE):
+                yield [(index, problem.correctness_test_suite[index]) for index in order[start:start + TEST_SUITE_CHUNK_SIZE]]
+            return
+        for chunk in problem.iter_test_case_chunks(TEST_SUITE_CHUNK_SIZE, None if indices is None else set(indices)):
+            if history is not None:
+                test_cases = dict(chunk)
+                chunk = [(index, test_cases[index]) for index in history.order(list(test_cases), case_order)]
+            yield chunk
 
 
 class PerformanceGrader(Grader):
+    """
+	Scores a solution's CPU time relative to the problem's optimal solution.
+	A test case the solution times out on is charged the timeout it was given.
+
+	Options:
+		profile: profile the solution on its slowest test case and attach the stats to the grade.
+		profile_lines: also sample line-level hotspots while profiling.
+	"""
+    version = "3"
+    scoring_options = ('profile', 'profile_lines')
+
     @classmethod
     @property
     def identifier(self):
         return "performance"
 
     def grade(self, problems: List[ProblemDefinition], solutions: List[LLMSolution]) -> GradingOutput:
-        solutionGrades = []
-        for problem in problems:
-            function_prototype = problem.function_prototype
-            for solution in solutions:
-                if solution.problem_identifier == problem.identifier:
-                    print(f"Grading problem {problem.identifier}")
-                    total_solution_time = 0
-                    total_optimal_time = 0
-                    issues = []
-                    for test_case in problem.correctness_test_suite:
-                        iterations = 1  # Starting with 1 iteration
-                        while True:  # Continue running until a break condition is met
-                            solution_results = Grader.run_function(solution.solution_code, function_prototype,
-                                                                   test_case, iterations=iterations,
-                                                                   collect_cpu_time=True)
-                            optimal_results = Grader.run_function(problem.optimal_solution, function_prototype,
-                                                                  test_case, iterations=iterations,
-                                                                  collect_cpu_time=True)
-
-                            if solution_results.cpu_time is None or optimal_results.cpu_time is None:
-                                break
-
-                            total_solution_time += solution_results.cpu_time
-                            total_optimal_time += optimal_results.cpu_time
-
-                            # Check if either total time exceeds 2 seconds
-                            if total_solution_time > 0.4 or total_optimal_time > 0.4:
-                                break
-                            else:
-                                iterations *= 10  # Increase iterations by 10 times
-
-                    if total_solution_time > 0:
-                        overall_grade = min(1, total_optimal_time / total_solution_time)
-                        grade = SolutionGrade(problem.identifier, solution.prompt_identifier, solution.model_identifier,
-                                              overall_grade, None, issues)
-                        solutionGrades.append(grade)
-        return GradingOutput(solutionGrades, self.identifier)
+        return self.grade_unique_solutions(problems, solutions, self.grade_solution)
+
+    def grade_solution(self, problem: ProblemDefinition, solution: LLMSolution,
+                       screening: prescreen.PrescreenResult) -> Optional[SolutionGrade]:
+        print(f"Grading problem {problem.identifier}")
+        total_solution_time = 0
+        total_optimal_time = 0
+        issues = []
+        slowest_test_case = None
+        slowest_time = 0
+        deadline = self.solution_deadline()
+
+        def measure(case):
+            return self.measure_test_case(problem, solution, screening, case[1], deadline, case[0])
+
+        for chunk in problem.iter_test_case_chunks():
+            measurements = self.map_concurrently(measure, chunk)
+            for (index, _), (solution_time, optimal_time, iteration_time, case_issues) in zip(chunk, measurements):
+                total_solution_time += solution_time
+                total_optimal_time += optimal_time
+                issues += case_issues
+                if iteration_time is not None and iteration_time > slowest_time:
+                    slowest_test_case, slowest_time = index, iteration_time
+
+        if total_solution_time > 0:
+            overall_grade = min(1, total_optimal_time / total_solution_time)
+            profile = None
+            if self.options.get('profile') and slowest_test_case is not None:
+                profile = self.profile_solution(problem, solution, screening, slowest_test_case, slowest_time)
+                issues += self.summarize_profile(profile)
+            return SolutionGrade(problem.identifier, solution.prompt_identifier, solution.model_identifier,
+                                 overall_grade, None, issues, profile)
+        return None
+
+    def measure_test_case(self, problem: ProblemDefinition, solution: LLMSolution, screening: prescreen.PrescreenResult,
+                          test_case: TestCase, deadline: Optional[float],
+                          test_index: Optional[int] = None) -> Tuple[float, float, Optional[float], List[Issue]]:
+        """
+		Measures the solution and the optimal solution on one test case, with more iterations until either takes long
+		enough to time reliably. Returns both total CPU times, the solution's per-iteration time and any issues.
+		"""
+        total_solution_time = 0
+        total_optimal_time = 0
+        iteration_time = None
+        issues = []
+        iterations = 1  # Starting with 1 iteration
+        while True:  # Continue running until a break condition is met
+            optimal_results = self.run_reference(problem, test_case, iterations=iterations,
+                                                 collect_cpu_time=True)
+            if optimal_results.cpu_time is not None:
+                self.record_reference_time(problem, test_case, optimal_results.cpu_time, iterations)
+            solution_results = self.run_solution(solution, problem, test_case, screening, deadline,
+                                                 iterations=iterations, collect_cpu_time=True)
+
+            if optimal_results.cpu_time is None:
+                break
+            if solution_results.timed_out:
+                # The solution took at least its timeout, so it is charged that instead of dropping the test case
+                issues.append(Issue('timeout', f"Timed out at {iterations} iteration(s): {solution_results.error}", test_index))
+                total_solution_time += self.solution_timeout(problem, test_case, iterations)
+                total_optimal_time += optimal_results.cpu_time
+                break
+            if solution_results.cpu_time is None:
+                break
+
+            total_solution_time += solution_results.cpu_time
+            total_optimal_time += optimal_results.cpu_time
+            iteration_time = max(iteration_time or 0, solution_results.cpu_time / iterations)
+
+            # Check if either total time exceeds 0.4 seconds
+            if total_solution_time > 0.4 or total_optimal_time > 0.4:
+                break
+            else:
+                iterations *= 10  # Increase iterations by 10 times
+        return total_solution_time, total_optimal_time, iteration_time, issues
+
+    def profile_solution(self, problem: ProblemDefinition, solution: LLMSolution, screening: prescreen.PrescreenResult,
+                         test_case_index: int, test_case_time: Optional[float] = None) -> Optional[dict]:
+        """
+		Profiles one call of the solution on the given test case, whose measured per-iteration CPU time is `test_case_time`.
+		"""
+        results = Grader.run_function(solution.solution_code, problem.function_prototype,
+                                      problem.test_case(test_case_index),
+                                      function_name=screening.function_name, profile=True,
+                                      profile_lines=self.options.get('profile_lines', False))
+        if results.profile is None:
+            return None
+        profile = dict(results.profile)
+        profile['test_case'] = test_case_index
+        profile['test_case_time'] = test_case_time
+        return profile
+
+    @classmethod
+    def summarize_profile(cls, profile: Optional[dict], count=3) -> List[Issue]:
+        """
+		Describes the top hotspots of a profile as issues.
+		"""
+        if not profile:
+            return []
+        functions = profile.get('functions', [])
+        total_time = sum(row[2] for row in functions) or 1
+        issues = [Issue('profile', f"Profile hotspot on test case {profile['test_case']}: {name} called {calls} times, "
+                                   f"{own_time / total_time:.0%} of profiled time", profile['test_case'])
+                  for name, calls, own_time, _ in functions[:count]]
+        issues += [Issue('profile', f"Line hotspot on test case {profile['test_case']}: line {line} ({samples} samples): {source}",
+                         profile['test_case'])
+                   for line, samples, source in profile.get('lines', [])[:count]]
+        return issues
 
     def can_grade(cls, problems: List[ProblemDefinition]) -> bool:
         """
@@ -162,43 +570,108 @@ class PerformanceGrader(Grader):
 
 
 class MemoryGrader(Grader):
+    """
+	Scores a solution's memory use relative to the problem's optimal solution.
+	A solution that times out on any test case scores 0, since its memory use is unknown.
+
+	Options:
+		memory_modes: memory back ends to measure with (see execution.MEMORY_MODES). The first one
+			determines the score; with several, each mode's score is reported in sub_criteria_scores.
+	"""
+    version = "3"
+    scoring_options = ('memory_modes',)
+
+    # The metric each memory mode is scored on
+    mode_metrics = {'tracemalloc': 'peak_memory', 'rss': 'peak_rss', 'allocations': 'allocation_bytes'}
+
+    # Smallest amount each memory mode can measure, in bytes. Calls that stay below it, which is common
+    # for RSS growth, are counted at the resolution, so two calls that allocate nothing measurable
+    # compare as equal instead of leaving the test case without a ratio.
+    mode_resolutions = {'tracemalloc': 1, 'allocations': 1, 'rss': execution.RSS_RESOLUTION}
+
     @classmethod
     @property
     def identifier(self):
         return "memory"
 
+    def fingerprint_options(self) -> Tuple[str, ...]:
+        # Measuring with tracemalloc alone is what this grader has always done
+        if (self.options.get('memory_modes') or ['tracemalloc']) == ['tracemalloc']:
+            return self.common_scoring_options
+        return super().fingerprint_options()
+
     def grade(self, problems: List[ProblemDefinition], solutions: List[LLMSolution]) -> GradingOutput:
-        solutionGrades = []
-        for problem in problems:
-            function_prototype = problem.function_prototype
-            for solution in solutions:
-                if solution.problem_identifier == problem.identifier:
-                    print(f"Grading problem {problem.identifier}")
-                    total_solution_peak_memory = 0
-                    total_optimal_peak_memory = 0
-                    issues = []
-                    for test_case in problem.correctness_test_suite:
-                        iterations = 10
-                        solution_results = Grader.run_function(solution.solution_code, function_prototype, test_case,
-                                                               iterations=iterations, collect_memory_usage=True)
-                        optimal_results = Grader.run_function(problem.optimal_solution, function_prototype, test_case,
-                                                              iterations=iterations, collect_memory_usage=True)
-                        if solution_results.peak_memory is None or optimal_results.peak_memory is None:
-                            continue
-
-                        total_solution_peak_memory += solution_results.peak_memory
-                        total_optimal_peak_memory += optimal_results.peak_memory
-
-                    if total_solution_peak_memory > 0:
-                        overall_grade = min(1, total_optimal_peak_memory / total_solution_peak_memory)
-
-                        grade = SolutionGrade(problem.identifier, solution.prompt_identifier, solution.model_identifier,
-                                              overall_grade, None, issues)
-                        solutionGrades.append(grade)
-        return GradingOutput(solutionGrades, self.identifier)
+        return self.grade_unique_solutions(problems, solutions, self.grade_solution)
+
+    def grade_solution(self, problem: ProblemDefinition, solution: LLMSolution,
+                       screening: prescreen.PrescreenResult) -> Optional[SolutionGrade]:
+        print(f"Grading problem {problem.identifier}")
+        memory_modes = self.options.get('memory_modes') or ['tracemalloc']
+        mode_scores = {}
+        issues = []
+        for memory_mode in memory_modes:
+            mode_score = self.measure_memory_score(problem, solution, screening, memory_mode, issues)
+            if mode_score is not None:
+                mode_scores[memory_mode] = mode_score
+
+        if memory_modes[0] in mode_scores:
+            sub_criteria_scores = mode_scores if len(memory_modes) > 1 else None
+            return SolutionGrade(problem.identifier, solution.prompt_identifier, solution.model_identifier,
+                                 mode_scores[memory_modes[0]], sub_criteria_scores, issues)
+        return None
+
+    def measure_memory_score(self, problem: ProblemDefinition, solution: LLMSolution,
+                             screening: prescreen.PrescreenResult, memory_mode: str,
+                             issues: Optional[List[Issue]] = None) -> Optional[float]:
+        """
+		Measures the solution and the optimal solution on every test case with one memory mode.
+		Each measurement runs in a fresh executor process, so modes never influence each other.
+		The allocations mode also reports the blocks each side leaves allocated through `issues`.
+		"""
+        metric = self.mode_metrics[memory_mode]
+        resolution = self.mode_resolutions[memory_mode]
+        total_solution_memory = 0
+        total_optimal_memory = 0
+        retained_blocks = [0, 0]
+        deadline = self.solution_deadline()
+        iterations = 10
+
+        def measure(test_case):
+            solution_results = self.run_solution(solution, problem, test_case, screening, deadline,
+                                                 iterations=iterations, collect_memory_usage=True,
+                                                 memory_mode=memory_mode)
+            optimal_results = self.run_reference(problem, test_case, iterations=iterations,
+                                                 collect_memory_usage=True, memory_mode=memory_mode)
+            return solution_results, optimal_results
+
+        for chunk in problem.iter_test_case_chunks():
+            test_cases = [test_case for _, test_case in chunk]
+            for (index, _), (solution_results, optimal_results) in zip(chunk, self.map_concurrently(measure, test_cases)):
+                if solution_results.timed_out:
+                    if issues is not None:
+                        issues.append(Issue('timeout', f"Timed out measuring {memory_mode} memory: {solution_results.error}", index))
+                    return 0
+                if solution_results.memory.get(metric) is None or optimal_results.memory.get(metric) is None:
+                    continue
+
+                total_solution_memory += max(solution_results.memory[metric], resolution)
+                total_optimal_memory += max(optimal_results.memory[metric], resolution)
+                retained_blocks[0] += solution_results.memory.get('retained_blocks', 0)
+                retained_blocks[1] += optimal_results.memory.get('retained_blocks', 0)
+
+        if memory_mode == 'allocations' and issues is not None and total_solution_memory > 0:
+            issues.append(Issue('memory', f"Allocations over all test cases: the solution allocated {total_solution_memory} bytes at its peaks "
+                                          f"and left {retained_blocks[0]} blocks allocated; the optimal solution allocated "
+                                          f"{total_optimal_memory} bytes and left {retained_blocks[1]} blocks allocated."))
+        if total_solution_memory > 0:
+            return min(1, total_optimal_memory / total_solution_memory)
+        return None
 
 
 class HalsteadGrader(Grader):
+    # Halstead difficulty is computed from the source, never by executing it
+    common_scoring_options = ()
+
     @classmethod
     @property
     def identifier(self):
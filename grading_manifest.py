@@ -0,0 +1,98 @@
+from base_types import *
+import hashlib
+import io
+import tokenize
+
+def hash_text(text: str) -> str:
+	return hashlib.sha256((text or '').encode('utf-8')).hexdigest()
+
+def hash_json(data: Any) -> str:
+	return hash_text(json.dumps(data, sort_keys=True))
+
+def normalize_code(code: str) -> str:
+	"""
+	Normalizes code so that solutions differing only in layout hash identically.
+
+	The code is reduced to its token stream: comments, blank lines, line continuations and the
+	spacing between tokens are dropped and indentation and line ends are reduced to markers, while
+	string literals are kept verbatim. Code that cannot be tokenized is only normalized for line endings.
+	"""
+	code = (code or '').replace('\r\n', '\n').replace('\r', '\n')
+	ignored = (tokenize.COMMENT, tokenize.NL, tokenize.ENCODING, tokenize.ENDMARKER)
+	try:
+		tokens = [[token.type, '' if token.type in (tokenize.INDENT, tokenize.DEDENT, tokenize.NEWLINE) else token.string]
+		          for token in tokenize.generate_tokens(io.StringIO(code).readline) if token.type not in ignored]
+	except (tokenize.TokenError, IndentationError, SyntaxError):
+		return code
+	return json.dumps(tokens)
+
+def solution_hash(solution: LLMSolution) -> str:
+	return hash_text(normalize_code(solution.solution_code))
+
+def problem_hash(problem: ProblemDefinition, tier: Optional[str] = None) -> str:
+	"""
+	Hash of what grades of the problem depend on. Test tiers, which minimize.py rewrites, are left out except
+	for the definition of `tier`, the tier the grades were computed on, if any.
+	"""
+	problem_json = {key: value for key, value in problem.to_json().items() if key != 'test_tiers'}
+	if tier is not None:
+		problem_json['test_tier'] = problem.test_tiers.get(tier)
+	# The problem file only names its test suite file and sidecar files, so their contents are hashed too
+	digests = [digest for digest in (problem.test_suite_digest(), problem.sidecar_digest()) if digest is not None]
+	if digests:
+		return hash_json([problem_json, *digests])
+	return hash_json(problem_json)
+
+def entry_key(problem_identifier: str, prompt_identifier: str) -> str:
+	return f"{problem_identifier}/{prompt_identifier}"
+
+class ManifestEntry:
+	"""
+	The inputs a stored grade was computed from.
+	"""
+	def __init__(self, solution_hash: str, problem_hash: str, grader_version: str):
+		self.solution_hash = solution_hash
+		self.problem_hash = problem_hash
+		self.grader_version = grader_version
+
+	@classmethod
+	def from_json(cls, data: Dict[str, Any]) -> 'ManifestEntry':
+		return cls(data.get('solution_hash', ''), data.get('problem_hash', ''), data.get('grader_version', ''))
+
+	def to_json(self) -> Dict[str, Any]:
+		return {
+			'solution_hash': self.solution_hash,
+			'problem_hash': self.problem_hash,
+			'grader_version': self.grader_version
+		}
+
+	def __eq__(self, other) -> bool:
+		return isinstance(other, ManifestEntry) and self.to_json() == other.to_json()
+
+class GradingManifest:
+	"""
+	Records, for each stored grade of one model and grader, the hashes of the inputs it was computed from.
+	"""
+	def __init__(self, entries: Optional[Dict[str, ManifestEntry]] = None):
+		self.entries = entries or {}
+
+	@classmethod
+	def from_json(cls, data: Dict[str, Any]) -> 'GradingManifest':
+		return cls({key: ManifestEntry.from_json(entry) for key, entry in data.get('entries', {}).items()})
+
+	def to_json(self) -> Dict[str, Any]:
+		return {'entries': {key: entry.to_json() for key, entry in sorted(self.entries.items())}}
+
+	@staticmethod
+	def make_entry(problem: ProblemDefinition, solution: LLMSolution, grader_version: str, tier: Optional[str] = None) -> ManifestEntry:
+		return ManifestEntry(solution_hash(solution), problem_hash(problem, tier), grader_version)
+
+	def is_current(self, problem: ProblemDefinition, solution: LLMSolution, grader_version: str, tier: Optional[str] = None) -> bool:
+		"""
+		True if the stored grade for this solution was computed from the same solution, problem and grader.
+		"""
+		entry = self.entries.get(entry_key(solution.problem_identifier, solution.prompt_identifier))
+		return entry is not None and entry == self.make_entry(problem, solution, grader_version, tier)
+
+	def record(self, problem: ProblemDefinition, solution: LLMSolution, grader_version: str, tier: Optional[str] = None):
+		self.entries[entry_key(solution.problem_identifier, solution.prompt_identifier)] = self.make_entry(problem, solution, grader_version, tier)
@@ -0,0 +1,118 @@
+"""
+Test suite minimization: computes a small tier of each problem's correctness test suite, e.g. a fast
+"smoke" tier, from the per-test-case outcomes stored in the problem set's case history.
+
+A tier is a greedy set cover over the historical solutions that were run on the whole suite. Every
+solution that failed the suite has to fail some case of the tier, and for every pair of solutions with
+different scores the tier needs a case the better one passes and the worse one fails. Cases are then
+added while they improve how well tier scores rank the solutions like full suite scores. The tier is
+stored in the problem definition, and `benchmark.py --grade --grader correctness --tier smoke` runs only it.
+
+	python minimize.py --base_path problem_sets/bugfixing --tier smoke
+"""
+from base_types import *
+import argparse
+import os
+from typing import Set, Tuple
+import case_history
+import serialization
+from problem_index import ProblemSelection
+
+def cover_elements(outcomes: List[List[bool]]) -> Dict[Tuple, Set[int]]:
+	"""
+	The requirements a tier has to meet, each with the test cases that meet it.
+	"""
+	elements = {}
+	scores = [sum(vector) for vector in outcomes]
+	for solution, vector in enumerate(outcomes):
+		if not all(vector):
+			elements[('fails', solution)] = {index for index, passed in enumerate(vector) if not passed}
+	for a in range(len(outcomes)):
+		for b in range(len(outcomes)):
+			if scores[a] > scores[b]:
+				elements[('ranks', a, b)] = {index for index in range(len(outcomes[a])) if outcomes[a][index] and not outcomes[b][index]}
+	return elements
+
+def minimize_suite(outcomes: List[List[bool]], case_times: Dict[int, float], case_count: int) -> List[int]:
+	"""
+	Returns the sorted indices of a small subset of test cases whose scores agree with the whole suite's on
+	the historical outcome vectors. Ties prefer cases that historically ran faster.
+	"""
+	def cost(index):
+		return case_times.get(index, float('inf')), index
+
+	cases = set()
+	uncovered = cover_elements(outcomes)
+	while uncovered:
+		best = min(range(case_count), key=lambda index: (-sum(index in covering for covering in uncovered.values()), cost(index)))
+		cases.add(best)
+		uncovered = {element: covering for element, covering in uncovered.items() if best not in covering}
+
+	# Covering every pair doesn't guarantee that pass counts order the solutions the same way
+	agreement = case_history.tier_agreement(outcomes, sorted(cases))['rank_agreement'] if cases else 0.0
+	while agreement is not None and agreement < 1.0 and len(cases) < case_count:
+		candidates = [(case_history.tier_agreement(outcomes, sorted(cases | {index}))['rank_agreement'], index) for index in range(case_count) if index not in cases]
+		best_agreement, best = max(candidates, key=lambda candidate: (candidate[0], tuple(-value for value in cost(candidate[1]))))
+		if best_agreement <= agreement:
+			break
+		cases.add(best)
+		agreement = best_agreement
+
+	if not cases and case_count:
+		# Every historical solution passed every case; any one case keeps that ranking
+		cases.add(min(range(case_count), key=cost))
+	return sorted(cases)
+
+def minimize_problem_set(base_path: str, tier: str, selection: Optional[ProblemSelection] = None, dry_run: bool = False) -> Dict[str, Dict[str, Any]]:
+	"""
+	Computes the tier of every problem with history and writes it into the problem files whose tier changed.
+	Returns the tier and its historical agreement per problem identifier.
+	"""
+	history = serialization.get_case_history(base_path)
+	index = serialization.get_problem_index(base_path)
+	results = {}
+	for file_name, problem_json in serialization.get_problems_json(base_path, index.select(selection)).items():
+		problem = ProblemDefinition.from_json(problem_json)
+		problem.data_directory = serialization.get_data_directory(base_path)
+		problem_history = history.problems.get(problem.identifier)
+		if problem_history is None or problem_history.suite_hash != case_history.suite_hash(problem):
+			print(f"{problem.identifier}: no history for the current test suite; grade it with the whole suite first")
+			continue
+		outcomes = problem_history.complete_outcomes()
+		if not outcomes:
+			print(f"{problem.identifier}: no solution was run on every test case; grade without --fail-fast or --tier first")
+			continue
+		case_times = {index: stats.mean_time for index, stats in problem_history.cases.items() if stats.mean_time is not None}
+		cases = minimize_suite(outcomes, case_times, problem.test_case_count())
+		agreement = case_history.tier_agreement(outcomes, cases)
+		results[problem.identifier] = {'cases': cases, **agreement}
+		print(f"{problem.identifier}: {len(cases)} of {problem.test_case_count()} test cases; "
+			  f"rank agreement {agreement['rank_agreement']:.0%}, pass/fail agreement {agreement['pass_fail_agreement']:.0%} "
+			  f"over {agreement['solutions']} historical solution(s)")
+
+		definition = {'cases': cases, 'suite_hash': problem_history.suite_hash}
+		if dry_run or problem_json.get('test_tiers', {}).get(tier) == definition:
+			continue
+		problem_json.setdefault('test_tiers', {})[tier] = definition
+		serialization.write_json_atomically(os.path.join(base_path, "problems", file_name), problem_json)
+	return results
+
+def main():
+	parser = argparse.ArgumentParser(description="Compute a minimal tier of each problem's correctness test suite from historical test case outcomes.")
+	parser.add_argument('--base_path', nargs='+', required=True, help="The problem set(s) to minimize.")
+	parser.add_argument('--tier', default='smoke', help="Name of the tier to write into the problem definitions. Default: smoke")
+	parser.add_argument('--tags', nargs='+', default=None, help="Only minimize problems with any of these tags.")
+	parser.add_argument('--problems', nargs='+', default=None, metavar='PATTERN', help="Only minimize problems whose identifier matches any of these glob patterns or regular expressions.")
+	parser.add_argument('--dry-run', action='store_true', help="Print the tiers without writing them.")
+	args = parser.parse_args()
+
+	selection = None
+	if args.tags is not None or args.problems is not None:
+		selection = ProblemSelection(args.tags, args.problems)
+	for base_path in args.base_path:
+		results = minimize_problem_set(base_path, args.tier, selection, args.dry_run)
+		kept = sum(len(result['cases']) for result in results.values())
+		print(f"{base_path}: minimized {len(results)} problem(s)" + (f"; the '{args.tier}' tier keeps {kept} test case(s)" if results else ""))
+
+if __name__ == "__main__":
+	main()
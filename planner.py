@@ -0,0 +1,182 @@
+"""
+Run planning: the work items of a --generate/--grade run, with wall time and token estimates from the
+durations and sizes of earlier runs, and longest-expected-first scheduling of those items.
+
+Generation items are one (model, problem, prompt) query each; grading items are one (model, grader,
+problem) group of solutions, the unit `grade_solutions` grades and checkpoints at once. Estimates fall
+back from the item's own history to the mean of its model or grader, and then to fixed defaults, so a
+plan can be made before any run.
+"""
+from base_types import *
+import concurrent.futures
+import heapq
+import math
+from grading_manifest import entry_key
+
+# Rough size of a token in characters, for prompts and responses without recorded token counts
+CHARS_PER_TOKEN = 4
+
+# Estimates for work nothing comparable was ever timed for
+DEFAULT_GENERATION_SECONDS = 20.0
+DEFAULT_GRADING_SECONDS = 2.0
+DEFAULT_COMPLETION_TOKENS = 300
+
+def estimate_tokens(text: str) -> int:
+	return math.ceil(len(text or '') / CHARS_PER_TOKEN)
+
+class WorkTimings:
+	"""
+	Durations and token counts of a problem set's work items as of their latest run.
+	`generation` maps a model to 'problem/prompt' keys, `grading` a grader to problem identifiers.
+	"""
+	def __init__(self, generation: Optional[Dict[str, Dict[str, Dict[str, float]]]] = None, grading: Optional[Dict[str, Dict[str, Dict[str, float]]]] = None):
+		self.generation = generation or {}
+		self.grading = grading or {}
+
+	@classmethod
+	def from_json(cls, data: Dict[str, Any]) -> 'WorkTimings':
+		return cls(data.get('generation', {}), data.get('grading', {}))
+
+	def to_json(self) -> Dict[str, Any]:
+		return {
+			'generation': self.generation,
+			'grading': self.grading
+		}
+
+	def record_generation(self, model_identifier: str, problem_identifier: str, prompt_identifier: str, seconds: float, prompt_tokens: int, completion_tokens: int):
+		self.generation.setdefault(model_identifier, {})[entry_key(problem_identifier, prompt_identifier)] = {
+			'seconds': seconds, 'prompt_tokens': prompt_tokens, 'completion_tokens': completion_tokens}
+
+	def record_grading(self, grader_identifier: str, problem_identifier: str, seconds: float, solutions: int):
+		if solutions:
+			self.grading.setdefault(grader_identifier, {})[problem_identifier] = {'seconds_per_solution': seconds / solutions}
+
+	def generation_estimate(self, model_identifier: str, problem_identifier: str, prompt_identifier: str) -> Optional[Dict[str, float]]:
+		items = self.generation.get(model_identifier, {})
+		item = items.get(entry_key(problem_identifier, prompt_identifier))
+		if item is not None:
+			return item
+		if not items:
+			return None
+		# Another prompt of the same model is a better guess than nothing
+		return {field: sum(other[field] for other in items.values()) / len(items) for field in ('seconds', 'completion_tokens')}
+
+	def grading_estimate(self, grader_identifier: str, problem_identifier: str) -> Optional[float]:
+		items = self.grading.get(grader_identifier, {})
+		if problem_identifier in items:
+			return items[problem_identifier]['seconds_per_solution']
+		if not items:
+			return None
+		return sum(item['seconds_per_solution'] for item in items.values()) / len(items)
+
+class WorkItem:
+	def __init__(self, kind: str, base_path: str, model_identifier: str, problem_identifier: str, seconds: float,
+			prompt_identifier: Optional[str] = None, grader_identifier: Optional[str] = None, solutions: int = 0,
+			prompt_tokens: int = 0, completion_tokens: int = 0, estimated_from: str = 'history'):
+		self.kind = kind
+		self.base_path = base_path
+		self.model_identifier = model_identifier
+		self.problem_identifier = problem_identifier
+		self.prompt_identifier = prompt_identifier
+		self.grader_identifier = grader_identifier
+		self.solutions = solutions
+		self.seconds = seconds
+		self.prompt_tokens = prompt_tokens
+		self.completion_tokens = completion_tokens
+		# 'history' for the item's own earlier run, 'similar' for its model's or grader's mean, 'test case times'
+		# for the problem's recorded correctness test case times, 'default' otherwise
+		self.estimated_from = estimated_from
+
+	def __str__(self) -> str:
+		subject = self.prompt_identifier if self.kind == 'generate' else f"{self.grader_identifier}, {self.solutions} solution(s)"
+		return f"{self.kind} {self.base_path} {self.model_identifier} {self.problem_identifier} ({subject}): {format_duration(self.seconds)} [{self.estimated_from}]"
+
+def generation_item(base_path: str, model_identifier: str, problem_input: LLMProblemInput, prompt_text: str,
+		timings: WorkTimings, solution_lengths: Dict[str, List[int]]) -> WorkItem:
+	estimate = timings.generation_estimate(model_identifier, problem_input.problem_id, problem_input.prompt_id)
+	own = estimate is not None and 'prompt_tokens' in estimate
+	prompt_tokens = estimate['prompt_tokens'] if own else estimate_tokens(prompt_text)
+	if estimate is not None:
+		completion_tokens = estimate['completion_tokens']
+	elif solution_lengths.get(problem_input.problem_id):
+		# Other models' solutions to the problem are about as long as this model's will be
+		lengths = solution_lengths[problem_input.problem_id]
+		completion_tokens = math.ceil(sum(lengths) / len(lengths) / CHARS_PER_TOKEN)
+	else:
+		completion_tokens = DEFAULT_COMPLETION_TOKENS
+	return WorkItem('generate', base_path, model_identifier, problem_input.problem_id,
+		estimate['seconds'] if estimate is not None else DEFAULT_GENERATION_SECONDS, prompt_identifier=problem_input.prompt_id,
+		prompt_tokens=round(prompt_tokens), completion_tokens=round(completion_tokens),
+		estimated_from='history' if own else 'similar' if estimate is not None else 'default')
+
+def grading_item(base_path: str, model_identifier: str, grader_identifier: str, problem: ProblemDefinition, solutions: int,
+		timings: WorkTimings, problem_history=None) -> WorkItem:
+	per_solution = timings.grading_estimate(grader_identifier, problem.identifier)
+	estimated_from = 'history' if problem.identifier in timings.grading.get(grader_identifier, {}) else 'similar'
+	if per_solution is None and problem_history is not None and problem_history.cases:
+		# The recorded test case times are a lower bound: they leave out worker startup and result parsing
+		per_solution = sum(stats.mean_time or 0.0 for stats in problem_history.cases.values())
+		estimated_from = 'test case times'
+	if per_solution is None:
+		per_solution = DEFAULT_GRADING_SECONDS
+		estimated_from = 'default'
+	return WorkItem('grade', base_path, model_identifier, problem.identifier, per_solution * solutions,
+		grader_identifier=grader_identifier, solutions=solutions, estimated_from=estimated_from)
+
+def longest_first(items: list, seconds) -> list:
+	"""
+	Orders work for dispatch with the longest expected item first. Started in this order on several
+	workers, the short items at the end fill the gaps, instead of one long item making a long tail.
+	"""
+	return sorted(items, key=lambda item: -seconds(item))
+
+def dispatch_longest_first(function, items: list, seconds, workers: int):
+	"""
+	Applies `function` to the items, longest expected first, on up to `workers` threads, and yields the
+	results as they complete. With one worker the items are processed one at a time as results are consumed.
+	"""
+	ordered = longest_first(items, seconds)
+	if workers <= 1 or len(ordered) <= 1:
+		yield from map(function, ordered)
+		return
+	with concurrent.futures.ThreadPoolExecutor(min(workers, len(ordered))) as executor:
+		# The executor starts submitted items in order, so the longest ones start first
+		futures = [executor.submit(function, item) for item in ordered]
+		for future in concurrent.futures.as_completed(futures):
+			yield future.result()
+
+def makespan(durations: List[float], workers: int) -> float:
+	"""
+	Wall time of running the durations in the given order, each on the first worker to become free.
+	"""
+	loads = [0.0] * max(1, workers)
+	for duration in durations:
+		heapq.heapreplace(loads, loads[0] + duration)
+	return max(loads)
+
+def format_duration(seconds: float) -> str:
+	if seconds < 60:
+		return f"{seconds:.1f}s"
+	if seconds < 3600:
+		return f"{seconds / 60:.1f}min"
+	return f"{seconds / 3600:.1f}h"
+
+def print_plan(items: List[WorkItem], workers: int, longest: int = 10):
+	generation = [item for item in items if item.kind == 'generate']
+	grading = [item for item in items if item.kind == 'grade']
+	# Generation queries one model at a time; grading items are dispatched longest first across the workers
+	generation_seconds = sum(item.seconds for item in generation)
+	grading_seconds = makespan([item.seconds for item in longest_first(grading, lambda item: item.seconds)], workers)
+	print(f"Generation: {len(generation)} item(s), about {format_duration(generation_seconds)}, "
+		  f"{sum(item.prompt_tokens for item in generation)} prompt and {sum(item.completion_tokens for item in generation)} completion tokens")
+	print(f"Grading: {len(grading)} item(s) with {sum(item.solutions for item in grading)} solution(s), "
+		  f"about {format_duration(grading_seconds)} on {workers} worker(s) ({format_duration(sum(item.seconds for item in grading))} of work)")
+	for kind, kind_items in (('generate', generation), ('grade', grading)):
+		sources = {source: sum(item.estimated_from == source for item in kind_items) for source in ('history', 'similar', 'test case times', 'default')}
+		if kind_items:
+			print(f"  {kind} estimates: " + ', '.join(f"{count} from {source}" for source, count in sources.items() if count))
+	print(f"Estimated wall time: {format_duration(generation_seconds + grading_seconds)}")
+	if items:
+		print("Longest items:")
+		for item in longest_first(items, lambda item: item.seconds)[:longest]:
+			print(f"  {item}")
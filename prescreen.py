@@ -0,0 +1,133 @@
+from base_types import *
+from typing import Tuple
+import ast
+import functools
+import re
+
+# The executor prepends this to every solution; compile errors are reported relative to the solution itself
+PRESCREEN_PREFIX = "from typing import *\n\n"
+PRESCREEN_PREFIX_LINES = PRESCREEN_PREFIX.count('\n')
+
+class PrescreenResult:
+	"""
+	Outcome of statically checking a solution in the parent process before it is executed.
+	"""
+	def __init__(self, function_name: Optional[str] = None, issue: Optional[str] = None):
+		self.function_name = function_name
+		self.issue = issue
+
+	@property
+	def passed(self) -> bool:
+		return self.issue is None
+
+	def __repr__(self):
+		return f"<PrescreenResult function_name={self.function_name} issue={self.issue}>"
+
+def expected_function_names(problem: ProblemDefinition, prompt_identifier: str) -> Tuple[str, ...]:
+	"""
+	Returns the function names the model may have implemented for the given prompt, most likely first.
+	Genericized prompts present the model with the generic prototype instead of the problem's own.
+	"""
+	function_prototype = problem.function_prototype
+	if function_prototype is None:
+		return ()
+	for prompt in problem.prompts:
+		if prompt.prompt_id == prompt_identifier and prompt.genericize:
+			return (function_prototype.genericize().function_name, function_prototype.function_name)
+	return (function_prototype.function_name,)
+
+def _block_bodies(statement) -> List[list]:
+	# Bindings in a top-level block still end up in the module namespace
+	bodies = [getattr(statement, 'body', []), getattr(statement, 'orelse', []), getattr(statement, 'finalbody', [])]
+	return bodies + [handler.body for handler in getattr(statement, 'handlers', [])]
+
+def _target_names(target) -> List[str]:
+	if isinstance(target, ast.Name):
+		return [target.id]
+	if isinstance(target, (ast.Tuple, ast.List)):
+		return [name for element in target.elts for name in _target_names(element)]
+	if isinstance(target, ast.Starred):
+		return _target_names(target.value)
+	return []
+
+def _defined_callables(statements) -> List[str]:
+	"""
+	Names of the top-level functions, classes and lambdas, in definition order.
+	"""
+	names = []
+	for statement in statements:
+		if isinstance(statement, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+			names.append(statement.name)
+		elif isinstance(statement, ast.Assign) and isinstance(statement.value, ast.Lambda):
+			names += [name for target in statement.targets for name in _target_names(target)]
+		elif isinstance(statement, (ast.If, ast.Try, ast.With)):
+			for body in _block_bodies(statement):
+				names += _defined_callables(body)
+	return names
+
+def _bound_names(statements) -> List[str]:
+	"""
+	Every name bound at the top level: definitions, assignment targets and imports.
+	"""
+	names = []
+	for statement in statements:
+		if isinstance(statement, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+			names.append(statement.name)
+		elif isinstance(statement, ast.Assign):
+			names += [name for target in statement.targets for name in _target_names(target)]
+		elif isinstance(statement, (ast.AnnAssign, ast.AugAssign)) and getattr(statement, 'value', None) is not None:
+			names += _target_names(statement.target)
+		elif isinstance(statement, ast.Import):
+			names += [alias.asname or alias.name.split('.')[0] for alias in statement.names]
+		elif isinstance(statement, ast.ImportFrom):
+			names += [alias.asname or alias.name for alias in statement.names if alias.name != '*']
+		elif isinstance(statement, (ast.If, ast.Try, ast.With, ast.For, ast.While)):
+			for body in _block_bodies(statement):
+				names += _bound_names(body)
+	return names
+
+@functools.lru_cache(maxsize=4096)
+def prescreen_code(code: str, function_names: Tuple[str, ...] = ()) -> PrescreenResult:
+	"""
+	Compiles the code once and resolves the function that should be executed.
+
+	The first of `function_names` bound at the top level is preferred, however it is bound: defined,
+	assigned (`add = functools.lru_cache(None)(_add)`) or imported. If none is, the last function, class
+	or lambda defined at the top level is used, matching the executor's fallback; if there is none of
+	those either but the code binds other names, the executor resolves the function at run time.
+	Code that cannot run at all (empty, syntax errors, leftover Markdown, no bindings) is reported through `issue`.
+	"""
+	if code is None or not code.strip():
+		return PrescreenResult(issue="Solution is empty.")
+
+	try:
+		tree = compile(PRESCREEN_PREFIX + code, '<string>', 'exec', ast.PyCF_ONLY_AST)
+		compile(tree, '<string>', 'exec')
+	except (SyntaxError, ValueError) as e:
+		if isinstance(e, SyntaxError) and e.lineno is not None:
+			e.lineno -= PRESCREEN_PREFIX_LINES
+			if e.end_lineno is not None:
+				e.end_lineno -= PRESCREEN_PREFIX_LINES
+			# Some messages repeat the line number, e.g. "unterminated string literal (detected at line 4)"
+			e.msg = re.sub(r'\(detected at line (\d+)\)', lambda match: f"(detected at line {int(match.group(1)) - PRESCREEN_PREFIX_LINES})", e.msg)
+		if '```' in code:
+			return PrescreenResult(issue=f"Solution contains leftover Markdown and does not compile: {e}")
+		return PrescreenResult(issue=f"Solution does not compile: {e}")
+
+	bound_names = _bound_names(tree.body[1:])
+	for function_name in function_names:
+		if function_name in bound_names:
+			return PrescreenResult(function_name=function_name)
+	callables = _defined_callables(tree.body[1:])
+	if callables:
+		return PrescreenResult(function_name=callables[-1])
+	if bound_names:
+		return PrescreenResult()
+	expected = ' or '.join(f"'{name}'" for name in function_names) or 'a function'
+	return PrescreenResult(issue=f"Solution does not define a callable (expected {expected}).")
+
+def prescreen_solution(problem: ProblemDefinition, solution: LLMSolution) -> PrescreenResult:
+	"""
+	Pre-screens an LLM solution against the function the problem asked for.
+	"""
+	return prescreen_code(solution.solution_code, expected_function_names(problem, solution.prompt_identifier))
@@ -0,0 +1,123 @@
+from base_types import *
+import fnmatch
+import os
+import re
+from typing import Tuple
+
+# Bumped when the entries change shape, so stale indexes are rebuilt rather than misread
+INDEX_VERSION = 1
+
+class IndexEntry:
+	"""
+	What selecting a problem needs to know about one problem file, and the file signature it was read at.
+	"""
+	def __init__(self, identifier: str, tags: List[str], prompt_ids: List[str], mtime_ns: int, size: int):
+		self.identifier = identifier
+		self.tags = tags
+		self.prompt_ids = prompt_ids
+		self.mtime_ns = mtime_ns
+		self.size = size
+
+	@classmethod
+	def from_json(cls, data: Dict[str, Any]) -> 'IndexEntry':
+		return cls(data.get('identifier', ''), data.get('tags', []), data.get('prompt_ids', []), data.get('mtime_ns', 0), data.get('size', 0))
+
+	def to_json(self) -> Dict[str, Any]:
+		return {
+			'identifier': self.identifier,
+			'tags': self.tags,
+			'prompt_ids': self.prompt_ids,
+			'mtime_ns': self.mtime_ns,
+			'size': self.size
+		}
+
+class ProblemIndex:
+	"""
+	The identifiers, tags and prompt IDs of a problem set's problem files, keyed by file name.
+	Refreshing only parses files that are new or whose modification time or size changed.
+	"""
+	def __init__(self, entries: Optional[Dict[str, IndexEntry]] = None):
+		self.entries = entries or {}
+
+	@classmethod
+	def from_json(cls, data: Dict[str, Any]) -> 'ProblemIndex':
+		if data.get('version') != INDEX_VERSION:
+			return cls()
+		return cls({file_name: IndexEntry.from_json(entry) for file_name, entry in data.get('entries', {}).items()})
+
+	def to_json(self) -> Dict[str, Any]:
+		return {
+			'version': INDEX_VERSION,
+			'entries': {file_name: entry.to_json() for file_name, entry in sorted(self.entries.items())}
+		}
+
+	def refresh(self, problems_directory: str) -> bool:
+		"""
+		Brings the index up to date with the problem files on disk and returns whether it changed.
+		"""
+		changed = False
+		present = set()
+		for entry in os.scandir(problems_directory):
+			if entry.name.startswith('.') or not entry.is_file():
+				continue
+			present.add(entry.name)
+			stat = entry.stat()
+			indexed = self.entries.get(entry.name)
+			if indexed is not None and (indexed.mtime_ns, indexed.size) == (stat.st_mtime_ns, stat.st_size):
+				continue
+			with open(entry.path) as f:
+				problem_json = json.load(f)
+			self.entries[entry.name] = IndexEntry(problem_json.get('identifier', ''), problem_json.get('tags') or [],
+				[prompt.get('prompt_id', '') for prompt in problem_json.get('prompts', [])], stat.st_mtime_ns, stat.st_size)
+			changed = True
+		for file_name in set(self.entries) - present:
+			del self.entries[file_name]
+			changed = True
+		return changed
+
+	def select(self, selection: Optional['ProblemSelection']) -> List[str]:
+		"""
+		The sorted names of the problem files that `selection` selects, all of them if it is None.
+		"""
+		return sorted(file_name for file_name, entry in self.entries.items() if selection is None or selection.selects_problem(entry))
+
+class ProblemSelection:
+	"""
+	A subset of a run's work items given by tags, problem identifiers and prompt IDs. Identifiers and
+	prompt IDs are matched against glob patterns and regular expressions, tags by name regardless of
+	case. Each given filter has to match; a problem is selected if any of its tags and any of its
+	prompt IDs match.
+	"""
+	def __init__(self, tags: Optional[List[str]] = None, problems: Optional[List[str]] = None, prompts: Optional[List[str]] = None):
+		self.tags = tags
+		self.problems = problems
+		self.prompts = prompts
+		self.tag_names = {tag.casefold() for tag in tags or []}
+		self.problem_patterns = [compile_pattern(pattern) for pattern in problems or []]
+		self.prompt_patterns = [compile_pattern(pattern) for pattern in prompts or []]
+
+	def selects_problem(self, entry: IndexEntry) -> bool:
+		if self.tags is not None and not self.tag_names & {tag.casefold() for tag in entry.tags}:
+			return False
+		if self.problems is not None and not matches_any(self.problem_patterns, entry.identifier):
+			return False
+		return self.prompts is None or any(self.selects_prompt(prompt_id) for prompt_id in entry.prompt_ids)
+
+	def selects_prompt(self, prompt_identifier: str) -> bool:
+		return self.prompts is None or matches_any(self.prompt_patterns, prompt_identifier)
+
+	def __repr__(self):
+		return f"<ProblemSelection tags={self.tags} problems={self.problems} prompts={self.prompts}>"
+
+def compile_pattern(pattern: str) -> Tuple[str, Optional['re.Pattern']]:
+	"""
+	Compiles a pattern that matches identifiers either as a glob or as a regular expression.
+	Patterns that aren't valid regular expressions, such as '*_sort', are only used as globs.
+	"""
+	try:
+		return pattern, re.compile(pattern)
+	except re.error:
+		return pattern, None
+
+def matches_any(patterns: List[Tuple[str, Optional['re.Pattern']]], identifier: str) -> bool:
+	return any(fnmatch.fnmatchcase(identifier, glob) or (regex is not None and regex.fullmatch(identifier)) for glob, regex in patterns)
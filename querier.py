@@ -1,11 +1,22 @@
 from abc import ABC, abstractmethod
-from typing import Dict, List, Union, Optional, Any
+from typing import Dict, List, Union, Optional, Any, Tuple
 from base_types import *
 import openai
 import os
 import sys
 import subprocess
 import re
+import time
+import planner
+
+try:
+	import tiktoken
+except ImportError:
+	tiktoken = None
+
+# Attempts after the first for a request that failed with a transient API error, and the delay before the first retry
+MAX_RETRIES = 3
+RETRY_DELAY = 2.0
 
 class AIModelQuerier(ABC):
 	"""
@@ -76,6 +87,37 @@ class AIModelQuerier(ABC):
 	
 		return prompt_text
 
+	def count_tokens(self, text: str) -> Tuple[int, bool]:
+		"""
+		The number of tokens in `text` for this model, and whether the number is only estimated from its length.
+		"""
+		if tiktoken is not None:
+			try:
+				return len(tiktoken.encoding_for_model(self.model_identifier).encode(text or '')), False
+			except KeyError:
+				pass
+		return planner.estimate_tokens(text), True
+
+	def generation_feedback(self, prompt: str, response: str, latency: Optional[float], time_to_first_token: Optional[float] = None,
+			retries: int = 0, usage: Optional[Dict[str, int]] = None) -> Dict[str, Any]:
+		"""
+		The `feedback` of a generated solution: token counts, latency and retries of the request that produced it.
+		Token counts come from the API's usage data if given, and are counted locally otherwise.
+		"""
+		if usage is not None:
+			prompt_tokens, completion_tokens, estimated = usage['prompt_tokens'], usage['completion_tokens'], False
+		else:
+			(prompt_tokens, prompt_estimated), (completion_tokens, completion_estimated) = self.count_tokens(prompt), self.count_tokens(response)
+			estimated = prompt_estimated or completion_estimated
+		return {'generation': {
+			'prompt_tokens': prompt_tokens,
+			'completion_tokens': completion_tokens,
+			'tokens_estimated': estimated,
+			'time_to_first_token': time_to_first_token,
+			'latency': latency,
+			'retries': retries
+		}}
+
 	def __str__(self) -> str:
 		return f"{self.__class__.__name__}(model_identifier={self.model_identifier})"
 
@@ -92,6 +134,7 @@ class HumanAIModelQuerier(AIModelQuerier):
 		process.communicate(prompt)
 		process.wait()
 
+		start_time = time.perf_counter()
 		lines = []
 		try:
 			for line in sys.stdin:
@@ -100,8 +143,8 @@ class HumanAIModelQuerier(AIModelQuerier):
 			pass
 		response = "".join(lines)
 
-		
-		return LLMSolution(problem_input.problem_id, self.model_identifier, problem_input.prompt_id, response)
+		feedback = self.generation_feedback(prompt, response, time.perf_counter() - start_time)
+		return LLMSolution(problem_input.problem_id, self.model_identifier, problem_input.prompt_id, response, feedback)
 
 class OpenAIModelQuerier(AIModelQuerier):
 	@classmethod
@@ -135,37 +178,80 @@ class OpenAIModelQuerier(AIModelQuerier):
 		
 		return response
 
-	def generate_solution(self, problem_input: LLMProblemInput) -> 'LLMSolution':
+	def render_prompt(self, problem_input: LLMProblemInput) -> str:
 		prompt = AIModelQuerier.construct_textual_prompt(problem_input)
 		
 		# Add additional instructions for automated prompting
 		prompt += "\n\nAfter analyzing the problem, provide your solution in a Markdown code block. Do not include tests in the Markdown code block. The last Markdown code block in your response will be directly executed for testing."
+		return prompt
+
+	def request_body(self, prompt: str) -> Tuple[str, Dict[str, Any]]:
+		"""
+		The API endpoint and request body that query the model with `prompt`, as in an OpenAI batch file.
+		"""
+		if self.is_chat_based_model():
+			return "/v1/chat/completions", {"model": self.model_identifier, "max_tokens": 1000, "messages": [{"role": "user", "content": prompt}]}
+		return "/v1/completions", {"model": self.model_identifier, "max_tokens": 1000, "prompt": prompt}
+
+	def generate_solution(self, problem_input: LLMProblemInput) -> 'LLMSolution':
+		prompt = self.render_prompt(problem_input)
 		
 		print(f"***Prompt:\n{prompt}")
 
-		# Send the prompt to the OpenAI API
+		# Send the prompt to the OpenAI API, retrying transient failures with exponential backoff
+		transient_errors = (openai.error.RateLimitError, openai.error.APIError, openai.error.Timeout,
+							openai.error.ServiceUnavailableError, openai.error.APIConnectionError)
+		retries = 0
+		while True:
+			start_time = time.perf_counter()
+			try:
+				response, time_to_first_token, usage = self.query(prompt, start_time)
+				break
+			except transient_errors as e:
+				if retries == MAX_RETRIES:
+					raise
+				delay = RETRY_DELAY * 2 ** retries
+				retries += 1
+				print(f"Request failed ({e}); retry {retries} of {MAX_RETRIES} in {delay:.0f}s")
+				time.sleep(delay)
+		latency = time.perf_counter() - start_time
+
+		print(f"***Response:\n{response}")
+		solution = self.extract_code(response)
+		
+		print(f"***Extracted solution:\n{solution}")
+		feedback = self.generation_feedback(prompt, response, latency, time_to_first_token, retries, usage)
+		return LLMSolution(problem_input.problem_id, self.model_identifier, problem_input.prompt_id, solution, feedback)
+
+	def query(self, prompt: str, start_time: float) -> Tuple[str, Optional[float], Optional[Dict[str, int]]]:
+		"""
+		Sends one request and returns the response text, the seconds until its first token arrived and the
+		API's token usage. Chat models stream their response, which times the first token but reports no usage.
+		"""
 		if self.is_chat_based_model():
 			messages = [{"role": "user", "content": prompt}]
-			response = openai.ChatCompletion.create(
+			chunks = openai.ChatCompletion.create(
 				model=self.model_identifier,
 				max_tokens=1000,
-				messages = messages)
+				messages = messages,
+				stream=True)
 			
-			# Extract the generated code
-			response = response.choices[0].message.content
+			# Collect the generated text as it arrives
+			parts = []
+			time_to_first_token = None
+			for chunk in chunks:
+				content = chunk.choices[0].delta.get('content')
+				if content:
+					if time_to_first_token is None:
+						time_to_first_token = time.perf_counter() - start_time
+					parts.append(content)
+			return "".join(parts), time_to_first_token, None
 			
-		else:		
-			response = openai.Completion.create(
-				engine=self.model_identifier,
-				prompt=prompt,
-				max_tokens=1000
-			)
-			
-			# Extract the generated code
-			response = response.choices[0].text
-
-		print(f"***Response:\n{response}")
-		solution = self.extract_code(response)
-		
-		print(f"***Extracted solution:\n{solution}")
-		return LLMSolution(problem_input.problem_id, self.model_identifier, problem_input.prompt_id, solution)
+		response = openai.Completion.create(
+			engine=self.model_identifier,
+			prompt=prompt,
+			max_tokens=1000
+		)
+		usage = response.get('usage')
+		usage = {'prompt_tokens': usage['prompt_tokens'], 'completion_tokens': usage['completion_tokens']} if usage else None
+		return response.choices[0].text, None, usage
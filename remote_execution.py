@@ -0,0 +1,361 @@
+"""
+Executor worker daemons and the client-side pool that dispatches executions to them.
+
+A daemon serves execution jobs over a Unix or TCP socket and runs each one with execution.execute_locally
+in its own fresh worker process, exactly as a local run would. Start one per box (or several on one box):
+
+	python remote_execution.py --listen unix:/tmp/executor-1.sock
+	python remote_execution.py --listen 0.0.0.0:7100 --concurrency 8
+
+and point the benchmark at them with `--workers unix:/tmp/executor-1.sock otherhost:7100`.
+Daemons execute whatever code they are sent, so only expose them on trusted networks.
+
+Every message is a frame of one type byte and a four-byte big-endian payload length, followed by the
+payload: a four-byte big-endian length and that many bytes of UTF-8 JSON, then the raw bytes of the numeric
+NumPy arrays the JSON refers to. Arrays, such as results of vectorized solutions, are thereby sent as their
+memory rather than as JSON text. Everything else is JSON, which, unlike pickle, is safe to decode from any peer.
+"""
+import argparse
+import json
+import os
+import socket
+import socketserver
+import struct
+import threading
+import time
+from typing import *
+import execution
+try:
+	import numpy as np
+except ImportError:
+	np = None
+
+MESSAGE_PING = 1
+MESSAGE_PONG = 2
+MESSAGE_EXECUTE = 3
+MESSAGE_RESULT = 4
+MESSAGE_ERROR = 5
+
+FRAME_HEADER = struct.Struct('!BI')
+JSON_LENGTH = struct.Struct('!I')
+# Key of the JSON object that stands for an array sent as raw bytes
+ARRAY_KEY = '__ndarray__'
+MAX_PAYLOAD_SIZE = 256 * 1024 * 1024
+
+# Seconds to wait for a health check answer, and between health checks of each worker
+PING_TIMEOUT = 2.0
+HEALTH_CHECK_INTERVAL = 5.0
+
+# Seconds a worker may take beyond an execution's own timeout to start it and send back its result
+EXECUTE_TIMEOUT_MARGIN = 10.0
+
+class ProtocolError(Exception):
+	pass
+
+class JobError(Exception):
+	"""
+	A worker answered, but could not run the job it was sent.
+	"""
+	pass
+
+def parse_address(address: str) -> Tuple[int, Any]:
+	"""
+	Parses 'unix:PATH' or 'HOST:PORT' into a socket family and address.
+	"""
+	if address.startswith('unix:'):
+		return socket.AF_UNIX, address[len('unix:'):]
+	host, separator, port = address.rpartition(':')
+	if not separator or not port.isdigit():
+		raise ValueError(f"Invalid worker address '{address}': expected unix:PATH or HOST:PORT.")
+	return socket.AF_INET, (host or '127.0.0.1', int(port))
+
+def receive_exactly(connection: socket.socket, size: int) -> Optional[bytes]:
+	chunks = []
+	while size > 0:
+		chunk = connection.recv(min(size, 1024 * 1024))
+		if not chunk:
+			return None
+		chunks.append(chunk)
+		size -= len(chunk)
+	return b''.join(chunks)
+
+def encode_payload(payload: Dict[str, Any]) -> List[bytes]:
+	buffers = []
+	offset = 0
+
+	def encode_array(value):
+		nonlocal offset
+		if np is not None and isinstance(value, np.ndarray) and value.dtype.kind in 'biuf':
+			value = np.ascontiguousarray(value)
+			buffers.append(memoryview(value).cast('B'))
+			offset += value.nbytes
+			return {ARRAY_KEY: [offset - value.nbytes, value.nbytes], 'dtype': value.dtype.str, 'shape': list(value.shape)}
+		if np is not None and isinstance(value, (np.ndarray, np.generic)):
+			return value.tolist()
+		raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+	data = json.dumps(payload, separators=(',', ':'), default=encode_array).encode('utf-8')
+	return [JSON_LENGTH.pack(len(data)), data] + buffers
+
+def decode_payload(data: bytes) -> Dict[str, Any]:
+	(size,) = JSON_LENGTH.unpack_from(data)
+	arrays = memoryview(data)[JSON_LENGTH.size + size:]
+
+	def decode_array(value):
+		if ARRAY_KEY not in value:
+			return value
+		if np is None:
+			raise ProtocolError("Received a NumPy array, but NumPy isn't installed.")
+		start, length = value[ARRAY_KEY]
+		return np.frombuffer(arrays[start:start + length], dtype=np.dtype(value['dtype'])).reshape(value['shape'])
+
+	return json.loads(data[JSON_LENGTH.size:JSON_LENGTH.size + size].decode('utf-8'), object_hook=decode_array)
+
+def send_message(connection: socket.socket, message_type: int, payload: Dict[str, Any]):
+	parts = encode_payload(payload)
+	connection.sendall(FRAME_HEADER.pack(message_type, sum(len(part) for part in parts)) + parts[0] + parts[1])
+	for buffer in parts[2:]:
+		connection.sendall(buffer)
+
+def receive_message(connection: socket.socket) -> Optional[Tuple[int, Dict[str, Any]]]:
+	"""
+	Reads one message. Returns None if the peer closed the connection before a new message started.
+	"""
+	header = receive_exactly(connection, FRAME_HEADER.size)
+	if header is None:
+		return None
+	message_type, size = FRAME_HEADER.unpack(header)
+	if size > MAX_PAYLOAD_SIZE:
+		raise ProtocolError(f"Message of {size} bytes exceeds the maximum of {MAX_PAYLOAD_SIZE} bytes.")
+	data = receive_exactly(connection, size)
+	if data is None:
+		raise ProtocolError("Connection closed in the middle of a message.")
+	return message_type, decode_payload(data)
+
+class WorkerServer:
+	"""
+	Runs execution jobs received over a socket, at most `concurrency` at a time.
+	"""
+	def __init__(self, address: str, concurrency: int = 1):
+		self.address = address
+		self.concurrency = concurrency
+		self.slots = threading.Semaphore(concurrency)
+		self.lock = threading.Lock()
+		# Jobs received and not yet answered, running or waiting for a slot
+		self.queue_depth = 0
+		self.server = None
+
+	def status(self) -> Dict[str, Any]:
+		return {'queue_depth': self.queue_depth, 'concurrency': self.concurrency, 'pid': os.getpid()}
+
+	def execute(self, job: Dict[str, Any]) -> Dict[str, Any]:
+		with self.lock:
+			self.queue_depth += 1
+		try:
+			with self.slots:
+				return execution.execute_locally(**job).to_json(arrays=True)
+		finally:
+			with self.lock:
+				self.queue_depth -= 1
+
+	def handle_connection(self, connection: socket.socket):
+		while True:
+			try:
+				message = receive_message(connection)
+			except (OSError, ProtocolError, ValueError):
+				return
+			if message is None:
+				return
+			message_type, payload = message
+			if message_type == MESSAGE_PING:
+				send_message(connection, MESSAGE_PONG, self.status())
+			elif message_type == MESSAGE_EXECUTE:
+				try:
+					result = self.execute(payload)
+				except Exception as e:
+					send_message(connection, MESSAGE_ERROR, {'error': str(e)})
+					continue
+				send_message(connection, MESSAGE_RESULT, {'execution': result, **self.status()})
+			else:
+				send_message(connection, MESSAGE_ERROR, {'error': f"Unknown message type {message_type}."})
+
+	def serve_forever(self):
+		family, address = parse_address(self.address)
+		worker = self
+
+		class RequestHandler(socketserver.BaseRequestHandler):
+			def handle(self):
+				worker.handle_connection(self.request)
+
+		if family == socket.AF_UNIX:
+			if os.path.exists(address):
+				os.unlink(address)
+			self.server = socketserver.ThreadingUnixStreamServer(address, RequestHandler)
+		else:
+			socketserver.ThreadingTCPServer.allow_reuse_address = True
+			self.server = socketserver.ThreadingTCPServer(address, RequestHandler)
+		self.server.daemon_threads = True
+		print(f"Executor worker {os.getpid()} listening on {self.address} with concurrency {self.concurrency}")
+		try:
+			self.server.serve_forever()
+		finally:
+			self.server.server_close()
+			if family == socket.AF_UNIX and os.path.exists(address):
+				os.unlink(address)
+
+	def shutdown(self):
+		if self.server is not None:
+			self.server.shutdown()
+
+class WorkerEndpoint:
+	"""
+	The client-side view of one worker daemon: its address, health and last reported queue depth.
+	"""
+	def __init__(self, address: str):
+		self.address = address
+		self.family, self.socket_address = parse_address(address)
+		self.healthy = True
+		self.queue_depth = 0
+		self.concurrency = 1
+		self.in_flight = 0
+		self.last_checked = 0.0
+
+	def connect(self, timeout: Optional[float]) -> socket.socket:
+		connection = socket.socket(self.family, socket.SOCK_STREAM)
+		connection.settimeout(timeout)
+		try:
+			connection.connect(self.socket_address)
+			if self.family == socket.AF_INET:
+				connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+				# Notices a remote box that disappeared without closing the connection
+				connection.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+		except OSError:
+			connection.close()
+			raise
+		return connection
+
+	def request(self, message_type: int, payload: Dict[str, Any], timeout: Optional[float]) -> Dict[str, Any]:
+		with self.connect(timeout) as connection:
+			send_message(connection, message_type, payload)
+			message = receive_message(connection)
+		if message is None:
+			raise ProtocolError(f"Worker {self.address} closed the connection without answering.")
+		response_type, response = message
+		if response_type == MESSAGE_ERROR:
+			raise JobError(f"Worker {self.address} could not run the job: {response.get('error')}")
+		self.queue_depth = response.get('queue_depth', self.queue_depth)
+		self.concurrency = response.get('concurrency', self.concurrency)
+		return response
+
+	def ping(self) -> bool:
+		self.last_checked = time.monotonic()
+		try:
+			self.request(MESSAGE_PING, {}, PING_TIMEOUT)
+			self.healthy = True
+		except (OSError, ProtocolError, JobError, ValueError):
+			self.healthy = False
+		return self.healthy
+
+	@property
+	def load(self) -> int:
+		return self.queue_depth + self.in_flight
+
+	def execute_timeout(self, job_timeout: float, margin: float) -> float:
+		"""
+		How long to wait for the answer to a job sent to this worker: the job may wait for a slot behind the
+		jobs ahead of it, each taking at most `job_timeout` seconds, and then runs for at most as long itself.
+		"""
+		jobs_ahead = max(0, self.load - 1)
+		return job_timeout * (1 + jobs_ahead // max(1, self.concurrency)) + margin
+
+	def __repr__(self):
+		return f"<WorkerEndpoint address={self.address} healthy={self.healthy} queue_depth={self.queue_depth} in_flight={self.in_flight}>"
+
+class WorkerPool:
+	"""
+	Dispatches executions to the least loaded healthy worker daemon, re-dispatching a job to another
+	worker if its worker dies, becomes unreachable or doesn't answer within the job's timeout plus
+	`timeout_margin` seconds. Executions may be dispatched from several threads at once.
+	Use with execution.configure_remote_executor.
+	"""
+	def __init__(self, addresses: List[str], health_check_interval: float = HEALTH_CHECK_INTERVAL,
+			timeout_margin: float = EXECUTE_TIMEOUT_MARGIN):
+		if not addresses:
+			raise ValueError("A worker pool needs at least one worker address.")
+		self.endpoints = [WorkerEndpoint(address) for address in addresses]
+		self.health_check_interval = health_check_interval
+		self.timeout_margin = timeout_margin
+		self.lock = threading.Lock()
+
+	@property
+	def concurrency(self) -> int:
+		"""
+		The number of executions the healthy workers can run at the same time.
+		"""
+		return max(1, sum(endpoint.concurrency for endpoint in self.endpoints if endpoint.healthy))
+
+	def check_health(self) -> List[WorkerEndpoint]:
+		for endpoint in self.endpoints:
+			endpoint.ping()
+		return [endpoint for endpoint in self.endpoints if endpoint.healthy]
+
+	def choose(self, excluded: Set[str]) -> Optional[WorkerEndpoint]:
+		now = time.monotonic()
+		candidates = []
+		for endpoint in self.endpoints:
+			if endpoint.address in excluded:
+				continue
+			# Unhealthy workers are checked again periodically, so restarted daemons rejoin the pool
+			if now - endpoint.last_checked > self.health_check_interval:
+				endpoint.ping()
+			if endpoint.healthy:
+				candidates.append(endpoint)
+		if not candidates:
+			return None
+		with self.lock:
+			endpoint = min(candidates, key=lambda endpoint: endpoint.load)
+			endpoint.in_flight += 1
+		return endpoint
+
+	def execute(self, job: Dict[str, Any]) -> execution.FunctionExecutionResult:
+		failures = []
+		excluded = set()
+		while True:
+			endpoint = self.choose(excluded)
+			if endpoint is None:
+				error = "No executor worker is available."
+				if failures:
+					error += " " + " ".join(failures)
+				return execution.FunctionExecutionResult(error=error, function_code=job.get('function_code'), parameters=job.get('parameters'))
+			try:
+				# A worker that is still silent after this is hung or unreachable, and the job goes to another one
+				timeout = endpoint.execute_timeout(job.get('timeout', execution.DEFAULT_TIMEOUT), self.timeout_margin)
+				response = endpoint.request(MESSAGE_EXECUTE, job, timeout)
+				return execution.FunctionExecutionResult.from_json(response.get('execution', {}), job.get('function_code'), job.get('parameters'))
+			except JobError as e:
+				return execution.FunctionExecutionResult(error=str(e), function_code=job.get('function_code'), parameters=job.get('parameters'))
+			except (OSError, ProtocolError, ValueError) as e:
+				endpoint.healthy = False
+				endpoint.last_checked = time.monotonic()
+				excluded.add(endpoint.address)
+				failures.append(f"{endpoint.address}: {e}")
+			finally:
+				with self.lock:
+					endpoint.in_flight -= 1
+
+def main():
+	parser = argparse.ArgumentParser(description="Serve execution jobs to benchmark runs over a socket.")
+	parser.add_argument('--listen', required=True, help="Address to listen on: unix:PATH or HOST:PORT.")
+	parser.add_argument('--concurrency', type=int, default=os.cpu_count() or 1, help="Maximum number of executions run at the same time. Default: the number of CPUs.")
+	parser.add_argument('--preload', nargs='*', default=execution.DEFAULT_PRELOAD_MODULES, help="Modules executor workers import once, before running any solution.")
+	args = parser.parse_args()
+
+	execution.configure_workers(args.preload)
+	server = WorkerServer(args.listen, args.concurrency)
+	try:
+		server.serve_forever()
+	except KeyboardInterrupt:
+		pass
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,45 @@
+from base_types import *
+
+def generation_key(base_path: str, model_identifier: str, problem_identifier: str, prompt_identifier: str) -> str:
+	return '/'.join([base_path, model_identifier, problem_identifier, prompt_identifier])
+
+def grading_key(base_path: str, model_identifier: str, grader_identifier: str, problem_identifier: str, prompt_identifier: str) -> str:
+	return '/'.join([base_path, model_identifier, grader_identifier, problem_identifier, prompt_identifier])
+
+class RunManifest:
+	"""
+	Records the work items a generate/grade run has completed, so an interrupted run can be resumed
+	with `--resume <run_id>` and continue writing to the same reports.
+	"""
+	def __init__(self, run_id: str, arguments: Optional[List[str]] = None, generated: Optional[List[str]] = None, graded: Optional[List[str]] = None):
+		self.run_id = run_id
+		self.arguments = arguments or []
+		self.generated = set(generated or [])
+		self.graded = set(graded or [])
+
+	@classmethod
+	def from_json(cls, data: Dict[str, Any]) -> 'RunManifest':
+		completed = data.get('completed', {})
+		return cls(data.get('run_id', ''), data.get('arguments', []), completed.get('generate', []), completed.get('grade', []))
+
+	def to_json(self) -> Dict[str, Any]:
+		return {
+			'run_id': self.run_id,
+			'arguments': self.arguments,
+			'completed': {
+				'generate': sorted(self.generated),
+				'grade': sorted(self.graded)
+			}
+		}
+
+	def is_generated(self, base_path: str, model_identifier: str, problem_identifier: str, prompt_identifier: str) -> bool:
+		return generation_key(base_path, model_identifier, problem_identifier, prompt_identifier) in self.generated
+
+	def mark_generated(self, base_path: str, solution: LLMSolution):
+		self.generated.add(generation_key(base_path, solution.model_identifier, solution.problem_identifier, solution.prompt_identifier))
+
+	def is_graded(self, base_path: str, grader_identifier: str, solution: LLMSolution) -> bool:
+		return grading_key(base_path, solution.model_identifier, grader_identifier, solution.problem_identifier, solution.prompt_identifier) in self.graded
+
+	def mark_graded(self, base_path: str, grader_identifier: str, solution: LLMSolution):
+		self.graded.add(grading_key(base_path, solution.model_identifier, grader_identifier, solution.problem_identifier, solution.prompt_identifier))
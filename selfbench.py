@@ -0,0 +1,194 @@
+"""
+Benchmarks of the harness itself: how much time the framework spends around the code under test.
+
+Every benchmark runs against a synthetic problem set of configurable size whose solutions are trivial, so
+nearly all measured time is framework overhead. Microbenchmarks time single operations (starting an
+execution, rewriting a report, loading problems, converting test case values); the macrobenchmark grades
+the whole synthetic set for correctness and saves the grades and report, like a --grade run.
+
+	python selfbench.py --save-baseline selfbench-baseline.json
+	python selfbench.py --baseline selfbench-baseline.json --threshold 0.2
+
+Results are JSON. Compared with a baseline, every benchmark whose median is more than `threshold` slower
+is reported as a regression and the command exits with status 1.
+"""
+from base_types import *
+import argparse
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import execution
+import grader
+import serialization
+
+SYNTHETIC_MODEL = "selfbench"
+
+def synthetic_problem_json(index: int, cases: int, prompts: int) -> Dict[str, Any]:
+	return {
+		'identifier': f'problem_{index}',
+		'description': 'Return the sum of a list of integers, plus an offset.',
+		'function_prototype': {
+			'function_name': 'offset_sum',
+			'parameters': [{'name': 'values', 'type': 'List[int]'}, {'name': 'offset', 'type': 'int'}],
+			'return_values': [{'type': 'int'}]
+		},
+		'correctness_test_suite': [{'input': {'values': str(list(range(case % 7))), 'offset': case}, 'expected_output': [sum(range(case % 7)) + case]} for case in range(cases)],
+		'tags': ['Synthetic'],
+		'prompts': [{'prompt_id': f'prompt_{prompt}', 'prompt': 'Implement offset_sum.'} for prompt in range(prompts)]
+	}
+
+def make_problem_set(base_path: str, problems: int, cases: int, prompts: int):
+	"""
+	Writes a synthetic problem set with trivial solutions from the synthetic model.
+	"""
+	for index in range(problems):
+		problem_json = synthetic_problem_json(index, cases, prompts)
+		serialization.write_json_atomically(os.path.join(base_path, "problems", f"problem_{index}.json"), problem_json)
+		for prompt_index, prompt in enumerate(problem_json['prompts']):
+			# Distinct code per prompt, so duplicate detection doesn't skip any executions
+			serialization.save_solution(base_path, LLMSolution(problem_json['identifier'], SYNTHETIC_MODEL, prompt['prompt_id'],
+				f"def offset_sum(values, offset):\n    return sum(values) + offset + 0 * {prompt_index}\n"))
+
+def measure(function, repeat: int) -> List[float]:
+	samples = []
+	for _ in range(repeat):
+		start_time = time.perf_counter()
+		function()
+		samples.append(time.perf_counter() - start_time)
+	return samples
+
+def summarize(samples: List[float], unit: str = 's', **extra) -> Dict[str, Any]:
+	return {'median': statistics.median(samples), 'min': min(samples), 'max': max(samples), 'samples': len(samples), 'unit': unit, **extra}
+
+def bench_execute_function(base_path: str, repeat: int) -> Dict[str, Any]:
+	# The time around a trivial call: worker start, file round trips and result parsing
+	execution_results = []
+	samples = measure(lambda: execution_results.append(execution.execute_function("def f(x):\n    return x\n", [1], 1, True, False, 'f')), repeat)
+	code_time = statistics.median(r.cpu_time for r in execution_results if r.cpu_time is not None)
+	return summarize(samples, code_under_test=code_time)
+
+def bench_update_report(base_path: str, repeat: int) -> Dict[str, Any]:
+	report_path = os.path.join(base_path, "reports", "report-update.json")
+	solutions = serialization.get_solutions(base_path, SYNTHETIC_MODEL)
+	grades = GradingOutput([SolutionGrade(s.problem_identifier, s.prompt_identifier, s.model_identifier, 1.0, None, []) for s in solutions], "correctness")
+	for solution_grade in grades.solution_grades:
+		serialization.update_report(base_path, grades, solution_grade, report_path)
+	# Rewriting a report that already holds every grade of the set, as the last grades of a run do
+	samples = measure(lambda: serialization.update_report(base_path, grades, grades.solution_grades[-1], report_path), repeat)
+	return summarize(samples, report_grades=len(grades.solution_grades), report_bytes=os.path.getsize(report_path))
+
+def bench_get_problems(base_path: str, repeat: int) -> Dict[str, Any]:
+	problems = []
+	samples = measure(lambda: problems.append(len(serialization.get_problems(base_path))), repeat)
+	return summarize(samples, problems=problems[0])
+
+def bench_get_python_type(base_path: str, repeat: int) -> Dict[str, Any]:
+	# Converting every test case's parameters and expected results, as the graders do for each execution
+	problems = serialization.get_problems(base_path)
+
+	def convert():
+		for problem in problems:
+			for test_case in problem.correctness_test_suite:
+				problem.function_prototype.get_parameter_values(test_case)
+				problem.function_prototype.get_return_values(test_case)
+
+	cases = sum(len(problem.correctness_test_suite) for problem in problems)
+	return summarize(measure(convert, repeat), test_cases=cases)
+
+def bench_grade_correctness(base_path: str, repeat: int) -> Dict[str, Any]:
+	# The whole grading phase of a run for one grader: load, grade, save grades and the report
+	executions = []
+
+	def grade():
+		problems = serialization.get_problems(base_path)
+		solutions = serialization.get_solutions(base_path, SYNTHETIC_MODEL)
+		report_path = os.path.join(base_path, "reports", f"report-grade-{len(executions)}.json")
+		grades = grader.CorrectnessGrader().grade(problems, solutions)
+		serialization.save_grades(base_path, grades, report_path)
+		cases = {p.identifier: len(p.correctness_test_suite) for p in problems}
+		executions.append(sum(cases[s.problem_identifier] for s in solutions))
+
+	samples = measure(grade, repeat)
+	return summarize(samples, executions=executions[0], per_execution=statistics.median(samples) / max(1, executions[0]))
+
+MICROBENCHMARKS = {
+	'execute_function': bench_execute_function,
+	'update_report': bench_update_report,
+	'get_problems': bench_get_problems,
+	'get_python_type': bench_get_python_type,
+}
+
+MACROBENCHMARKS = {
+	'grade_correctness': bench_grade_correctness,
+}
+
+def run_benchmarks(names: List[str], problems: int, cases: int, prompts: int, repeat: int) -> Dict[str, Any]:
+	benchmarks = {**MICROBENCHMARKS, **MACROBENCHMARKS}
+	base_path = tempfile.mkdtemp(prefix="selfbench-")
+	try:
+		make_problem_set(base_path, problems, cases, prompts)
+		results = {}
+		for name in names:
+			print(f"Running {name}…", file=sys.stderr)
+			# Grading runs every test case of every solution, so it is repeated less
+			results[name] = benchmarks[name](base_path, repeat if name in MICROBENCHMARKS else max(1, repeat // 10))
+	finally:
+		shutil.rmtree(base_path, ignore_errors=True)
+	return {
+		'configuration': {'problems': problems, 'cases': cases, 'prompts': prompts, 'repeat': repeat},
+		'environment': {'python': platform.python_version(), 'platform': platform.platform(), 'cpus': os.cpu_count()},
+		'benchmarks': results
+	}
+
+def find_regressions(results: Dict[str, Any], baseline: Dict[str, Any], threshold: float) -> List[str]:
+	regressions = []
+	if baseline.get('configuration') != results.get('configuration'):
+		print("Warning: the baseline was measured with a different configuration; comparisons may not be meaningful.", file=sys.stderr)
+	for name, result in results['benchmarks'].items():
+		base = baseline.get('benchmarks', {}).get(name)
+		if base is None or not base.get('median'):
+			continue
+		change = result['median'] / base['median'] - 1
+		if change > threshold:
+			regressions.append(f"{name}: median {result['median']:.6f}{result['unit']} vs baseline {base['median']:.6f}{base['unit']} ({change:+.0%})")
+	return regressions
+
+def main():
+	benchmark_names = list(MICROBENCHMARKS) + list(MACROBENCHMARKS)
+	parser = argparse.ArgumentParser(description="Measure the benchmark harness's own overhead on a synthetic problem set.")
+	parser.add_argument('--only', nargs='+', default=benchmark_names, choices=benchmark_names, help="Benchmarks to run. Default: all of them.")
+	parser.add_argument('--problems', type=int, default=20, help="Problems in the synthetic problem set.")
+	parser.add_argument('--cases', type=int, default=5, help="Correctness test cases per problem.")
+	parser.add_argument('--prompts', type=int, default=2, help="Prompts, and so solutions, per problem.")
+	parser.add_argument('--repeat', type=int, default=20, help="Samples per microbenchmark; the macrobenchmark takes a tenth as many.")
+	parser.add_argument('--output', default=None, metavar='PATH', help="Write the results to this JSON file.")
+	parser.add_argument('--save-baseline', default=None, metavar='PATH', help="Write the results as a baseline to compare later runs with.")
+	parser.add_argument('--baseline', default=None, metavar='PATH', help="Compare the results with this baseline and exit with status 1 on regressions.")
+	parser.add_argument('--threshold', type=float, default=0.2, help="Relative slowdown of a median beyond which a benchmark counts as regressed. Default: 0.2")
+	parser.add_argument('--preload', nargs='*', default=execution.DEFAULT_PRELOAD_MODULES, help="Modules executor workers import once, as for benchmark.py.")
+	args = parser.parse_args()
+
+	execution.configure_workers(args.preload)
+	results = run_benchmarks(args.only, args.problems, args.cases, args.prompts, args.repeat)
+	for name, result in results['benchmarks'].items():
+		details = ', '.join(f"{key}={value:.6g}" if isinstance(value, float) else f"{key}={value}" for key, value in result.items() if key not in ('median', 'min', 'max', 'samples', 'unit'))
+		print(f"{name}: median {result['median'] * 1000:.3f} ms over {result['samples']} sample(s)" + (f" ({details})" if details else ""))
+	for path in (args.output, args.save_baseline):
+		if path:
+			serialization.write_json_atomically(path, results)
+
+	if args.baseline:
+		with open(args.baseline) as f:
+			regressions = find_regressions(results, json.load(f), args.threshold)
+		for regression in regressions:
+			print(f"Regression: {regression}")
+		if regressions:
+			sys.exit(1)
+		print(f"No regressions beyond {args.threshold:.0%} of the baseline.")
+
+if __name__ == "__main__":
+	main()
@@ -1,11 +1,32 @@
 from base_types import *
+from grading_manifest import GradingManifest
+from case_history import CaseHistory, ProblemCaseHistory
+from run_manifest import RunManifest
+from problem_index import ProblemIndex, ProblemSelection
+from planner import WorkTimings
+import math
 import os
 import pathlib
+import sharding
+import telemetry
+from typing import Callable
 
-def get_problems_json(basePath: str):
+def write_json_atomically(path: str, data, indent=4):
+	# A run that dies mid-write leaves either the old or the new file behind, never a partial one
+	pathlib.Path(os.path.dirname(path) or '.').mkdir(parents=True, exist_ok=True)
+	# Hidden, so listings of solutions and grades skip leftovers of an interrupted write
+	temporary_path = os.path.join(os.path.dirname(path), '.' + os.path.basename(path) + '.tmp')
+	with open(temporary_path, 'w') as f:
+		json.dump(data, f, indent=indent)
+		telemetry.count('bytes_written', f.tell())
+	os.replace(temporary_path, path)
+
+def get_problems_json(basePath: str, file_names: Optional[List[str]] = None):
 	problemsJSON = {}
 	problemsDirectory = os.path.join(basePath, "problems")
-	for problem_file in [file for file in sorted(os.listdir(problemsDirectory)) if not file.startswith('.')]:
+	if file_names is None:
+		file_names = [file for file in sorted(os.listdir(problemsDirectory)) if not file.startswith('.')]
+	for problem_file in file_names:
 		problemPath = os.path.join(problemsDirectory, problem_file)
 		print(f'Loading {problemPath}…')
 		with open(problemPath) as f:
@@ -13,8 +34,31 @@ def get_problems_json(basePath: str):
 		problemsJSON[problem_file] = problemJSON
 	return problemsJSON		
 
-def get_problems(basePath: str):
-	return [ProblemDefinition.from_json(x) for x in get_problems_json(basePath).values()]
+def get_problems(basePath: str, selection: Optional[ProblemSelection] = None):
+	file_names = None
+	if selection is not None:
+		file_names = get_problem_index(basePath).select(selection)
+	problems = [ProblemDefinition.from_json(x) for x in get_problems_json(basePath, file_names).values()]
+	for problem in problems:
+		problem.data_directory = get_data_directory(basePath)
+	return problems
+
+def get_data_directory(basePath: str):
+	# Sidecar files of expected outputs and test suite files
+	return os.path.join(basePath, "data")
+
+def get_problem_index_path(basePath: str):
+	return os.path.join(basePath, "index.json")
+
+def get_problem_index(basePath: str):
+	path = get_problem_index_path(basePath)
+	index = ProblemIndex()
+	if os.path.exists(path):
+		with open(path) as f:
+			index = ProblemIndex.from_json(json.loads(f.read()))
+	if index.refresh(os.path.join(basePath, "problems")):
+		write_json_atomically(path, index.to_json(), indent=None)
+	return index
 
 def save_solution(basePath: str, solution: LLMSolution):
 	directoryPath = os.path.join(basePath, "solutions", solution.model_identifier, solution.problem_identifier)
@@ -22,11 +66,10 @@ def save_solution(basePath: str, solution: LLMSolution):
 	path = os.path.join(directoryPath, solution.prompt_identifier + ".json")
 	
 	# print(path)
-	with open(path, 'w') as f:
-		jsonString = json.dumps(solution.to_json(), indent=4)
-		f.write(jsonString)
+	write_json_atomically(path, solution.to_json())
 
-def get_solutions(basePath: str, model_identifier: str):
+def get_solutions(basePath: str, model_identifier: str, include: Optional[Callable[[str, str], bool]] = None):
+	# `include` takes a problem and a prompt identifier; solutions it rejects aren't read at all
 	solutions = []
 	solutionsDirectory = os.path.join(basePath, "solutions", model_identifier)
 
@@ -35,6 +78,8 @@ def get_solutions(basePath: str, model_identifier: str):
 			problemDirectory = os.path.join(solutionsDirectory, problemName)
 	
 			for solution_file in [file for file in sorted(os.listdir(problemDirectory)) if not file.startswith('.')]:
+				if include is not None and not include(problemName, solution_file[:-len('.json')]):
+					continue
 				solutionPath = os.path.join(problemDirectory, solution_file)
 				# print(solutionPath)
 				with open(solutionPath) as f:
@@ -43,16 +88,88 @@ def get_solutions(basePath: str, model_identifier: str):
 	return solutions		
 
 
+def new_report():
+	return {
+		"Problem Sets": {},
+		"Average Scores Per Problem Set": {},
+		"Average Scores Per Criterion": {}
+	}
+
+def compute_report_averages(report):
+	# fsum is exactly rounded, so averages don't depend on the order grades were added in
+	report["Average Scores Per Problem Set"] = {}
+	for problem_set_name, graders in report["Problem Sets"].items():
+		all_scores = [problem["score"] for grader in graders.values() for problem in grader]
+		if all_scores:
+			report["Average Scores Per Problem Set"][problem_set_name] = math.fsum(all_scores) / len(all_scores)
+
+	report["Average Scores Per Criterion"] = {}
+	for graders in report["Problem Sets"].values():
+		for grader_identifier in graders:
+			if grader_identifier in report["Average Scores Per Criterion"]:
+				continue
+			all_scores_for_grader = [problem["score"] for pset in report["Problem Sets"].values() for problem in pset.get(grader_identifier, [])]
+			report["Average Scores Per Criterion"][grader_identifier] = math.fsum(all_scores_for_grader) / len(all_scores_for_grader) if all_scores_for_grader else 0
+
+	if report.get("Generation"):
+		report["Generation Per Model"] = compute_generation_summary(report)
+	return report
+
+def compute_generation_summary(report):
+	"""
+	Token counts, latency and throughput of each model's generated solutions in the report, with the tokens
+	spent per problem that at least one of the model's solutions fully solved, as judged by the correctness grader.
+	"""
+	summary = {}
+	metrics_by_model = {}
+	for problem_set_name, models in report["Generation"].items():
+		for model_identifier, solutions in models.items():
+			for solution_key, metrics in solutions.items():
+				metrics_by_model.setdefault(model_identifier, []).append((problem_set_name, solution_key.split('/', 1)[0], metrics))
+	for model_identifier, entries in sorted(metrics_by_model.items()):
+		metrics = [m for _, _, m in entries]
+		prompt_tokens = sum(m.get('prompt_tokens') or 0 for m in metrics)
+		completion_tokens = sum(m.get('completion_tokens') or 0 for m in metrics)
+		latencies = [m['latency'] for m in metrics if m.get('latency') is not None]
+		first_token_times = [m['time_to_first_token'] for m in metrics if m.get('time_to_first_token') is not None]
+		solved = {(problem_set_name, grade["problem_identifier"]) for problem_set_name, graders in report["Problem Sets"].items()
+			for grade in graders.get("correctness", []) if grade.get("model_identifier") == model_identifier and grade["score"] == 1}
+		generated = {(problem_set_name, problem_identifier) for problem_set_name, problem_identifier, _ in entries}
+		graded = any(graders.get("correctness") for graders in report["Problem Sets"].values())
+		summary[model_identifier] = {
+			"solutions": len(metrics),
+			"prompt_tokens": prompt_tokens,
+			"completion_tokens": completion_tokens,
+			"estimated_token_counts": sum(1 for m in metrics if m.get('tokens_estimated')),
+			"mean_latency": math.fsum(latencies) / len(latencies) if latencies else None,
+			"mean_time_to_first_token": math.fsum(first_token_times) / len(first_token_times) if first_token_times else None,
+			"completion_tokens_per_second": completion_tokens / math.fsum(latencies) if latencies and math.fsum(latencies) > 0 else None,
+			"retries": sum(m.get('retries') or 0 for m in metrics),
+			"solved_problems": len(solved & generated) if graded else None,
+			"tokens_per_solved_problem": (prompt_tokens + completion_tokens) / len(solved & generated) if graded and solved & generated else None
+		}
+	return summary
+
+def get_report(report_path: str):
+	with open(report_path, 'r') as f:
+		return json.load(f)
+
+def save_report(report, report_path: str):
+	# Reports are rewritten after every graded problem, so they are written without indentation
+	write_json_atomically(report_path, report, indent=None)
+
 def update_report(basePath: str, grades: GradingOutput, solutionGrade: SolutionGrade, current_report_path: str):
+	update_report_grades(basePath, grades, [solutionGrade], current_report_path)
+
+def update_report_grades(basePath: str, grades: GradingOutput, solution_grades: List[SolutionGrade], current_report_path: str):
+	"""
+	Adds solution grades to the report with one rewrite of the report file. Long issue details are
+	interned into the report's "Issue Text" table, which keeps only the text some grade still refers to.
+	"""
 	if os.path.exists(current_report_path):
-			with open(current_report_path, 'r') as f:
-				report = json.load(f)
+		report = get_report(current_report_path)
 	else:
-		report = {
-			"Problem Sets": {},
-			"Average Scores Per Problem Set": {},
-			"Average Scores Per Criterion": {}
-		}
+		report = new_report()
 
 	problem_set_name = basePath
 	if problem_set_name not in report["Problem Sets"]:
@@ -60,24 +177,70 @@ def update_report(basePath: str, grades: GradingOutput, solutionGrade: SolutionG
 	if grades.grader_identifier not in report["Problem Sets"][problem_set_name]:
 		report["Problem Sets"][problem_set_name][grades.grader_identifier] = []
 
-	report["Problem Sets"][problem_set_name][grades.grader_identifier].append(solutionGrade.to_json())
+	# A resumed run may grade a solution again; its latest grade replaces the earlier one
+	solution_keys = {(g.problem_identifier, g.prompt_identifier, g.model_identifier) for g in solution_grades}
+	grader_grades = [g for g in report["Problem Sets"][problem_set_name][grades.grader_identifier] if (g["problem_identifier"], g["prompt_identifier"], g["model_identifier"]) not in solution_keys]
+	texts = report.setdefault("Issue Text", {})
+	grader_grades += [solutionGrade.to_json(texts) for solutionGrade in solution_grades]
+	report["Problem Sets"][problem_set_name][grades.grader_identifier] = grader_grades
+	prune_issue_text(report)
 
-	# update average score for problem set
-	all_scores = [problem["score"] for grader in report["Problem Sets"][problem_set_name].values() for problem in grader]
-	avg_score = sum(all_scores) / len(all_scores)
-	report["Average Scores Per Problem Set"][problem_set_name] = avg_score
+	compute_report_averages(report)
+	save_report(report, current_report_path)
 
-	# update average score for grading metric
-	all_scores_for_grader = [problem["score"] for pset in report["Problem Sets"].values() for problem in pset.get(grades.grader_identifier, [])]
-	avg_score_for_grader = sum(all_scores_for_grader) / len(all_scores_for_grader) if all_scores_for_grader else 0
-	report["Average Scores Per Criterion"][grades.grader_identifier] = avg_score_for_grader
-    
-	pathlib.Path(os.path.dirname(current_report_path)).mkdir(parents=True, exist_ok=True)
-	with open(current_report_path, 'w') as f:
-		json.dump(report, f, indent=4)	
+def prune_issue_text(report):
+	used = {digest for graders in report["Problem Sets"].values() for grader_grades in graders.values()
+		for grade in grader_grades for issue in grade.get("issues") or [] if isinstance(issue, dict) for digest in issue.get("refs", {}).values()}
+	texts = report.get("Issue Text", {})
+	for digest in set(texts) - used:
+		del texts[digest]
+	if not texts:
+		report.pop("Issue Text", None)
 
+def merge_reports(reports):
+	"""
+	Combines reports of disjoint parts of a run, such as the shards of a sharded run, into one report
+	with the averages a single run over all the parts would have produced.
+	Problem sets are keyed by their directory name, since each machine may check them out at a different path.
+	"""
+	merged = new_report()
+	for report in reports:
+		for base_path, graders in report.get("Problem Sets", {}).items():
+			merged_graders = merged["Problem Sets"].setdefault(sharding.problem_set_name(base_path), {})
+			for grader_identifier, solution_grades in graders.items():
+				merged_graders.setdefault(grader_identifier, []).extend(solution_grades)
+		# Issue text is keyed by its digest, so the tables of different reports never conflict
+		if report.get("Issue Text"):
+			merged.setdefault("Issue Text", {}).update(report["Issue Text"])
+		for base_path, models in report.get("Generation", {}).items():
+			merged_models = merged.setdefault("Generation", {}).setdefault(sharding.problem_set_name(base_path), {})
+			for model_identifier, solutions in models.items():
+				merged_models.setdefault(model_identifier, {}).update(solutions)
+	return compute_report_averages(merged)
+
+def add_generation_to_report(basePath: str, solutions: List[LLMSolution], current_report_path: str):
+	# Solutions generated before queriers recorded their requests have no metrics to report
+	entries = {}
+	for solution in solutions:
+		metrics = (solution.feedback or {}).get('generation')
+		if metrics:
+			entries.setdefault(solution.model_identifier, {})[f"{solution.problem_identifier}/{solution.prompt_identifier}"] = metrics
+	if not entries:
+		return
+	report = get_report(current_report_path) if os.path.exists(current_report_path) else new_report()
+	problem_set = report.setdefault("Generation", {}).setdefault(basePath, {})
+	if all(problem_set.get(model_identifier, {}).get(key) == metrics for model_identifier, model_entries in entries.items() for key, metrics in model_entries.items()):
+		return
+	for model_identifier, model_entries in entries.items():
+		problem_set.setdefault(model_identifier, {}).update(model_entries)
+	compute_report_averages(report)
+	save_report(report, current_report_path)
+
+def add_grades_to_report(basePath: str, grades: GradingOutput, current_report_path: str):
+	# Grades carried over from an earlier run already have their grade files; only the report needs them
+	if grades.solution_grades:
+		update_report_grades(basePath, grades, grades.solution_grades, current_report_path)
 
-	
 def save_grades(basePath: str, grades: GradingOutput, current_report_path: str):
 	# print(grades.solution_grades)
 	for solutionGrade in grades.solution_grades:
@@ -86,11 +249,9 @@ def save_grades(basePath: str, grades: GradingOutput, current_report_path: str):
 		path = os.path.join(directoryPath, solutionGrade.prompt_identifier + ".json")
 
 		# print(path)
-		with open(path, 'w') as f:
-			jsonString = json.dumps(solutionGrade.to_json(), indent=4)
-			f.write(jsonString)
-		
-		update_report(basePath, grades, solutionGrade, current_report_path)
+		write_json_atomically(path, solutionGrade.to_json())
+	if grades.solution_grades:
+		update_report_grades(basePath, grades, grades.solution_grades, current_report_path)
 		
 			
 def get_grades(basePath: str, model_identifier: str, grader_identifier: str):
@@ -99,6 +260,8 @@ def get_grades(basePath: str, model_identifier: str, grader_identifier: str):
 	
 	for problemName in [file for file in sorted(os.listdir(gradesDirectory)) if not file.startswith('.')]:
 		problemDirectory = os.path.join(gradesDirectory, problemName)
+		if not os.path.isdir(problemDirectory):
+			continue
 	
 		for grade_file in [file for file in sorted(os.listdir(problemDirectory)) if not file.startswith('.')]:
 			gradePath = os.path.join(problemDirectory, grade_file)
@@ -106,4 +269,67 @@ def get_grades(basePath: str, model_identifier: str, grader_identifier: str):
 			with open(gradePath) as f:
 				gradeJSON = json.loads(f.read())
 			grades.append(SolutionGrade.from_json(gradeJSON))
-	return GradingOutput(grades, grader_identifier)		
+	return GradingOutput(grades, grader_identifier)
+
+def get_grade(basePath: str, model_identifier: str, grader_identifier: str, problem_identifier: str, prompt_identifier: str):
+	gradePath = os.path.join(basePath, "grades", model_identifier, grader_identifier, problem_identifier, prompt_identifier + ".json")
+	if not os.path.exists(gradePath):
+		return None
+	with open(gradePath) as f:
+		return SolutionGrade.from_json(json.loads(f.read()))
+
+def get_grading_manifest_path(basePath: str, model_identifier: str, grader_identifier: str):
+	return os.path.join(basePath, "grades", model_identifier, grader_identifier, "manifest.json")
+
+def get_grading_manifest(basePath: str, model_identifier: str, grader_identifier: str):
+	path = get_grading_manifest_path(basePath, model_identifier, grader_identifier)
+	if not os.path.exists(path):
+		return GradingManifest()
+	with open(path) as f:
+		return GradingManifest.from_json(json.loads(f.read()))
+
+def save_grading_manifest(basePath: str, model_identifier: str, grader_identifier: str, manifest: GradingManifest):
+	write_json_atomically(get_grading_manifest_path(basePath, model_identifier, grader_identifier), manifest.to_json())
+
+def get_case_history(basePath: str):
+	history = CaseHistory()
+	historyDirectory = os.path.join(basePath, "history")
+	if os.path.exists(historyDirectory):
+		for history_file in [file for file in sorted(os.listdir(historyDirectory)) if file.endswith('.json')]:
+			with open(os.path.join(historyDirectory, history_file)) as f:
+				history.problems[history_file[:-len('.json')]] = ProblemCaseHistory.from_json(json.loads(f.read()))
+	return history
+
+def save_case_history(basePath: str, history: CaseHistory):
+	historyDirectory = os.path.join(basePath, "history")
+	for problem_identifier, problem_history in history.problems.items():
+		# Problems that no solution was graded against have nothing worth keeping
+		if not problem_history.cases and not problem_history.outcomes:
+			continue
+		write_json_atomically(os.path.join(historyDirectory, problem_identifier + ".json"), problem_history.to_json(), indent=None)
+
+def get_work_timings_path(basePath: str):
+	return os.path.join(basePath, "timings.json")
+
+def get_work_timings(basePath: str):
+	path = get_work_timings_path(basePath)
+	if not os.path.exists(path):
+		return WorkTimings()
+	with open(path) as f:
+		return WorkTimings.from_json(json.loads(f.read()))
+
+def save_work_timings(basePath: str, timings: WorkTimings):
+	write_json_atomically(get_work_timings_path(basePath), timings.to_json())
+
+def get_run_manifest_path(reportPath: str, run_id: str):
+	return os.path.join(reportPath, "runs", run_id + ".json")
+
+def get_run_manifest(reportPath: str, run_id: str):
+	path = get_run_manifest_path(reportPath, run_id)
+	if not os.path.exists(path):
+		return None
+	with open(path) as f:
+		return RunManifest.from_json(json.loads(f.read()))
+
+def save_run_manifest(reportPath: str, manifest: RunManifest):
+	write_json_atomically(get_run_manifest_path(reportPath, manifest.run_id), manifest.to_json())
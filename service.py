@@ -0,0 +1,213 @@
+from base_types import *
+import http.server
+import os
+import socket
+import socketserver
+import threading
+import time
+import urllib.parse
+import grader
+import remote_execution
+import serialization
+
+# Maximum number of optimal-solution measurements kept between submissions
+REFERENCE_CACHE_SIZE = 16384
+
+class GradingService:
+	"""
+	Keeps problem sets and graders loaded between grading requests.
+
+	Problem definitions and their test cases are parsed once, and graders are resolved once per name,
+	so their caches of duplicate solutions stay warm across submissions. Optimal solutions are measured
+	once per test case and iteration count and the measurements are shared by all graders. Grading is
+	serialized, since graders measure one execution at a time.
+	"""
+	def __init__(self, base_paths: List[str], grader_options: Optional[Dict[str, Any]] = None):
+		self.base_paths = list(base_paths)
+		self.reference_cache = grader.BoundedCache(REFERENCE_CACHE_SIZE)
+		self.grader_options = {**(grader_options or {}), 'reference_cache': self.reference_cache}
+		self.problem_sets = {}
+		self.graders = {}
+		self.lock = threading.Lock()
+		self.reload()
+
+	def reload(self):
+		"""
+		Re-reads every problem set and drops the graders' cached results.
+		"""
+		problem_sets = {base_path: {p.identifier: p for p in serialization.get_problems(base_path)} for base_path in self.base_paths}
+		with self.lock:
+			self.problem_sets = problem_sets
+			self.graders = {}
+			self.reference_cache.clear()
+
+	def problem_set_for(self, name: Optional[str]) -> Optional[str]:
+		# Problem sets can be named by their path or by their directory name
+		if name is None and len(self.problem_sets) == 1:
+			return next(iter(self.problem_sets))
+		for base_path in self.problem_sets:
+			if name in (base_path, os.path.basename(os.path.normpath(base_path))):
+				return base_path
+		return None
+
+	def get_grader(self, name: str) -> grader.Grader:
+		if name not in self.graders:
+			self.graders[name] = grader.Grader.resolve_graders([name], self.grader_options)[0]
+		return self.graders[name]
+
+	def describe(self) -> Dict[str, Any]:
+		return {base_path: sorted(problems) for base_path, problems in self.problem_sets.items()}
+
+	@staticmethod
+	def submission_error(submission: Any) -> Optional[str]:
+		"""
+		Describes what is wrong with a submission's structure, or returns None if it can be graded.
+		"""
+		if not isinstance(submission, dict):
+			return "A submission must be a JSON object."
+		if not isinstance(submission.get('problem_set', ''), str):
+			return "'problem_set' must be a string."
+		graders = submission.get('graders', [])
+		if not isinstance(graders, list) or not all(isinstance(name, str) for name in graders):
+			return "'graders' must be a list of grader names."
+		solutions = submission.get('solutions')
+		if not isinstance(solutions, list):
+			return "'solutions' must be a list of solutions."
+		for index, solution in enumerate(solutions):
+			if not isinstance(solution, dict):
+				return f"Solution {index} must be a JSON object."
+			for field in ('problem_identifier', 'solution_code'):
+				if not isinstance(solution.get(field), str):
+					return f"Solution {index} needs a string '{field}'."
+			for field in ('model_identifier', 'prompt_identifier'):
+				if not isinstance(solution.get(field, ''), str):
+					return f"Solution {index}: '{field}' must be a string."
+		return None
+
+	def grade(self, submission: Dict[str, Any]):
+		"""
+		Grades the solutions of a submission and yields one result per solution and grader as soon as it is known.
+
+		A submission names a problem set (optional if only one is loaded), the graders to use and the solutions,
+		each in the LLM solution JSON format; a missing model or prompt identifier defaults to 'submission'.
+		Check it with `submission_error` first.
+		"""
+		base_path = self.problem_set_for(submission.get('problem_set'))
+		if base_path is None:
+			yield {'error': f"Unknown problem set {submission.get('problem_set')}."}
+			return
+		problems = self.problem_sets[base_path]
+		grader_names = submission.get('graders') or ['correctness']
+
+		for solution_json in submission.get('solutions', []):
+			solution = LLMSolution.from_json({'model_identifier': 'submission', 'prompt_identifier': 'submission', **solution_json})
+			problem = problems.get(solution.problem_identifier)
+			if problem is None:
+				yield {'problem_identifier': solution.problem_identifier, 'error': f"Unknown problem {solution.problem_identifier} in {base_path}."}
+				continue
+			for grader_name in grader_names:
+				start_time = time.perf_counter()
+				try:
+					with self.lock:
+						solution_grader = self.get_grader(grader_name)
+						can_grade = solution_grader.can_grade([problem])
+						grades = solution_grader.grade([problem], [solution]).solution_grades if can_grade else []
+				except Exception as e:
+					yield {'grader': grader_name, 'problem_identifier': problem.identifier, 'error': str(e)}
+					continue
+				if not can_grade:
+					yield {'grader': grader_name, 'problem_identifier': problem.identifier, 'error': f"Grader {grader_name} can't grade {problem.identifier}."}
+				for solution_grade in grades:
+					yield {'grader': grader_name, 'grade': solution_grade.to_json(), 'time': time.perf_counter() - start_time}
+
+class GradingRequestHandler(http.server.BaseHTTPRequestHandler):
+	"""
+	GET /health and /problems describe the service; POST /grade grades a submission and streams the
+	results as newline-delimited JSON, one line per solution and grader; POST /reload re-reads the problem sets.
+	"""
+	protocol_version = 'HTTP/1.1'
+	service: GradingService = None
+
+	def address_string(self):
+		# Unix sockets have no client address
+		return self.client_address[0] if self.client_address else 'local'
+
+	def send_json(self, status: int, data: Any):
+		body = json.dumps(data).encode('utf-8')
+		self.send_response(status)
+		self.send_header('Content-Type', 'application/json')
+		self.send_header('Content-Length', str(len(body)))
+		self.end_headers()
+		self.wfile.write(body)
+
+	def read_json(self) -> Any:
+		length = int(self.headers.get('Content-Length') or 0)
+		return json.loads(self.rfile.read(length).decode('utf-8')) if length else {}
+
+	def send_chunk(self, data: bytes):
+		self.wfile.write(f"{len(data):x}\r\n".encode('ascii') + data + b"\r\n")
+		self.wfile.flush()
+
+	def do_GET(self):
+		path = urllib.parse.urlparse(self.path).path
+		if path == '/health':
+			self.send_json(200, {'status': 'ok'})
+		elif path == '/problems':
+			self.send_json(200, self.service.describe())
+		else:
+			self.send_json(404, {'error': f"Unknown path {path}."})
+
+	def do_POST(self):
+		path = urllib.parse.urlparse(self.path).path
+		try:
+			request = self.read_json()
+		except ValueError as e:
+			self.send_json(400, {'error': f"Invalid JSON: {e}"})
+			return
+		if path == '/reload':
+			self.service.reload()
+			self.send_json(200, self.service.describe())
+		elif path == '/grade':
+			# Everything that can fail before grading starts is checked before the streamed response begins
+			error = self.service.submission_error(request)
+			if error is not None:
+				self.send_json(400, {'error': error})
+				return
+			self.send_response(200)
+			self.send_header('Content-Type', 'application/x-ndjson')
+			self.send_header('Transfer-Encoding', 'chunked')
+			self.end_headers()
+			for result in self.service.grade(request):
+				self.send_chunk(json.dumps(result).encode('utf-8') + b"\n")
+			self.send_chunk(b"")
+		else:
+			self.send_json(404, {'error': f"Unknown path {path}."})
+
+class ThreadingUnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+	daemon_threads = True
+
+	def server_bind(self):
+		socketserver.UnixStreamServer.server_bind(self)
+		self.server_name, self.server_port = 'localhost', 0
+
+def serve(service: GradingService, address: str):
+	"""
+	Serves the grading API on `address`, unix:PATH or HOST:PORT, until interrupted.
+	"""
+	family, socket_address = remote_execution.parse_address(address)
+	handler = type('BoundGradingRequestHandler', (GradingRequestHandler,), {'service': service})
+	if family == socket.AF_UNIX:
+		if os.path.exists(socket_address):
+			os.unlink(socket_address)
+		server = ThreadingUnixHTTPServer(socket_address, handler)
+	else:
+		server = http.server.ThreadingHTTPServer(socket_address, handler)
+	print(f"Grading service listening on {address}")
+	try:
+		server.serve_forever()
+	except KeyboardInterrupt:
+		pass
+	finally:
+		server.server_close()
+		if family == socket.AF_UNIX and os.path.exists(socket_address):
+			os.unlink(socket_address)
@@ -0,0 +1,50 @@
+from base_types import *
+import hashlib
+import os
+
+class Shard:
+	"""
+	One of `count` disjoint, deterministic partitions of a benchmark run's work items.
+	A work item is one (problem set, problem, model, prompt) combination; its shard depends only on
+	those identifiers, so every machine given the same `count` agrees on the partition.
+	"""
+	def __init__(self, index: int, count: int):
+		if count < 1 or not 1 <= index <= count:
+			raise ValueError(f"Invalid shard {index}/{count}: expected 1 <= i <= N.")
+		self.index = index
+		self.count = count
+
+	@classmethod
+	def parse(cls, text: str) -> 'Shard':
+		"""
+		Parses a shard given as 'i/N', with i counted from 1.
+		"""
+		try:
+			index, count = (int(part) for part in text.split('/'))
+		except ValueError:
+			raise ValueError(f"Invalid shard '{text}': expected the form i/N, e.g. 1/4.")
+		return cls(index, count)
+
+	def contains(self, base_path: str, problem_identifier: str, model_identifier: str, prompt_identifier: str) -> bool:
+		return work_item_shard(base_path, problem_identifier, model_identifier, prompt_identifier, self.count) == self.index
+
+	def suffix(self) -> str:
+		return f"shard-{self.index}-of-{self.count}"
+
+	def __eq__(self, other):
+		return isinstance(other, Shard) and (self.index, self.count) == (other.index, other.count)
+
+	def __hash__(self):
+		return hash((self.index, self.count))
+
+	def __repr__(self):
+		return f"<Shard {self.index}/{self.count}>"
+
+def problem_set_name(base_path: str) -> str:
+	# Machines may check the problem sets out at different locations, so only the directory name counts
+	return os.path.basename(os.path.normpath(base_path))
+
+def work_item_shard(base_path: str, problem_identifier: str, model_identifier: str, prompt_identifier: str, count: int) -> int:
+	key = '\0'.join([problem_set_name(base_path), problem_identifier, model_identifier, prompt_identifier])
+	digest = hashlib.sha256(key.encode('utf-8')).digest()
+	return int.from_bytes(digest[:8], 'big') % count + 1
@@ -0,0 +1,160 @@
+"""
+Run telemetry: spans for the phases of a benchmark run, counters and latency histograms.
+
+Telemetry is off until `enable()` is called, and every recording function returns immediately while it is
+off. Once enabled, spans can be exported as Chrome trace JSON (open it in chrome://tracing or Perfetto) and
+counters and histograms in the Prometheus text format.
+
+	with telemetry.span('grade', problem='problem_1', model='gpt-4', grader='correctness'):
+		...
+	telemetry.count('executions')
+	telemetry.observe('execute_function_seconds', elapsed)
+"""
+import contextlib
+import json
+import os
+import threading
+import time
+from typing import *
+
+# Upper bounds of the latency histogram buckets, in seconds
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Prefix of every exported metric name
+METRIC_PREFIX = 'benchmark_'
+
+class Histogram:
+	def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+		self.buckets = buckets
+		self.counts = [0] * (len(buckets) + 1)
+		self.total = 0.0
+		self.count = 0
+
+	def observe(self, value: float):
+		index = 0
+		while index < len(self.buckets) and value > self.buckets[index]:
+			index += 1
+		self.counts[index] += 1
+		self.total += value
+		self.count += 1
+
+class Recorder:
+	"""
+	Collects the spans, counters and histograms of one run. Safe to use from several threads.
+	"""
+	def __init__(self):
+		self.lock = threading.Lock()
+		self.origin = time.perf_counter()
+		self.spans = []
+		# Counters and histograms are keyed by name and a sorted tuple of label pairs
+		self.counters = {}
+		self.histograms = {}
+
+	def add_span(self, name: str, start: float, end: float, tags: Dict[str, Any]):
+		with self.lock:
+			self.spans.append((name, start - self.origin, end - start, threading.get_ident(), tags))
+
+	def count(self, name: str, value: float, labels: Dict[str, Any]):
+		key = (name, tuple(sorted(labels.items())))
+		with self.lock:
+			self.counters[key] = self.counters.get(key, 0) + value
+
+	def observe(self, name: str, value: float, labels: Dict[str, Any]):
+		key = (name, tuple(sorted(labels.items())))
+		with self.lock:
+			if key not in self.histograms:
+				self.histograms[key] = Histogram()
+			self.histograms[key].observe(value)
+
+	def chrome_trace(self) -> Dict[str, Any]:
+		pid = os.getpid()
+		with self.lock:
+			events = [{'name': name, 'cat': name, 'ph': 'X', 'ts': start * 1e6, 'dur': duration * 1e6, 'pid': pid, 'tid': thread,
+					   'args': {key: str(value) for key, value in tags.items()}} for name, start, duration, thread, tags in self.spans]
+			end = time.perf_counter() - self.origin
+			events += [{'name': name, 'ph': 'C', 'ts': end * 1e6, 'pid': pid, 'tid': 0, 'args': {format_labels(labels) or 'value': value}}
+					   for (name, labels), value in sorted(self.counters.items())]
+		return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+	def prometheus(self) -> str:
+		lines = []
+		with self.lock:
+			counter_names = sorted({name for name, _ in self.counters})
+			for name in counter_names:
+				metric = METRIC_PREFIX + name + '_total'
+				lines.append(f"# TYPE {metric} counter")
+				lines += [f"{metric}{{{format_labels(labels)}}} {value}" if labels else f"{metric} {value}"
+						  for (counter_name, labels), value in sorted(self.counters.items()) if counter_name == name]
+			histogram_names = sorted({name for name, _ in self.histograms})
+			for name in histogram_names:
+				metric = METRIC_PREFIX + name
+				lines.append(f"# TYPE {metric} histogram")
+				for (histogram_name, labels), histogram in sorted(self.histograms.items(), key=lambda item: item[0]):
+					if histogram_name != name:
+						continue
+					cumulative = 0
+					for bound, count in zip(list(histogram.buckets) + ['+Inf'], histogram.counts):
+						cumulative += count
+						lines.append(f"{metric}_bucket{{{format_labels(labels + (('le', bound),))}}} {cumulative}")
+					suffix = f"{{{format_labels(labels)}}}" if labels else ""
+					lines.append(f"{metric}_sum{suffix} {histogram.total}")
+					lines.append(f"{metric}_count{suffix} {histogram.count}")
+		return "\n".join(lines) + "\n"
+
+def format_labels(labels: Tuple[Tuple[str, Any], ...]) -> str:
+	def escape(value):
+		return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+	return ','.join(f'{key}="{escape(value)}"' for key, value in labels)
+
+# The recorder of the current run, or None while telemetry is off
+_recorder = None
+
+def enable() -> Recorder:
+	global _recorder
+	_recorder = Recorder()
+	return _recorder
+
+def disable():
+	global _recorder
+	_recorder = None
+
+def enabled() -> bool:
+	return _recorder is not None
+
+@contextlib.contextmanager
+def span(name: str, **tags):
+	"""
+	Records the time spent in the block as a span, tagged e.g. with the problem, model and grader it worked on.
+	"""
+	recorder = _recorder
+	if recorder is None:
+		yield
+		return
+	start = time.perf_counter()
+	try:
+		yield
+	finally:
+		recorder.add_span(name, start, time.perf_counter(), tags)
+
+def count(name: str, value: float = 1, **labels):
+	if _recorder is not None:
+		_recorder.count(name, value, labels)
+
+def observe(name: str, value: float, **labels):
+	if _recorder is not None:
+		_recorder.observe(name, value, labels)
+
+def write(directory: str, run_id: str) -> List[str]:
+	"""
+	Writes the Chrome trace and the Prometheus metrics of the run to `directory`, returning their paths.
+	"""
+	if _recorder is None:
+		return []
+	os.makedirs(directory, exist_ok=True)
+	trace_path = os.path.join(directory, f"trace-{run_id}.json")
+	metrics_path = os.path.join(directory, f"metrics-{run_id}.prom")
+	with open(trace_path, 'w') as f:
+		json.dump(_recorder.chrome_trace(), f)
+	with open(metrics_path, 'w') as f:
+		f.write(_recorder.prometheus())
+	return [trace_path, metrics_path]
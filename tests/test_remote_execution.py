@@ -0,0 +1,147 @@
+import os
+import sys
+import threading
+import time
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from base_types import LLMSolution, ProblemDefinition
+import execution
+import grader
+import remote_execution
+
+ADD_CODE = "def add(a, b):\n    return a + b\n"
+SLEEP_CODE = "import time\ndef add(a, b):\n    time.sleep(0.3)\n    return a + b\n"
+
+def add_job(a, b, code=ADD_CODE, timeout=5.0):
+	return {'function_code': code, 'parameters': [a, b], 'iterations': 1, 'collect_cpu_time': False,
+			'collect_memory_usage': False, 'function_name': 'add', 'timeout': timeout}
+
+class RecordingWorkerServer(remote_execution.WorkerServer):
+	"""
+	A worker daemon that records how many jobs it was sent, and optionally never answers them.
+	"""
+	def __init__(self, address, concurrency=1, hang=False):
+		super().__init__(address, concurrency)
+		self.hang = hang
+		self.jobs = 0
+
+	def execute(self, job):
+		with self.lock:
+			self.jobs += 1
+		if self.hang:
+			time.sleep(60)
+		return super().execute(job)
+
+def start_worker(path, **kwargs):
+	server = RecordingWorkerServer('unix:' + str(path), **kwargs)
+	threading.Thread(target=server.serve_forever, daemon=True).start()
+	deadline = time.monotonic() + 5
+	while not os.path.exists(path) and time.monotonic() < deadline:
+		time.sleep(0.01)
+	return server
+
+@pytest.fixture
+def workers(tmp_path):
+	execution.configure_workers([])
+	servers = []
+
+	def start(count, **kwargs):
+		new_servers = [start_worker(tmp_path / f"worker-{len(servers) + i}.sock", **kwargs) for i in range(count)]
+		servers.extend(new_servers)
+		return new_servers
+
+	yield start
+	execution.configure_remote_executor(None)
+	for server in servers:
+		server.shutdown()
+
+def test_pool_spreads_concurrent_jobs_over_workers(workers):
+	servers = workers(3)
+	pool = remote_execution.WorkerPool([server.address for server in servers])
+	assert len(pool.check_health()) == 3
+	assert pool.concurrency == 3
+
+	threads = []
+	results = {}
+	for i in range(6):
+		thread = threading.Thread(target=lambda i=i: results.__setitem__(i, pool.execute(add_job(i, 1, SLEEP_CODE))))
+		thread.start()
+		threads.append(thread)
+	for thread in threads:
+		thread.join()
+
+	assert {i: results[i].result for i in results} == {i: i + 1 for i in range(6)}
+	assert all(server.jobs > 0 for server in servers)
+
+def test_pool_redispatches_from_unreachable_worker(workers, tmp_path):
+	live, = workers(1)
+	pool = remote_execution.WorkerPool(['unix:' + str(tmp_path / 'missing.sock'), live.address])
+	results = pool.execute(add_job(2, 3))
+	assert results.error is None
+	assert results.result == 5
+	assert not pool.endpoints[0].healthy
+
+def test_pool_redispatches_from_hung_worker(workers):
+	hung, = workers(1, hang=True)
+	live, = workers(1)
+	pool = remote_execution.WorkerPool([hung.address, live.address], timeout_margin=0.5)
+	start_time = time.monotonic()
+	results = pool.execute(add_job(2, 3, timeout=0.5))
+	assert results.result == 5
+	assert time.monotonic() - start_time < 10
+	assert hung.jobs == 1 and live.jobs == 1
+	assert not pool.endpoints[0].healthy
+
+def test_grader_dispatches_test_cases_concurrently(workers):
+	servers = workers(3)
+	pool = remote_execution.WorkerPool([server.address for server in servers])
+	pool.check_health()
+	execution.configure_remote_executor(pool)
+
+	problem = ProblemDefinition.from_json({
+		'identifier': 'add',
+		'description': 'Write a function to add two numbers.',
+		'function_prototype': {
+			'function_name': 'add',
+			'parameters': [{'name': 'a', 'type': 'int'}, {'name': 'b', 'type': 'int'}],
+			'return_values': [{'type': 'int'}]
+		},
+		'correctness_test_suite': [{'input': {'a': i, 'b': 1}, 'expected_output': [i + 1]} for i in range(6)],
+		'prompts': [{'prompt_id': 'p', 'prompt': 'Add two numbers.'}]
+	})
+	solution = LLMSolution('add', 'm', 'p', SLEEP_CODE)
+
+	start_time = time.monotonic()
+	grades = grader.CorrectnessGrader().grade([problem], [solution]).solution_grades
+	assert len(grades) == 1
+	assert grades[0].score == 1
+	assert sum(server.jobs for server in servers) == 6 and all(server.jobs > 0 for server in servers)
+	# Six test cases sleeping 0.3 seconds each on three workers finish well before they would one after another
+	assert time.monotonic() - start_time < 6 * 0.3
+
+requires_forkserver = pytest.mark.skipif('forkserver' not in execution.multiprocessing.get_all_start_methods(), reason="no fork server on this platform")
+
+@requires_forkserver
+def test_execution_runs_in_worker_forked_from_fork_server():
+	execution.configure_workers([])
+	if execution.worker_popen_supported():
+		assert isinstance(execution.get_worker_context(), execution.WorkerContext)
+	results = execution.execute_locally(ADD_CODE, [2, 3], 1, True, False, 'add')
+	assert results.error is None
+	assert results.result == 5
+
+@requires_forkserver
+def test_execution_falls_back_to_standard_fork_server(monkeypatch):
+	monkeypatch.setattr(execution, 'worker_popen_supported', lambda: False)
+	execution.configure_workers([])
+	try:
+		assert execution.get_worker_context().get_start_method() == 'forkserver'
+		assert not isinstance(execution.get_worker_context(), getattr(execution, 'WorkerContext', ()))
+		results = execution.execute_locally(ADD_CODE, [2, 3], 1, False, False, 'add')
+		assert results.error is None
+		assert results.result == 5
+	finally:
+		monkeypatch.undo()
+		execution.configure_workers([])
@@ -1,5 +1,8 @@
 from base_types import *
+import comparators
 import execution
+import os
+import prescreen
 
 def validate_parameter(parameter: dict) -> tuple:
 	"""
@@ -161,12 +164,13 @@ def validate_prompt(prompt: dict, function_prototype=None) -> tuple:
 
 	return True, ""
 
-def validate_problem_json(problem_json: dict) -> (bool, str):
+def validate_problem_json(problem_json: dict, data_directory: Optional[str] = None) -> (bool, str):
 	"""
 	Validates the top-level problem JSON structure.
 	
 	Args:
 	problem_json (dict): A dictionary representing the top-level problem JSON object.
+	data_directory (str): The problem set's directory of .npy sidecar files that expected outputs may refer to.
 	
 	Returns:
 	tuple: A tuple containing a boolean and a string. 
@@ -200,15 +204,33 @@ def validate_problem_json(problem_json: dict) -> (bool, str):
 		if not valid:
 			return False, f"Invalid prompt at index {index}: {error_message}"
 	
-	if "correctness_test_suite" in problem_json:
+	if "correctness_test_suite_file" in problem_json:
+		if not isinstance(problem_json["correctness_test_suite_file"], str):
+			return False, "Field 'correctness_test_suite_file' should be a string"
+		if problem_json.get("correctness_test_suite"):
+			return False, "Fields 'correctness_test_suite' and 'correctness_test_suite_file' can't both be given"
+		if data_directory is not None and not os.path.isfile(os.path.join(data_directory, problem_json["correctness_test_suite_file"])):
+			return False, f"Test suite file {problem_json['correctness_test_suite_file']} does not exist in {data_directory}"
+
+	# A test suite file can only be read with the data directory; it is streamed once per check below
+	suite_readable = "correctness_test_suite_file" not in problem_json or data_directory is not None
+	def test_suite():
+		if "correctness_test_suite_file" in problem_json and data_directory is not None:
+			return read_test_suite_file(os.path.join(data_directory, problem_json["correctness_test_suite_file"]))
+		return problem_json.get("correctness_test_suite", [])
+
+	if "correctness_test_suite" in problem_json or "correctness_test_suite_file" in problem_json:
 		if not "function_prototype" in problem_json:
 			return False, f"Function prototype must be present if a correctness test suite is provided."
 		function_prototype = FunctionPrototype(problem_json["function_prototype"])	
 
-		for index, test_case in enumerate(problem_json["correctness_test_suite"]):
-			valid, error_message = validate_test_case(test_case, function_prototype)
-			if not valid:
-				return False, f"Invalid test case in 'correctness_test_suite' at index {index}: {error_message}"
+		try:
+			for index, test_case in enumerate(test_suite()):
+				valid, error_message = validate_test_case(test_case, function_prototype)
+				if not valid:
+					return False, f"Invalid test case in 'correctness_test_suite' at index {index}: {error_message}"
+		except ValueError as e:
+			return False, f"Invalid line in test suite file {problem_json['correctness_test_suite_file']}: {e}"
 	
 	if "function_prototype" in problem_json:
 		valid, error_message = validate_function_prototype(problem_json["function_prototype"])
@@ -221,18 +243,46 @@ def validate_problem_json(problem_json: dict) -> (bool, str):
 	
 	if "tags" in problem_json and not all(isinstance(tag, str) for tag in problem_json["tags"]):
 		return False, "All elements in field 'tags' should be strings"
+
+	if "test_tiers" in problem_json:
+		if not isinstance(problem_json["test_tiers"], dict):
+			return False, "Field 'test_tiers' should be an object"
+		test_count = sum(1 for _ in test_suite())
+		for tier, definition in problem_json["test_tiers"].items():
+			if not isinstance(definition, dict) or not isinstance(definition.get("cases"), list):
+				return False, f"Tier '{tier}' in 'test_tiers' should be an object with a 'cases' array"
+			if suite_readable and not all(isinstance(index, int) and 0 <= index < test_count for index in definition["cases"]):
+				return False, f"Tier '{tier}' in 'test_tiers' should only contain indices of 'correctness_test_suite'"
+
+	if "comparison" in problem_json:
+		comparison = problem_json["comparison"]
+		if not isinstance(comparison, dict):
+			return False, "Field 'comparison' should be an object"
+		if comparison.get("comparator", "exact") not in comparators.COMPARATORS:
+			return False, f"Unknown comparator '{comparison['comparator']}' in field 'comparison'. Known comparators: {', '.join(comparators.COMPARATORS)}"
+
+	for index, test_case in enumerate(test_suite()):
+		for expected in test_case["expected_output"]:
+			if comparators.is_sidecar(expected) and data_directory is not None and not os.path.isfile(os.path.join(data_directory, expected["npy"])):
+				return False, f"Sidecar file {expected['npy']} of test case {index} in 'correctness_test_suite' does not exist in {data_directory}"
 		
-	if 'optimal_solution' in problem_json and 'correctness_test_suite' in problem_json:
-		# Ensure that the optimal solution passes the correctness test suite
-		for index, test_case in enumerate(problem_json["correctness_test_suite"]):
+	if 'optimal_solution' in problem_json and ('correctness_test_suite' in problem_json or 'correctness_test_suite_file' in problem_json):
+		# Ensure that the optimal solution passes the correctness test suite, calling the function the graders call
+		screening = prescreen.prescreen_code(problem_json["optimal_solution"], (function_prototype.function_name,))
+		if not screening.passed:
+			return False, f"Optimal solution cannot be run: {screening.issue}"
+		for index, test_case in enumerate(test_suite()):
 			test_case_obj = TestCase(test_case)
 			parameters = function_prototype.get_ordered_parameter_values(test_case_obj)
-			expected_result = function_prototype.get_return_values(test_case_obj)
-			execution_results = execution.execute_function(problem_json["optimal_solution"], parameters, iterations=1, collect_cpu_time=False, collect_memory_usage=False)
+			try:
+				expected_result = comparators.resolve_sidecars(function_prototype.get_return_values(test_case_obj), data_directory)
+			except Exception as e:
+				return False, f"Could not load the expected output of test case {test_case_obj}: {e}"
+			execution_results = execution.execute_trusted(problem_json["optimal_solution"], parameters, function_name=screening.function_name)
 			parameters_desc = ', '.join([f'{p} {type(p)}' for p in parameters])
 			if execution_results.error:
 				return False, f"Optimal solution encountered error for test case {test_case_obj}. Parameters: {parameters_desc}; Error: {execution_results.error}"
-			if expected_result != execution_results.result:
+			if not comparators.compare(problem_json.get("comparison"), expected_result, execution_results.result):
 				return False, f"Optimal solution did not pass test case {test_case_obj}. Parameters: {parameters_desc}; Expected result: {expected_result} {type(expected_result)}; Actual result: {execution_results.result} {type(execution_results.result)}"
 	
 	return True, "Validation successful"
@@ -0,0 +1,335 @@
+"""
+Watch mode: follows the solutions trees of problem sets and grades solution files as they are added or modified.
+
+Changes are detected with inotify where the platform provides it, and otherwise by polling an index of
+directory and file modification times, so an idle poll only stats the known directories. Polling notices
+files rewritten in place, rather than replaced, only within FULL_SCAN_INTERVAL. Detection runs
+in a background thread; the grading loop collects changes until they settle and grades only the
+solutions whose content, problem definition or grader changed since they were last graded.
+"""
+from base_types import *
+import ctypes
+import ctypes.util
+import os
+import queue
+import select
+import struct
+import threading
+import time
+from typing import Set, Tuple
+import serialization
+import telemetry
+
+# Seconds between two polls of the modification time index, and the longest a stop request goes unnoticed
+POLL_INTERVAL = 1.0
+
+# Seconds without new changes before a batch of changed solutions is graded
+SETTLE_TIME = 0.5
+
+# Seconds between polls that stat every known file, to notice files rewritten in place
+FULL_SCAN_INTERVAL = 30.0
+
+def solution_identity(base_path: str, path: str) -> Optional[Tuple[str, str, str]]:
+	"""
+	The (model, problem, prompt) identifiers of a solution file at `path`, or None if it isn't one.
+	"""
+	relative_path = os.path.relpath(path, os.path.join(base_path, "solutions"))
+	parts = relative_path.split(os.sep)
+	if len(parts) != 3 or parts[0] == os.pardir or not parts[2].endswith('.json'):
+		return None
+	# Hidden files are leftovers of interrupted atomic writes
+	if any(part.startswith('.') for part in parts):
+		return None
+	return parts[0], parts[1], parts[2][:-len('.json')]
+
+class PollingWatcher:
+	"""
+	Detects new and modified solution files by polling. Directories are only listed again when their
+	modification time changes, which is when entries are added, removed or renamed into them, and only
+	the files of relisted directories are stat'ed. Files rewritten in place leave their directory's
+	modification time alone, so every file is stat'ed in a full scan once per FULL_SCAN_INTERVAL.
+	"""
+	def __init__(self, base_paths: List[str]):
+		self.roots = [os.path.join(base_path, "solutions") for base_path in base_paths]
+		# Modification time, subdirectories and files of every known directory, the files with their signatures
+		self.directories = {}
+		self.subdirectories = {}
+		self.files = {}
+		self.last_full_scan = time.monotonic()
+		# Files present before watching started aren't changes
+		self.scan()
+
+	def scan(self) -> Set[str]:
+		"""
+		Updates the index and returns the files that are new or modified since the last scan.
+		"""
+		full_scan = time.monotonic() - self.last_full_scan >= FULL_SCAN_INTERVAL
+		if full_scan:
+			self.last_full_scan = time.monotonic()
+		changed = set()
+		relisted = []
+		pending = list(self.roots)
+		while pending:
+			directory = pending.pop()
+			try:
+				mtime = os.stat(directory).st_mtime_ns
+			except OSError:
+				self.forget(directory)
+				continue
+			if self.directories.get(directory) != mtime:
+				self.directories[directory] = mtime
+				try:
+					entries = list(os.scandir(directory))
+				except OSError:
+					continue
+				subdirectories = {entry.path for entry in entries if entry.is_dir()}
+				for removed in self.subdirectories.get(directory, set()) - subdirectories:
+					self.forget(removed)
+				self.subdirectories[directory] = subdirectories
+				known_files = self.files.get(directory, {})
+				self.files[directory] = {entry.path: known_files.get(entry.path) for entry in entries if entry.is_file()}
+				relisted.append(directory)
+			pending += self.subdirectories.get(directory, ())
+
+		for directory in list(self.files) if full_scan else relisted:
+			files = self.files.get(directory, {})
+			for path, signature in list(files.items()):
+				try:
+					stat = os.stat(path)
+				except OSError:
+					del files[path]
+					continue
+				new_signature = (stat.st_mtime_ns, stat.st_size)
+				if new_signature != signature:
+					files[path] = new_signature
+					changed.add(path)
+		return changed
+
+	def forget(self, directory: str):
+		self.directories.pop(directory, None)
+		self.files.pop(directory, None)
+		for subdirectory in self.subdirectories.pop(directory, set()):
+			self.forget(subdirectory)
+
+	def changes(self, timeout: float) -> Set[str]:
+		time.sleep(timeout)
+		return self.scan()
+
+	def close(self):
+		pass
+
+class InotifyWatcher:
+	"""
+	Detects new and modified solution files with Linux inotify, through libc.
+	Watches are added as model and problem directories appear.
+	"""
+	IN_CLOSE_WRITE = 0x00000008
+	IN_MOVED_TO = 0x00000080
+	IN_CREATE = 0x00000100
+	IN_Q_OVERFLOW = 0x00004000
+	IN_ISDIR = 0x40000000
+	EVENT_HEADER = struct.Struct('iIII')
+	WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+
+	_libc = None
+
+	@classmethod
+	def libc(cls):
+		if cls._libc is None:
+			cls._libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+		return cls._libc
+
+	@classmethod
+	def available(cls) -> bool:
+		try:
+			return hasattr(cls.libc(), 'inotify_init1')
+		except OSError:
+			return False
+
+	def __init__(self, base_paths: List[str]):
+		self.base_paths = list(base_paths)
+		self.fd = self.libc().inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+		if self.fd < 0:
+			raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+		self.watches = {}
+		self.pending = set()
+		for base_path in self.base_paths:
+			# Watching the problem set itself notices a solutions directory that doesn't exist yet
+			self.add_watch(base_path, descend=False)
+			self.add_tree(os.path.join(base_path, "solutions"), report_files=False)
+
+	def add_watch(self, directory: str, descend: bool = True) -> bool:
+		watch = self.libc().inotify_add_watch(self.fd, os.fsencode(directory), self.WATCH_MASK)
+		if watch < 0:
+			return False
+		self.watches[watch] = (directory, descend)
+		return True
+
+	def add_tree(self, directory: str, report_files: bool = True):
+		"""
+		Watches a directory and every directory below it. Files already in directories that appear while
+		watching are reported too, since they may have been written before the watch was in place.
+		"""
+		if not self.add_watch(directory):
+			return
+		try:
+			entries = list(os.scandir(directory))
+		except OSError:
+			return
+		for entry in entries:
+			if entry.is_dir():
+				self.add_tree(entry.path, report_files)
+			elif report_files and entry.is_file():
+				self.pending.add(entry.path)
+
+	def read_events(self):
+		try:
+			data = os.read(self.fd, 64 * 1024)
+		except BlockingIOError:
+			return
+		offset = 0
+		while offset < len(data):
+			watch, mask, _, length = self.EVENT_HEADER.unpack_from(data, offset)
+			offset += self.EVENT_HEADER.size
+			name = os.fsdecode(data[offset:offset + length].rstrip(b'\0'))
+			offset += length
+			if mask & self.IN_Q_OVERFLOW:
+				# Events were lost; every solution counts as changed and the grading manifests skip unchanged ones
+				for base_path in self.base_paths:
+					self.add_tree(os.path.join(base_path, "solutions"))
+				continue
+			if watch not in self.watches:
+				continue
+			directory, descend = self.watches[watch]
+			path = os.path.join(directory, name)
+			if mask & self.IN_ISDIR:
+				if descend or name == "solutions":
+					self.add_tree(path)
+			elif descend and mask & (self.IN_CLOSE_WRITE | self.IN_MOVED_TO):
+				self.pending.add(path)
+
+	def changes(self, timeout: float) -> Set[str]:
+		if not self.pending:
+			readable, _, _ = select.select([self.fd], [], [], timeout)
+			if readable:
+				self.read_events()
+		changed, self.pending = self.pending, set()
+		return changed
+
+	def close(self):
+		os.close(self.fd)
+
+def create_watcher(base_paths: List[str]):
+	if InotifyWatcher.available():
+		try:
+			return InotifyWatcher(base_paths)
+		except OSError:
+			pass
+	return PollingWatcher(base_paths)
+
+class WatchGrader:
+	"""
+	Grades changed solution files of the watched models and adds the grades to each model's current report.
+	"""
+	def __init__(self, problem_sets: Dict[str, List[ProblemDefinition]], model_identifiers: List[str], graders: list,
+			report_paths: Dict[str, str], shard=None, selection=None):
+		self.problem_sets = problem_sets
+		self.model_identifiers = set(model_identifiers)
+		self.graders = graders
+		self.report_paths = report_paths
+		self.shard = shard
+		self.selection = selection
+
+	def load_solutions(self, paths: Set[str]) -> Dict[Tuple[str, str], List[LLMSolution]]:
+		solutions = {}
+		for path in sorted(paths):
+			for base_path in self.problem_sets:
+				identity = solution_identity(base_path, path)
+				if identity is None or identity[0] not in self.model_identifiers:
+					continue
+				if self.shard is not None and not self.shard.contains(base_path, identity[1], identity[0], identity[2]):
+					continue
+				if self.selection is not None and not self.selection.selects_prompt(identity[2]):
+					continue
+				try:
+					with open(path) as f:
+						solution = LLMSolution.from_json(json.load(f))
+				except (OSError, ValueError) as e:
+					# Most likely still being written; the write's completion is reported as another change
+					print(f'Skipping {path} for now: {e}')
+					continue
+				solutions.setdefault((base_path, identity[0]), []).append(solution)
+		return solutions
+
+	def grade(self, paths: Set[str]) -> List[GradingOutput]:
+		grading_outputs = []
+		for (base_path, model_identifier), solutions in self.load_solutions(paths).items():
+			problem_definitions = self.problem_sets[base_path]
+			problems_by_identifier = {p.identifier: p for p in problem_definitions}
+			solutions = [s for s in solutions if s.problem_identifier in problems_by_identifier]
+			history = serialization.get_case_history(base_path)
+			for solution_grader in self.graders:
+				if not solution_grader.can_grade(problem_definitions):
+					continue
+				version = solution_grader.version_fingerprint()
+				manifest = serialization.get_grading_manifest(base_path, model_identifier, solution_grader.identifier)
+				# Files that were touched or rewritten with the same content keep their grades
+				stale_solutions = [s for s in solutions if not manifest.is_current(problems_by_identifier[s.problem_identifier], s, version, solution_grader.test_tier())]
+				if not stale_solutions:
+					continue
+				print(f'Grading {len(stale_solutions)} changed solution(s) for {base_path} from model {model_identifier} with grader {solution_grader.identifier}')
+				solution_grader.case_history = history
+				with telemetry.span('grade', problem_set=base_path, model=model_identifier, grader=solution_grader.identifier):
+					grades = solution_grader.grade(problem_definitions, stale_solutions)
+				solution_grader.case_history = None
+				with telemetry.span('report', problem_set=base_path, model=model_identifier, grader=solution_grader.identifier):
+					serialization.save_grades(base_path, grades, self.report_paths[model_identifier])
+				graded_keys = {(g.problem_identifier, g.prompt_identifier) for g in grades.solution_grades}
+				for solution in stale_solutions:
+					if (solution.problem_identifier, solution.prompt_identifier) in graded_keys:
+						manifest.record(problems_by_identifier[solution.problem_identifier], solution, version, solution_grader.test_tier())
+				serialization.save_grading_manifest(base_path, model_identifier, solution_grader.identifier, manifest)
+				grading_outputs.append(grades)
+			serialization.save_case_history(base_path, history)
+		return grading_outputs
+
+def watch_and_grade(problem_sets: Dict[str, List[ProblemDefinition]], model_identifiers: List[str], graders: list,
+		report_paths: Dict[str, str], shard=None, selection=None, stop: Optional[threading.Event] = None, settle_time: float = SETTLE_TIME):
+	"""
+	Grades solutions of the given models as they land in the problem sets' solutions trees, until `stop` is set
+	or the process is interrupted.
+	"""
+	stop = stop or threading.Event()
+	watcher = create_watcher(list(problem_sets))
+	changes = queue.Queue()
+
+	def detect():
+		while not stop.is_set():
+			changed = watcher.changes(POLL_INTERVAL)
+			if changed:
+				changes.put(changed)
+
+	detector = threading.Thread(target=detect, daemon=True)
+	detector.start()
+	watch_grader = WatchGrader(problem_sets, model_identifiers, graders, report_paths, shard, selection)
+	print(f"Watching {', '.join(problem_sets)} for new solutions ({type(watcher).__name__}); press Ctrl-C to stop")
+	try:
+		while not stop.is_set():
+			try:
+				batch = changes.get(timeout=settle_time)
+			except queue.Empty:
+				continue
+			# Generators usually write many files in a row; grade them together once they stop arriving
+			while True:
+				try:
+					batch |= changes.get(timeout=settle_time)
+				except queue.Empty:
+					break
+			for output in watch_grader.grade(batch):
+				print(output)
+	except KeyboardInterrupt:
+		pass
+	finally:
+		stop.set()
+		detector.join()
+		watcher.close()